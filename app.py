@@ -18,10 +18,14 @@ from src.interfaz import auth
 import src.persistencia.sql as sql
 from src.persistencia import backup_storage
 
-sql.ensure_schema()  # Parche temporal para columnas propietario_id y atleta_usuario_id
+from src.persistencia import bootstrap
+
+# --- Arranque de la base: restauración/migraciones en segundo plano ---
+if not bootstrap.esperar_en_ui():
+    st.stop()
 
 # --- Backup automático al iniciar la app ---
-backup_storage.backup_diario()
+backup_storage.backup_diario(sql.DB_PATH)
 
 # --- RECUPERACIÓN ADMIN INICIAL ---
 from src.utils.seguridad import hash_password
@@ -57,6 +61,7 @@ if st.sidebar.button("Cerrar sesión"):
     auth.logout()
 
 from src.utils.roles import tabs_visibles_por_rol
+from src.utils import identidad
 load_dotenv()
 
 def get_secret(section, key, default=None):
@@ -78,8 +83,7 @@ usuario_id = st.session_state.get("USUARIO_ID", 0)
 
 # Mostrar usuario activo en la barra lateral
 if rol_actual in ["entrenadora", "atleta"]:
-    usuarios = sql.obtener_usuarios()
-    nombre_usuario = next((u.nombre for u in usuarios if u.id_usuario == usuario_id), "—")
+    nombre_usuario = identidad.nombre_de(usuario_id)
     st.sidebar.markdown(f"**🧑 Usuario activo:** {nombre_usuario} (ID {usuario_id})")
 elif rol_actual == "admin":
     st.sidebar.markdown("**🧑 Usuario activo:** Administrador")
@@ -125,7 +129,7 @@ elif opcion == "👥 Usuarios":
     # 🔑 Pasamos rol_actual y usuario_id reales para condicionar permisos
     usuarios.mostrar_usuarios(rol_actual=rol_actual, usuario_id=usuario_id)
     # Tras operación crítica de gestión de usuarios, dispara backup en segundo plano
-    backup_storage.crear_backup_async()
+    backup_storage.crear_backup_async(sql.DB_PATH)
 
 elif opcion == "💾 Backups":
     st.title("Gestión de Backups")
@@ -153,6 +157,9 @@ elif opcion == "💾 Backups":
     
         st.header("Estado de Backups")
         sql.mostrar_estado_backups()
+        arranque = bootstrap.estado()
+        etapas = " | ".join(f"{k} {v:.2f}s" for k, v in arranque["tiempos"].items())
+        st.caption(f"⏱️ Arranque de la base: {arranque['duracion']:.2f}s (origen: {arranque['origen']}) — {etapas}")
 
         # Crear / Listar / Rotar
         st.subheader("📤 Crear / Listar / Rotar")
@@ -168,7 +175,7 @@ elif opcion == "💾 Backups":
 
         if st.button("📋 Listar backups"):
             try:
-                backups = backup_storage.listar_backups()
+                backups = backup_storage.listar_backups(refrescar=True)
                 if not backups:
                     st.info("No hay backups en la carpeta.")
                 for b in backups:
@@ -178,7 +185,7 @@ elif opcion == "💾 Backups":
 
         if st.button("♻️ Rotar backups"):
             try:
-                backup_storage.rotar_backups(max_backups=5)
+                backup_storage.rotar_backups()
                 st.success("Rotación completada")
             except Exception as e:
                 st.error(f"Error al rotar backups: {e}")
@@ -192,18 +199,12 @@ elif opcion == "💾 Backups":
                 seleccion = st.selectbox("Selecciona un backup para restaurar:", list(opciones.keys()))
                 if st.button("📥 Descargar y restaurar"):
                     file_id = opciones[seleccion]
-                    if os.path.exists(sql.DB_PATH):
-                        if os.path.exists(sql.DB_PATH + ".bak"):
-                            os.remove(sql.DB_PATH + ".bak")
-                        os.rename(sql.DB_PATH, sql.DB_PATH + ".bak")
                     destino = sql.DB_PATH
                     try:
-                        backup_storage.descargar_backup(file_id, destino)
+                        bootstrap.restaurar_backup(file_id)
                         st.success(f"Backup restaurado en {destino} (copia previa en {sql.DB_PATH}.bak)")
                     except Exception as e:
-                        if os.path.exists(sql.DB_PATH + ".bak"):
-                            os.rename(sql.DB_PATH + ".bak", sql.DB_PATH)
-                        st.error(f"Error en restauración, se recuperó la copia local: {e}")
+                        st.error(f"Error en restauración, la base local no se ha modificado: {e}")
             else:
                 st.info("No hay backups disponibles para restaurar.")
         except Exception as e:
@@ -224,15 +225,11 @@ elif opcion == "💾 Backups":
                     report.append(f"📋 Listado OK → {len(backups)} backups encontrados")
                 else:
                     report.append("❌ Listado vacío")
-                backup_storage.rotar_backups(max_backups=5)
-                report.append("♻️ Rotación OK (máx. 5 backups)")
+                backup_storage.rotar_backups()
+                report.append("♻️ Rotación OK (política de retención)")
                 if backups:
                     file_id = backups[0]["id"]
-                if os.path.exists(sql.DB_PATH):
-                    if os.path.exists(sql.DB_PATH + ".bak"):
-                        os.remove(sql.DB_PATH + ".bak")
-                    os.rename(sql.DB_PATH, sql.DB_PATH + ".bak")
-                backup_storage.descargar_backup(file_id, sql.DB_PATH)
+                bootstrap.restaurar_backup(file_id)
                 report.append(f"📥 Restauración OK → {backups[0]['name']} descargado en {sql.DB_PATH}")
                 st.success("Validación completada")
                 for line in report:
@@ -275,22 +272,16 @@ elif opcion == "💾 Backups":
                 with col1:
                     if st.button("📥 Restaurar seleccionado", key="restore_btn"):
                         try:
-                            if os.path.exists(sql.DB_PATH):
-                                if os.path.exists(sql.DB_PATH + ".bak"):
-                                    os.remove(sql.DB_PATH + ".bak")
-                                os.rename(sql.DB_PATH, sql.DB_PATH + ".bak")
-                            backup_storage.descargar_backup(file_id, sql.DB_PATH)
+                            bootstrap.restaurar_backup(file_id)
                             st.success(f"Backup restaurado en {sql.DB_PATH} (copia previa en {sql.DB_PATH}.bak)")
                         except Exception as e:
-                            if os.path.exists(sql.DB_PATH + ".bak"):
-                                os.rename(sql.DB_PATH + ".bak", sql.DB_PATH)
-                            st.error(f"Error en restauración, se recuperó la copia local: {e}")
+                            st.error(f"Error en restauración, la base local no se ha modificado: {e}")
                 with col2:
                     confirmar = st.checkbox("Confirmar eliminación", key="confirm_delete")
                     if st.button("🗑️ Eliminar seleccionado", key="delete_btn"):
                         if confirmar:
                             try:
-                                service.files().delete(fileId=file_id).execute()
+                                backup_storage.borrar_backup(file_id)
                                 st.warning(f"Backup eliminado: {seleccion}")
                             except Exception as e:
                                 st.error(f"Error al eliminar backup: {e}")
@@ -330,7 +321,7 @@ elif opcion == "📈 Historial de Validaciones":
 
     if st.button("📋 Listar backups"):
         try:
-            backups = backup_storage.listar_backups()
+            backups = backup_storage.listar_backups(refrescar=True)
             if not backups:
                 st.info("No hay backups en la carpeta.")
             for b in backups:
@@ -340,7 +331,7 @@ elif opcion == "📈 Historial de Validaciones":
 
     if st.button("♻️ Rotar backups"):
         try:
-            backup_storage.rotar_backups(max_backups=5)
+            backup_storage.rotar_backups()
             st.success("Rotación completada")
         except Exception as e:
             st.error(f"Error al rotar backups: {e}")
@@ -358,18 +349,12 @@ elif opcion == "📈 Historial de Validaciones":
             seleccion = st.selectbox("Selecciona un backup para restaurar:", list(opciones.keys()))
             if st.button("📥 Descargar y restaurar"):
                 file_id = opciones[seleccion]
-                if os.path.exists(sql.DB_PATH):
-                    if os.path.exists(sql.DB_PATH + ".bak"):
-                        os.remove(sql.DB_PATH + ".bak")
-                    os.rename(sql.DB_PATH, sql.DB_PATH + ".bak")
                 destino = sql.DB_PATH
                 try:
-                    backup_storage.descargar_backup(file_id, destino)
+                    bootstrap.restaurar_backup(file_id)
                     st.success(f"Backup restaurado en {destino} (copia previa en {sql.DB_PATH}.bak)")
                 except Exception as e:
-                    if os.path.exists(sql.DB_PATH + ".bak"):
-                        os.rename(sql.DB_PATH + ".bak", sql.DB_PATH)
-                    st.error(f"Error en restauración, se recuperó la copia local: {e}")
+                    st.error(f"Error en restauración, la base local no se ha modificado: {e}")
         else:
             st.info("No hay backups disponibles para restaurar.")
     except Exception as e:
@@ -394,15 +379,11 @@ elif opcion == "📈 Historial de Validaciones":
                 report.append(f"📋 Listado OK → {len(backups)} backups encontrados")
             else:
                 report.append("❌ Listado vacío")
-            backup_storage.rotar_backups(max_backups=5)
-            report.append("♻️ Rotación OK (máx. 5 backups)")
+            backup_storage.rotar_backups()
+            report.append("♻️ Rotación OK (política de retención)")
             if backups:
                 file_id = backups[0]["id"]
-                if os.path.exists(sql.DB_PATH):
-                    if os.path.exists(sql.DB_PATH + ".bak"):
-                        os.remove(sql.DB_PATH + ".bak")
-                    os.rename(sql.DB_PATH, sql.DB_PATH + ".bak")
-                backup_storage.descargar_backup(file_id, sql.DB_PATH)
+                bootstrap.restaurar_backup(file_id)
                 report.append(f"📥 Restauración OK → {backups[0]['name']} descargado en {sql.DB_PATH}")
             st.success("Validación completada")
             for line in report:
@@ -444,22 +425,16 @@ elif opcion == "📈 Historial de Validaciones":
             with col1:
                 if st.button("📥 Restaurar seleccionado", key="restore_btn"):
                     try:
-                        if os.path.exists(sql.DB_PATH):
-                            if os.path.exists(sql.DB_PATH + ".bak"):
-                                os.remove(sql.DB_PATH + ".bak")
-                            os.rename(sql.DB_PATH, sql.DB_PATH + ".bak")
-                        backup_storage.descargar_backup(file_id, sql.DB_PATH)
+                        bootstrap.restaurar_backup(file_id)
                         st.success(f"Backup restaurado en {sql.DB_PATH} (copia previa en {sql.DB_PATH}.bak)")
                     except Exception as e:
-                        if os.path.exists(sql.DB_PATH + ".bak"):
-                            os.rename(sql.DB_PATH + ".bak", sql.DB_PATH)
-                        st.error(f"Error en restauración, se recuperó la copia local: {e}")
+                        st.error(f"Error en restauración, la base local no se ha modificado: {e}")
             with col2:
                 confirmar = st.checkbox("Confirmar eliminación", key="confirm_delete")
                 if st.button("🗑️ Eliminar seleccionado", key="delete_btn"):
                     if confirmar:
                         try:
-                            service.files().delete(fileId=file_id).execute()
+                            backup_storage.borrar_backup(file_id)
                             st.warning(f"Backup eliminado: {seleccion}")
                         except Exception as e:
                             st.error(f"Error al eliminar backup: {e}")
@@ -488,4 +463,4 @@ elif opcion == "📈 Historial de Validaciones":
     else:
         historial_validaciones.mostrar_historial()
         # Tras operación crítica de validaciones, dispara backup en segundo plano
-        backup_storage.crear_backup_async()
+        backup_storage.crear_backup_async(sql.DB_PATH)
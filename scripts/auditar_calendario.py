@@ -18,4 +18,6 @@ def auditar_eventos():
         print(f"Total: {len(sospechosos)}")
 
 if __name__ == "__main__":
+    from src.persistencia import bootstrap
+    bootstrap.ejecutar()  # restaura la base desde Drive si hace falta
     auditar_eventos()
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""
+Importa en bloque un histórico de métricas (HRV, peso, RPE…) desde CSV.
+Uso: python -m scripts.importar_metricas historico.csv [--atleta ID] [--chunk N]
+
+Columnas: fecha, tipo_metrica (o tipo), valor, unidad y id_atleta
+(esta última puede omitirse si se pasa --atleta).
+"""
+import argparse
+import sys
+
+from src.persistencia import bootstrap
+from src.persistencia import sql
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Importación masiva de métricas")
+    parser.add_argument("csv", help="fichero CSV con el histórico")
+    parser.add_argument("--atleta", type=int, help="id_atleta para todas las filas")
+    parser.add_argument("--chunk", type=int, default=sql.IMPORTACION_CHUNK, help="filas por transacción")
+    args = parser.parse_args()
+
+    if not bootstrap.ejecutar():  # restaura y migra antes de escribir
+        print("❌ La base no está lista; no se importa nada")
+        return 1
+    r = sql.importar_metricas(args.csv, id_atleta=args.atleta, chunk=args.chunk)
+    print(f"📥 Leídas: {r['leidas']} · importadas: {r['importadas']} · rechazadas: {r['rechazadas']}")
+    for motivo, n in r["motivos"].items():
+        print(f"   ⚠️ {motivo}: {n}")
+    print(f"⏱️ {r['segundos']:.2f}s ({r['filas_por_segundo']:.0f} filas/s)")
+    # Un único backup con todo lo importado, antes de salir
+    if r["importadas"] and not sql.flush_backups(timeout=300):
+        print("⚠️ No se pudo confirmar la subida del backup")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -34,4 +34,6 @@ def limpiar_eventos():
         print(f"✅ Limpieza completada. Eventos corregidos: {corregidos}")
 
 if __name__ == "__main__":
+    from src.persistencia import bootstrap
+    bootstrap.ejecutar()  # restaura la base desde Drive si hace falta
     limpiar_eventos()
\ No newline at end of file
@@ -38,4 +38,6 @@ def limpiar_eventos_corruptos():
     print(f"✅ Limpieza completada. Eventos corregidos: {corregidos}")
 
 if __name__ == "__main__":
+    from src.persistencia import bootstrap
+    bootstrap.ejecutar()  # restaura la base desde Drive si hace falta
     limpiar_eventos_corruptos()
\ No newline at end of file
@@ -0,0 +1,26 @@
+"""
+Comprueba con EXPLAIN QUERY PLAN que las consultas calientes usan índices.
+Uso: python -m scripts.verificar_indices  (sale con código 1 si alguna recorre la tabla entera)
+"""
+import sys
+
+from src.persistencia import bootstrap
+from src.persistencia import sql
+
+
+def main() -> int:
+    bootstrap.ejecutar()  # restaura y migra (crea los índices que falten)
+    fallos = 0
+    for r in sql.verificar_planes():
+        icono = "✅" if r["usa_indice"] else "❌"
+        nota = f"  (recorre tablas pequeñas: {', '.join(r['tablas_pequenas'])})" if r["tablas_pequenas"] else ""
+        print(f"{icono} {r['consulta']}{nota}")
+        for paso in r["plan"]:
+            print(f"     {paso}")
+        fallos += not r["usa_indice"]
+    print(f"\n{'✅ Todas las consultas usan índices' if not fallos else f'❌ {fallos} consultas sin índice'}")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
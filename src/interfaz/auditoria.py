@@ -54,6 +54,8 @@ def probar_flujo(modulo, rol_actual="admin"):
             resultado["mensaje"] = "❌ Módulo no reconocido"
             return resultado
 
+        # Los backups se agrupan en segundo plano: esperamos a que el flujo esté en Drive
+        sql.esperar_backup()
         backups_despues = backup_storage.listar_backups()
         nuevos = [b for b in backups_despues if b["id"] not in ids_antes]
         if nuevos:
@@ -338,9 +340,8 @@ def mostrar_auditoria():
                     if resultado["backup_creado"]:
                         st.info(f"📦 Backup generado: {resultado['backup_creado']}")
             with cols[2]:
-                backups = backup_storage.listar_backups()
-                if backups:
-                    ultimo = sorted(backups, key=lambda b: b["createdTime"], reverse=True)[0]
+                ultimo = backup_storage.ultimo_backup()
+                if ultimo:
                     st.caption(f"📦 Último backup: {ultimo['name']} ({ultimo['createdTime']})")
                 else:
                     st.caption("⚠️ No hay backups disponibles")
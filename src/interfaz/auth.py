@@ -1,6 +1,7 @@
 import streamlit as st
 import src.persistencia.sql as sql
 from src.utils.seguridad import check_password, hash_password
+from src.utils import identidad
 
 def login_form():
     st.header("Acceder")
@@ -29,6 +30,7 @@ def login_form():
 def logout():
     for k in ["USUARIO_ID", "ROL_ACTUAL", "USUARIO_NOMBRE"]:
         st.session_state.pop(k, None)
+    identidad.olvidar()
     st.success("Sesión cerrada")
     st.rerun()
 
@@ -6,17 +6,120 @@ import json
 
 # Importar control de roles
 from src.utils.roles import Contexto, puede_crear_evento_calendario, puede_borrar_evento_calendario
+from src.utils import identidad
 
 def badge(text, color="#eee", text_color="#000"):
     """Devuelve un span HTML con estilo tipo chip/badge."""
     return f"<span style='background-color:{color}; color:{text_color}; padding:2px 6px; border-radius:8px; font-size:90%'>{text}</span>"
 
+# ───────────────────────────────
+# Vista tabla (estilos por columna, paginada)
+# ───────────────────────────────
+FILAS_POR_PAGINA = 50
+COLUMNA_BORRAR = "🗑️"
+
+# Columna → (css del chip, prefijo, valores que no se resaltan)
+ESTILOS_TABLA = {
+    "Síntomas": ("background-color:#FDE2E2; color:#7A1D1D", "🩸 ", {"-", "Ninguno"}),
+    "Menstruacion": ("background-color:#FEE2E2; color:#7A1D1D", "🩸 ", {"-", "No"}),
+    "Ovulacion": ("background-color:#F3E8FF; color:#2E1065", "🔄 ", {"-", "No"}),
+    "Altitud": ("background-color:#E6F0FF; color:#0B3A82", "⛰️ ", {"-"}),
+    "Respiratorio": ("background-color:#E0F7FA; color:#065F46", "🌬️ ", {"-"}),
+    "Calor": ("background-color:#FFF4E5; color:#7C2D12", "🔥 ", {"-"}),
+    "Lesión": ("background-color:#FFF4D6; color:#7A4B00", "🤕 ", {"-", ""}),
+    "Comentario": ("background-color:#F9FAFB; color:#374151", "📝 ", {"-", ""}),
+    "HRV": ("background-color:#E6F0FF; color:#0B3A82", "", {"-", ""}),
+    "Wellness": ("background-color:#E0F7FA; color:#065F46", "", {"-", ""}),
+    "RPE": ("background-color:#FFF4E5; color:#7C2D12", "", {"-", ""}),
+    "Peso": ("background-color:#F3F4F6; color:#374151", "", {"-", ""}),
+    "FC reposo": ("background-color:#FEE2E2; color:#7A1D1D", "", {"-", ""}),
+}
+# Días hasta la competición: ≤7 rojo, ≤30 naranja, resto gris
+ESTILO_COMPETICION_PROXIMA = "background-color:#FDE2E2; color:#7A1D1D; font-weight:bold"
+ESTILO_COMPETICION_MES = "background-color:#FFF4E5; color:#7C2D12"
+ESTILO_COMPETICION_LEJANA = "background-color:#F3F4F6; color:#374151"
+
+
+def _estilar_tabla(df: pd.DataFrame):
+    """Styler de la tabla de eventos: estilos y prefijos aplicados por columna, no por celda."""
+    df = df.copy()
+    estilos = pd.DataFrame("", index=df.index, columns=df.columns)
+    for col, (css, prefijo, neutros) in ESTILOS_TABLA.items():
+        if col not in df:
+            continue
+        activos = ~df[col].isin(neutros)
+        estilos[col] = estilos[col].mask(activos, css)
+        if prefijo:
+            df.loc[activos, col] = prefijo + df.loc[activos, col].astype(str)
+    if "Competición" in df:
+        dias = pd.to_numeric(df["Competición"].astype(str).str.extract(r"^(-?\d+)")[0], errors="coerce")
+        estilos["Competición"] = (
+            estilos["Competición"]
+            .mask(dias.notna(), ESTILO_COMPETICION_LEJANA)
+            .mask(dias <= 30, ESTILO_COMPETICION_MES)
+            .mask(dias <= 7, ESTILO_COMPETICION_PROXIMA)
+        )
+    return df.style.apply(lambda _: estilos, axis=None)
+
+
+def _pagina_actual(clave: str, cargar) -> sql.Pagina:
+    """
+    Página en curso de un listado por cursor. `session_state[clave]` guarda la pila
+    de cursores ya recorridos (None = primera página) para poder volver atrás.
+    """
+    cursores = st.session_state.setdefault(clave, [None])
+    after_fecha, after_id = cursores[-1] or (None, None)
+    return cargar(after_fecha=after_fecha, after_id=after_id)
+
+
+def _controles_pagina(clave: str, pagina: sql.Pagina):
+    """Botones ◀/▶ de un listado paginado con _pagina_actual."""
+    cursores = st.session_state.setdefault(clave, [None])
+    if len(cursores) == 1 and pagina.siguiente is None:
+        return
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    col_prev.button("◀ Anteriores", key=f"{clave}_prev", disabled=len(cursores) == 1,
+                    on_click=cursores.pop, width="stretch")
+    col_info.caption(f"Página {len(cursores)}")
+    col_next.button("Siguientes ▶", key=f"{clave}_next", disabled=pagina.siguiente is None,
+                    on_click=cursores.append, args=(pagina.siguiente,), width="stretch")
+
+
+def _tabla_eventos(df: pd.DataFrame, id_atleta, puede_borrar: bool, clave_pagina: str = ""):
+    """Tabla de una página de eventos; el borrado se hace marcando filas en una sola columna."""
+    if df.empty:
+        st.info("No hay eventos para mostrar")
+        return
+    df_pagina = df.reset_index(drop=True)
+    if puede_borrar:
+        df_pagina.insert(0, COLUMNA_BORRAR, False)
+    else:
+        st.caption("⛔ Sin permiso para borrar")
+
+    editado = st.data_editor(
+        _estilar_tabla(df_pagina),
+        column_config={"id_evento": None, COLUMNA_BORRAR: st.column_config.CheckboxColumn(COLUMNA_BORRAR, width="small")},
+        disabled=[c for c in df_pagina.columns if c != COLUMNA_BORRAR],
+        hide_index=True,
+        width="stretch",
+        key=f"tabla_eventos_{id_atleta}_{clave_pagina}_{len(st.session_state.get(clave_pagina, []))}",
+    )
+
+    if puede_borrar:
+        ids = [int(i) for i in editado.loc[editado[COLUMNA_BORRAR], "id_evento"]]
+        if st.button(f"🗑️ Borrar seleccionados ({len(ids)})", disabled=not ids, key=f"tabla_eventos_borrar_{id_atleta}"):
+            with sql.transaccion():
+                for id_evento in ids:
+                    sql.borrar_evento_calendario(id_evento)
+            st.success(f"✅ {len(ids)} evento(s) eliminado(s)")
+            st.rerun()
+
+
 def mostrar_calendario(rol_actual="admin", usuario_id=None):
     st.header("📅 Calendario del atleta")
 
     if rol_actual in ["entrenadora", "atleta"]:
-        usuarios = sql.obtener_usuarios()
-        nombre_usuario = next((u.nombre for u in usuarios if u.id_usuario == usuario_id), "—")
+        nombre_usuario = identidad.nombre_de(usuario_id)
         st.caption(f"🔐 Rol activo: {rol_actual} | Usuario: {nombre_usuario} (ID {usuario_id})")
     elif rol_actual == "admin":
         st.caption("🔐 Rol activo: admin")
@@ -30,13 +133,13 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
 
         try:
             ruta_db = os.path.abspath(sql.engine.url.database)
-            num_usuarios = len(sql.obtener_usuarios())
-            num_atletas = len(sql.obtener_atletas())
-            num_eventos = len(sql.obtener_eventos())
+            conteos = sql.contar_entidades()
+            num_usuarios = conteos["tablas"]["usuarios"]
+            num_atletas = conteos["tablas"]["atletas"]
+            num_eventos = conteos["tablas"]["eventos"]
 
-            backups = backup_storage.listar_backups()
-            if backups:
-                ultimo = sorted(backups, key=lambda b: b["createdTime"], reverse=True)[0]
+            ultimo = backup_storage.ultimo_backup()
+            if ultimo:
                 fecha_backup = ultimo["createdTime"]
                 nombre_backup = ultimo["name"]
                 backup_info = f"📦 Último backup: {nombre_backup} ({fecha_backup})"
@@ -45,6 +148,15 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
 
             st.info(f"🛠️ Base de datos activa: {ruta_db}")
             st.info(f"👥 Usuarios: {num_usuarios} | 🏃‍♂️ Atletas: {num_atletas} | 📅 Eventos: {num_eventos}")
+            st.info(
+                f"💽 Tamaño: {conteos['bytes'] / 1024 / 1024:.2f} MB | "
+                f"Páginas: {conteos['paginas']} × {conteos['tam_pagina']} B ({conteos['paginas_libres']} libres)"
+            )
+            cache = sql.estadisticas_cache()
+            st.info(
+                f"🧠 Caché de lecturas: {cache['entradas']}/{cache['max_entradas']} entradas | "
+                f"aciertos {cache['aciertos']} · fallos {cache['fallos']} ({cache['ratio_aciertos']:.0%})"
+            )
             st.info(backup_info)
 
         except Exception as e:
@@ -81,7 +193,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
 
     elif rol_actual == "atleta":
         # 🔒 Blindaje: el atleta solo puede ver su propio perfil
-        id_atleta_vinculado = sql.obtener_id_atleta_por_usuario(usuario_id)
+        id_atleta_vinculado = identidad.id_atleta_de(usuario_id)
         atleta_obj = sql.obtener_atleta_por_id(id_atleta_vinculado)
         atletas = [atleta_obj] if atleta_obj else []
 
@@ -138,20 +250,37 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
     with col2:
         fecha_fin = st.date_input("Fecha fin", value=None)
 
-    eventos = sql.obtener_eventos_filtrados(
-        id_atleta=id_atleta_forzado,
-        rol_actual=rol_actual,
-        tipos=tipos,
-        fecha_inicio=fecha_inicio,
-        fecha_fin=fecha_fin
-    )
-
     vista = st.radio(
         " ", ["Calendario", "Tabla"],
         horizontal=True, index=0,
         label_visibility="collapsed"
     )
 
+    if vista == "Calendario" and not fecha_inicio and not fecha_fin:
+        # Sin filtro de fechas el calendario solo necesita el mes visible (± margen),
+        # leído por meses cacheados
+        from src.interfaz.componentes.calendario_interactivo import ventana_visible
+        desde, hasta = ventana_visible(id_atleta_forzado)
+        eventos = sql.obtener_eventos_por_rango(
+            id_atleta_forzado, desde, hasta, rol_actual=rol_actual, tipos=tipos
+        )
+    elif vista == "Tabla":
+        # La tabla pide al servidor solo la página visible (cursor por fecha, id)
+        clave_pagina = f"cursor_eventos_{id_atleta_forzado}_{rol_actual}_{'-'.join(sorted(tipos))}_{fecha_inicio}_{fecha_fin}"
+        pagina_eventos = _pagina_actual(clave_pagina, lambda **cursor: sql.obtener_eventos_filtrados_pagina(
+            id_atleta_forzado, rol_actual=rol_actual, tipos=tipos,
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, limit=FILAS_POR_PAGINA, **cursor
+        ))
+        eventos = pagina_eventos.filas
+    else:
+        eventos = sql.obtener_eventos_filtrados(
+            id_atleta=id_atleta_forzado,
+            rol_actual=rol_actual,
+            tipos=tipos,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin
+        )
+
     data = []
     eventos_fc = []
     for e in eventos:
@@ -192,6 +321,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
                 "start": e["start"],
                 "allDay": True,
                 "tipo_evento": tipo,          # 🔑 añade el tipo para que el otro módulo lo use
+                "version": e.get("version"),  # 🔑 versión para reutilizar bloques ya construidos
                 "extendedProps": {**valor, "entrenadora": nombre_entrenadora}
             }
 
@@ -211,6 +341,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
                 "start": e["start"],
                 "allDay": True,
                 "tipo_evento": tipo,
+                "version": e.get("version"),
                 "extendedProps": valor
             }
             eventos_fc.append(evento_fc)
@@ -224,6 +355,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
                 "start": e["start"],
                 "allDay": True,
                 "tipo_evento": tipo,
+                "version": e.get("version"),
                 "extendedProps": valor
             }
             eventos_fc.append(evento_fc)
@@ -241,6 +373,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
                 "start": e["start"],
                 "allDay": True,
                 "tipo_evento": tipo,
+                "version": e.get("version"),
                 "extendedProps": valor
             }
             eventos_fc.append(evento_fc)
@@ -251,104 +384,16 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
     if vista == "Tabla":
         df = pd.DataFrame(data).fillna("-")
 
-        def style_cell(val, col):
-            if col == "Competición" and isinstance(val, str) and "días" in val:
-                try:
-                    dias = int(val.split()[0])
-                    if dias <= 7:
-                        return f"<span style='background-color:#FDE2E2; color:#7A1D1D; font-weight:bold; padding:2px 6px; border-radius:8px;'>{val}</span>"
-                    elif dias <= 30:
-                        return f"<span style='background-color:#FFF4E5; color:#7C2D12; padding:2px 6px; border-radius:8px;'>{val}</span>"
-                    else:
-                        return f"<span style='background-color:#F3F4F6; color:#374151; padding:2px 6px; border-radius:8px;'>{val}</span>"
-                except Exception:
-                    return val
-            if col == "Síntomas" and val not in ["-", "Ninguno"]:
-                return f"<span style='background-color:#FDE2E2; color:#7A1D1D; padding:2px 6px; border-radius:8px;'>🩸 {val}</span>"
-            if col == "Menstruacion" and val not in ["-", "No"]:
-                return f"<span style='background-color:#FEE2E2; color:#7A1D1D; padding:2px 6px; border-radius:8px;'>🩸 {val}</span>"
-            if col == "Ovulacion" and val not in ["-", "No"]:
-                return f"<span style='background-color:#F3E8FF; color:#2E1065; padding:2px 6px; border-radius:8px;'>🔄 {val}</span>"
-            if col == "Altitud" and val == "Sí":
-                return f"<span style='background-color:#E6F0FF; color:#0B3A82; padding:2px 6px; border-radius:8px;'>⛰️ {val}</span>"
-            if col == "Respiratorio" and val == "Sí":
-                return f"<span style='background-color:#E0F7FA; color:#065F46; padding:2px 6px; border-radius:8px;'>🌬️ {val}</span>"
-            if col == "Calor" and val == "Sí":
-                return f"<span style='background-color:#FFF4E5; color:#7C2D12; padding:2px 6px; border-radius:8px;'>🔥 {val}</span>"
-            if col == "Lesión" and val not in ["-", ""]:
-                return f"<span style='background-color:#FFF4D6; color:#7A4B00; padding:2px 6px; border-radius:8px;'>🤕 {val}</span>"
-            if col == "Comentario" and val not in ["-", ""]:
-                return f"<span style='background-color:#F9FAFB; color:#374151; padding:2px 6px; border-radius:8px;'>📝 {val}</span>"
-            if col == "HRV" and val not in ["-", ""]:
-                return f"<span style='background-color:#E6F0FF; color:#0B3A82; padding:2px 6px; border-radius:8px;'>{val}</span>"
-            if col == "Wellness" and val not in ["-", ""]:
-                return f"<span style='background-color:#E0F7FA; color:#065F46; padding:2px 6px; border-radius:8px;'>{val}</span>"
-            if col == "RPE" and val not in ["-", ""]:
-                return f"<span style='background-color:#FFF4E5; color:#7C2D12; padding:2px 6px; border-radius:8px;'>{val}</span>"
-            if col == "Peso" and val not in ["-", ""]:
-                return f"<span style='background-color:#F3F4F6; color:#374151; padding:2px 6px; border-radius:8px;'>{val}</span>"
-            if col == "FC reposo" and val not in ["-", ""]:
-                return f"<span style='background-color:#FEE2E2; color:#7A1D1D; padding:2px 6px; border-radius:8px;'>{val}</span>"
-            return val if val != "nan" else "-"
-            return val if val != "nan" else "-"
-
-        # Renderizado fila a fila con botón de borrado
-        # Estilos CSS para fijar ancho de celdas
-        table_style = """
-        <style>
-        .fixed-table td {
-            width: 120px;
-            max-width: 120px;
-            overflow: hidden;
-            text-overflow: ellipsis;
-            white-space: nowrap;
-            vertical-align: middle;
-        }
-        .fixed-table th {
-            width: 120px;
-        }
-        </style>
-        """
-        st.markdown(table_style, unsafe_allow_html=True)
-
-        for _, row in df.iterrows():
-            cols = st.columns([8, 1])  # 8 partes para datos, 1 para botón
-            with cols[0]:
-                styled_row = {col: style_cell(val, col) for col, val in row.items() if col != "id_evento"}
-                st.markdown(
-                    pd.DataFrame([styled_row]).to_html(
-                        escape=False, index=False, header=False, classes="fixed-table"
-                    ),
-                    unsafe_allow_html=True
-                )
-            with cols[1]:
-                # Determinar propietario real del evento (si está en datos)
-                propietario_evento = e.get("id_autor") or id_atleta_forzado
-
-                # 🔒 Blindaje de visibilidad: si es atleta, forzar su propio id_atleta
-                if rol_actual == "atleta":
-                    id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
-
-                ctx_evento = Contexto(
-                    rol_actual=rol_actual,
-                    usuario_id=usuario_id or 0,
-                    atleta_id=id_atleta_forzado,
-                    propietario_id=propietario_evento
-                )
-
-                # Admin siempre puede borrar
-                if rol_actual == "admin" or puede_borrar_evento_calendario(ctx_evento):
-                    if st.button("🗑️", key=f"del_{row['id_evento']}"):
-                        sql.borrar_evento_calendario(int(row["id_evento"]))
-                        st.success(f"Evento {row['id_evento']} eliminado")
-                        st.rerun()
-                else:
-                    st.caption("⛔ Sin permiso para borrar")
+        # Todas las filas son del mismo atleta: el permiso se evalúa una vez, no por fila
+        puede_borrar = rol_actual == "admin" or puede_borrar_evento_calendario(ctx_base)
+        _tabla_eventos(df, id_atleta_forzado, puede_borrar, clave_pagina)
+        _controles_pagina(clave_pagina, pagina_eventos)
 
     # Vista calendario interactivo (FullCalendar)
     if vista == "Calendario":
         from src.interfaz.componentes.calendario_interactivo import mostrar_calendario_interactivo
-        mostrar_calendario_interactivo(eventos_fc, id_atleta_forzado, vista=vista)
+        rango_filtro = (fecha_inicio, fecha_fin) if fecha_inicio or fecha_fin else None
+        mostrar_calendario_interactivo(eventos_fc, id_atleta_forzado, vista=vista, rango=rango_filtro)
 
     # ───────────────────────────────
     # Sesiones del día (planificado vs completado)
@@ -356,11 +401,15 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
     st.subheader("🏃 Sesiones del día")
     # 🔒 Blindaje: si es atleta, forzar su propio id_atleta
     if rol_actual == "atleta":
-        id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+        id_atleta_forzado = identidad.id_atleta_de(usuario_id)
     else:
         id_atleta_forzado = id_atleta
 
-    sesiones = sql.obtener_sesiones_por_atleta(id_atleta_forzado)
+    clave_sesiones = f"cursor_sesiones_{id_atleta_forzado}"
+    pagina_sesiones = _pagina_actual(clave_sesiones, lambda **cursor: sql.obtener_sesiones_por_atleta_pagina(
+        id_atleta_forzado, limit=FILAS_POR_PAGINA, **cursor
+    ))
+    sesiones = pagina_sesiones.filas
     if not sesiones:
         st.info("No hay sesiones registradas todavía")
     else:
@@ -371,6 +420,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
             "Realizado": s.realizado_json
         } for s in sesiones])
         st.dataframe(df_sesiones, width="stretch")
+        _controles_pagina(clave_sesiones, pagina_sesiones)
 
     st.markdown("---")
 
@@ -382,20 +432,21 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
     import altair as alt
     # 🔒 Blindaje: si es atleta, forzar su propio id_atleta
     if rol_actual == "atleta":
-        id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+        id_atleta_forzado = identidad.id_atleta_de(usuario_id)
     else:
         id_atleta_forzado = id_atleta
 
     metricas = sql.obtener_metricas_rapidas(id_atleta_forzado)
-    if not metricas:
+    df_metricas = pd.DataFrame([{
+        "fecha": m.fecha,  # dejamos datetime completo aquí
+        "tipo": m.tipo_metrica,
+        "valor": m.valor_num,  # numérico desde SQLite (incluye negativos)
+        "unidad": m.unidad
+    } for m in metricas if m.valor_num is not None])
+    # Sin métricas o todas no numéricas: no hay nada que graficar
+    if df_metricas.empty:
         st.info("No hay métricas rápidas registradas todavía")
     else:
-        df_metricas = pd.DataFrame([{
-            "fecha": m.fecha,  # dejamos datetime completo aquí
-            "tipo": m.tipo_metrica,
-            "valor": float(m.valor) if str(m.valor).replace('.','',1).isdigit() else None,
-            "unidad": m.unidad
-        } for m in metricas if m.valor is not None])
         # 🔧 Normalizar a inicio de día y asegurar dtype datetime64[ns]
         df_metricas["fecha"] = pd.to_datetime(df_metricas["fecha"]).dt.floor("D")
         df_metricas = df_metricas.sort_values("fecha")
@@ -403,6 +454,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
         # 🔑 Ordenar cronológicamente (ya no hace falta agrupar porque sql.py garantiza unicidad)
         df_metricas = df_metricas.sort_values("fecha")
 
+        resumen = sql.resumen_metricas(id_atleta_forzado, tipos=list(df_metricas["tipo"].unique()))
         tipos = df_metricas["tipo"].unique()
         for t in tipos:
             df_t = df_metricas[df_metricas["tipo"] == t]
@@ -418,6 +470,9 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
                 height=200
             )
             st.altair_chart(chart, width='stretch')
+            if t in resumen:
+                r = resumen[t]
+                st.caption(f"Media {r['media']:.1f} · Mín {r['minimo']:g} · Máx {r['maximo']:g} · {r['n']} registros")
 
     st.markdown("---")
 
@@ -432,7 +487,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
         if submitted and texto.strip():
             # 🔒 Blindaje: si es atleta, forzar su propio id_atleta
             if rol_actual == "atleta":
-                id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                id_atleta_forzado = identidad.id_atleta_de(usuario_id)
             else:
                 id_atleta_forzado = id_atleta
 
@@ -441,15 +496,21 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
 
     # 🔒 Blindaje: si es atleta, forzar su propio id_atleta
     if rol_actual == "atleta":
-        id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+        id_atleta_forzado = identidad.id_atleta_de(usuario_id)
     else:
         id_atleta_forzado = id_atleta
 
-    comentarios = sql.obtener_comentarios_por_atleta(id_atleta_forzado, rol_actual=rol_actual)
+    clave_comentarios = f"cursor_comentarios_{id_atleta_forzado}_{rol_actual}"
+    pagina_comentarios = _pagina_actual(clave_comentarios, lambda **cursor: sql.obtener_comentarios_por_atleta_pagina(
+        id_atleta_forzado, rol_actual=rol_actual, limit=FILAS_POR_PAGINA, **cursor
+    ))
+    comentarios = pagina_comentarios.filas
     if comentarios:
         st.write("### Comentarios existentes")
-        for c in comentarios:
-            st.markdown(f"- {c.texto} (autor {c.id_autor}, visible para {c.visible_para})")
+        st.markdown("\n".join(
+            f"- {c.texto} (autor {c.id_autor}, visible para {c.visible_para})" for c in comentarios
+        ))
+        _controles_pagina(clave_comentarios, pagina_comentarios)
 
     # Prueba
 
@@ -457,7 +518,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
         # Solo permitir crear evento de prueba si el rol tiene permiso
         # 🔒 Blindaje: si es atleta, forzar su propio id_atleta
         if rol_actual == "atleta":
-            id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+            id_atleta_forzado = identidad.id_atleta_de(usuario_id)
         else:
             id_atleta_forzado = id_atleta
 
@@ -485,7 +546,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
         if st.button("Listar eventos actuales"):
             # 🔒 Blindaje: si es atleta, forzar su propio id_atleta
             if rol_actual == "atleta":
-                id_atleta_vinculado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                id_atleta_vinculado = identidad.id_atleta_de(usuario_id)
                 id_atleta = id_atleta_vinculado
 
             eventos = sql.obtener_eventos_calendario_por_atleta(id_atleta_forzado, rol_actual=rol_actual)
@@ -496,7 +557,7 @@ def mostrar_calendario(rol_actual="admin", usuario_id=None):
     if st.button("Eliminar TODO lo de métricas rápidas"):
         # 🔒 Blindaje: si es atleta, forzar su propio id_atleta
         if rol_actual == "atleta":
-            id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+            id_atleta_forzado = identidad.id_atleta_de(usuario_id)
         else:
             id_atleta_forzado = id_atleta
 
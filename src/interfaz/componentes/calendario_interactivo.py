@@ -10,6 +10,7 @@ from src.utils.roles import (
     puede_editar_evento_calendario,
     puede_borrar_evento_calendario,
 )
+from src.utils import identidad
 
 # Estilos por tipo de evento
 EVENT_STYLES = {
@@ -26,11 +27,242 @@ EVENT_STYLES = {
     "nota": {"icon": "📝", "bg": "#F9FAFB", "border": "#6B7280", "text": "#374151", "priority": 5},
 }
 
-def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
+def normalize_details(details: dict) -> dict:
+    """Deja extendedProps con valores serializables (fechas a ISO, resto a str)."""
+    safe = {}
+    for k, v in (details or {}).items():
+        if v is None:
+            continue
+        if isinstance(v, (str, int, float, bool)):
+            safe[k] = v
+        elif isinstance(v, (datetime.date, datetime.datetime)):
+            safe[k] = v.isoformat()
+        else:
+            safe[k] = str(v)
+    return safe
+
+# Proyección memoizada: bloques FullCalendar ya construidos por (atleta, evento).
+# La firma es la versión del evento (actualizado_en) + lo que añade la página;
+# si no cambia, se reutilizan los mismos dicts en vez de reconstruirlos.
+PROYECCION_MAX_EVENTOS = 5000
+_proyeccion = sql.CacheLecturas(max_entradas=PROYECCION_MAX_EVENTOS)
+
+
+def _bloques_evento(ev) -> list[dict]:
+    """Convierte un evento de calendario en sus bloques (filas de iconos) para FullCalendar."""
+    bloques = []
+    fecha = ev.get("start")
+    if not fecha:
+        return bloques
+
+    tipo = ev.get("Tipo") or ev.get("tipo_evento")
+    details = ev.get("extendedProps", {})
+
+    if tipo == "estado_diario":
+        safe_details = normalize_details(details)
+        extended = {**safe_details, "tipo_evento": tipo, "id_base": ev.get("id")}
+
+        valores_neutros = [None, "", "No", "Ninguno", "-", False]
+
+        # Bloque 1: ciclo
+        fila_ciclo = []
+        if details.get("sintomas") not in valores_neutros: fila_ciclo.append("🩸")
+        if details.get("menstruacion") not in valores_neutros: fila_ciclo.append("🩸")
+        if details.get("ovulacion") not in valores_neutros: fila_ciclo.append("🔄")
+        if fila_ciclo:
+            bloques.append({"id": f"{ev.get('id')}-ciclo", "title": " ".join(fila_ciclo),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 0}})
+
+        # Bloque 2: condiciones externas
+        fila_cond = []
+        if details.get("altitud"): fila_cond.append("⛰️")
+        if details.get("calor"): fila_cond.append("🔥")
+        if details.get("respiratorio"): fila_cond.append("🌬️")
+        if fila_cond:
+            bloques.append({"id": f"{ev.get('id')}-cond", "title": " ".join(fila_cond),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 1}})
+
+        # Bloque 3: lesiones / baja / notas
+        fila_extra = []
+        if details.get("lesion"): fila_extra.append("🤕")
+        if details.get("baja") and details.get("baja") != "No":
+            fila_extra.append("⛔")
+        if details.get("comentario_extra"): fila_extra.append("📝")
+        if fila_extra:
+            bloques.append({"id": f"{ev.get('id')}-extra", "title": " ".join(fila_extra),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 2}})
+
+        # Bloque 4: peso/déficit
+        fila_peso = []
+        if details.get("peso"): fila_peso.append(f"⚖️ {details['peso']}")
+        if details.get("deficit_calorico"): fila_peso.append("🍽️")
+        if fila_peso:
+            bloques.append({"id": f"{ev.get('id')}-peso", "title": " ".join(fila_peso),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 3}})
+
+        # Bloque 5: HRV / FC reposo
+        fila_hrv = []
+        if details.get("hrv"): fila_hrv.append(f"💓 {details['hrv']}")
+        if details.get("fc_reposo"): fila_hrv.append(f"❤️ {details['fc_reposo']}")
+        if fila_hrv:
+            bloques.append({"id": f"{ev.get('id')}-hrv", "title": " ".join(fila_hrv),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 4}})
+
+        # Bloque 6: sueño / wellness / RPE
+        fila_sueno = []
+        if details.get("sueno"): fila_sueno.append(f"😴 {details['sueno']}h")
+        if details.get("wellness"): fila_sueno.append(f"🌟 {details['wellness']}")
+        if details.get("rpe"): fila_sueno.append(f"💪 {details['rpe']}")
+        if fila_sueno:
+            bloques.append({"id": f"{ev.get('id')}-sueno", "title": " ".join(fila_sueno),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 5}})
+
+    elif tipo == "competicion":
+        # Solo icono 🏆, detalles en extendedProps
+        safe_details = normalize_details(details)
+        bloques.append({
+            "id": str(ev.get("id")),
+            "title": "🏆",
+            "start": fecha,
+            "allDay": True,
+            "backgroundColor": "#FFFFFF",
+            "borderColor": "#FFFFFF",
+            "textColor": "#000000",
+            "tipo_evento": tipo,
+            "extendedProps": {**safe_details, "displayOrder": 3, "tipo_evento": tipo, "id_base": ev.get("id")}
+        })
+
+    elif tipo == "cita_test":
+        # Solo icono 📅, detalles en extendedProps
+        safe_details = normalize_details(details)
+        bloques.append({
+            "id": str(ev.get("id")),
+            "title": "📅",
+            "start": fecha,
+            "allDay": True,
+            "backgroundColor": EVENT_STYLES["cita_test"]["bg"],
+            "borderColor": EVENT_STYLES["cita_test"]["border"],
+            "textColor": EVENT_STYLES["cita_test"]["text"],
+            "tipo_evento": tipo,
+            "extendedProps": {**safe_details, "displayOrder": 3, "tipo_evento": tipo, "id_base": ev.get("id")}
+        })
+
+    elif tipo == "metricas_rapidas":
+        safe_details = normalize_details(details)
+        extended = {**safe_details, "tipo_evento": tipo, "id_base": ev.get("id")}
+
+        # Bloque A: peso / déficit
+        fila_peso = []
+        if safe_details.get("peso"): fila_peso.append(f"⚖️ {safe_details['peso']}kg")
+        if safe_details.get("deficit_calorico"):
+            fila_peso.append(f"🍽️ {safe_details['deficit_calorico']}")
+        if fila_peso:
+            bloques.append({"id": f"{ev.get('id')}-peso", "title": " ".join(fila_peso),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 3}})
+
+        # Bloque B: HRV / FC reposo
+        fila_hrv = []
+        if safe_details.get("hrv"): fila_hrv.append(f"💓 {safe_details['hrv']}")
+        if safe_details.get("fc_reposo"): fila_hrv.append(f"❤️ {safe_details['fc_reposo']}")
+        if fila_hrv:
+            bloques.append({"id": f"{ev.get('id')}-hrv", "title": " ".join(fila_hrv),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 4}})
+
+        # Bloque C: sueño / wellness / RPE
+        fila_sueno = []
+        if safe_details.get("sueno"): fila_sueno.append(f"😴 {safe_details['sueno']}h")
+        if safe_details.get("wellness"): fila_sueno.append(f"🌟 {safe_details['wellness']}")
+        if safe_details.get("rpe"): fila_sueno.append(f"💪 {safe_details['rpe']}")
+        if fila_sueno:
+            bloques.append({"id": f"{ev.get('id')}-sueno", "title": " ".join(fila_sueno),
+                "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
+                "borderColor": "#FFFFFF", "textColor": "#000000",
+                "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 5}})
+
+    return bloques
+
+
+def _proyectar_eventos(src_events, id_atleta) -> list[dict]:
+    """
+    Bloques de todos los eventos: solo se reconstruyen los nuevos o modificados.
+    Si ningún bloque cambia se devuelve la misma lista del render anterior.
+    """
+    out_events = []
+    for ev in src_events:
+        version = ev.get("version")
+        if version is None:
+            out_events.extend(_bloques_evento(ev))
+            continue
+        clave = (id_atleta, ev.get("id"))
+        firma = (version, ev.get("start"), ev.get("tipo_evento"), (ev.get("extendedProps") or {}).get("entrenadora"))
+        encontrado, bloques = _proyeccion.obtener(clave, firma)
+        if not encontrado:
+            bloques = tuple(_bloques_evento(ev))
+            _proyeccion.guardar(clave, firma, bloques)
+        out_events.extend(bloques)
+
+    clave_sesion = f"fc_proyeccion_{id_atleta}"
+    anterior = st.session_state.get(clave_sesion)
+    if anterior is not None and len(anterior) == len(out_events) \
+            and all(a is b for a, b in zip(anterior, out_events)):
+        return anterior
+    st.session_state[clave_sesion] = out_events
+    return out_events
+
+# ───────────────────────────────
+# Ventana visible (carga perezosa por meses)
+# ───────────────────────────────
+# Días cargados antes y después del mes: cubren la rejilla mensual (hasta 6 semanas)
+PREFETCH_DIAS = 14
+
+
+def _mes_visible(id_atleta) -> datetime.date:
+    """Primer día del mes que se está mostrando (por defecto el actual)."""
+    return st.session_state.get(f"fc_mes_{id_atleta}") or datetime.date.today().replace(day=1)
+
+
+def _mover_mes(id_atleta, delta: int | None):
+    """Callback de navegación: delta meses adelante/atrás, None vuelve a hoy."""
+    mes = _mes_visible(id_atleta)
+    if delta is None:
+        mes = datetime.date.today().replace(day=1)
+    else:
+        total = mes.year * 12 + mes.month - 1 + delta
+        mes = datetime.date(total // 12, total % 12 + 1, 1)
+    st.session_state[f"fc_mes_{id_atleta}"] = mes
+
+
+def ventana_visible(id_atleta) -> tuple[datetime.date, datetime.date]:
+    """Rango de fechas a cargar para el calendario: mes visible ± PREFETCH_DIAS."""
+    inicio = _mes_visible(id_atleta)
+    fin = (inicio + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+    margen = datetime.timedelta(days=PREFETCH_DIAS)
+    return inicio - margen, fin + margen
+
+
+def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario", rango=None):
     """
     Renderiza un calendario interactivo tipo TrainingPeaks usando streamlit-calendar.
     - eventos: lista de diccionarios con al menos 'start' (YYYY-MM-DD) y 'allDay'.
     - id_atleta: necesario para registrar nuevos estados diarios.
+    - rango: (fecha_inicio, fecha_fin) del filtro de fechas, si lo hay (cualquiera puede ser None).
+      Sin filtro se muestra la ventana por meses de `ventana_visible`.
     """
     import json
 
@@ -38,184 +270,51 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
     rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
     usuario_id = st.session_state.get("USUARIO_ID", 0)
     if rol_actual == "atleta":
-        id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+        id_atleta_forzado = identidad.id_atleta_de(usuario_id)
     else:
         id_atleta_forzado = id_atleta
 
-    # Helper interno para normalizar extendedProps
-    def normalize_details(details: dict) -> dict:
-        safe = {}
-        for k, v in (details or {}).items():
-            if v is None:
-                continue
-            if isinstance(v, (str, int, float, bool)):
-                safe[k] = v
-            elif isinstance(v, (datetime.date, datetime.datetime)):
-                safe[k] = v.isoformat()
-            else:
-                safe[k] = str(v)
-        return safe
-
     # ───────────────────────────────
     # Inicialización robusta
     # ───────────────────────────────
     # Normalizamos la lista de eventos
     src_events = fc_events if isinstance(fc_events, list) else []
-    out_events = []
 
     st.markdown("### 🗓️ Calendario interactivo")
 
-    # Construcción de eventos agrupados por día
-    for ev in src_events:
-        fecha = ev.get("start")
-        if not fecha:
-            continue
+    # Construcción de eventos agrupados por día (memoizada por evento)
+    out_events = _proyectar_eventos(src_events, id_atleta_forzado)
+
+    if rango is None:
+        # Navegación por meses desde Streamlit: solo se cargan los eventos de la ventana visible
+        mes_visible = _mes_visible(id_atleta_forzado)
+        desde, hasta = ventana_visible(id_atleta_forzado)
+        nav_prev, nav_hoy, nav_next = st.columns([1, 1, 1])
+        nav_prev.button("◀ Mes anterior", key=f"fc_prev_{id_atleta_forzado}",
+                        on_click=_mover_mes, args=(id_atleta_forzado, -1), width="stretch")
+        nav_hoy.button("📅 Hoy", key=f"fc_hoy_{id_atleta_forzado}",
+                       on_click=_mover_mes, args=(id_atleta_forzado, None), width="stretch")
+        nav_next.button("Mes siguiente ▶", key=f"fc_next_{id_atleta_forzado}",
+                        on_click=_mover_mes, args=(id_atleta_forzado, 1), width="stretch")
+    else:
+        # Filtro de fechas: ya está cargado todo el rango, FullCalendar navega dentro de él
+        desde, hasta = rango
+        mes_visible = (desde or hasta or datetime.date.today()).replace(day=1)
 
-        tipo = ev.get("Tipo") or ev.get("tipo_evento")
-        details = ev.get("extendedProps", {})
-
-        if tipo == "estado_diario":
-            safe_details = normalize_details(details)
-            extended = {**safe_details, "tipo_evento": tipo, "id_base": ev.get("id")}
-
-            valores_neutros = [None, "", "No", "Ninguno", "-", False]
-
-            # Bloque 1: ciclo
-            fila_ciclo = []
-            if details.get("sintomas") not in valores_neutros: fila_ciclo.append("🩸")
-            if details.get("menstruacion") not in valores_neutros: fila_ciclo.append("🩸")
-            if details.get("ovulacion") not in valores_neutros: fila_ciclo.append("🔄")
-            if fila_ciclo:
-                out_events.append({"id": f"{ev.get('id')}-ciclo", "title": " ".join(fila_ciclo),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 0}})
-
-            # Bloque 2: condiciones externas
-            fila_cond = []
-            if details.get("altitud"): fila_cond.append("⛰️")
-            if details.get("calor"): fila_cond.append("🔥")
-            if details.get("respiratorio"): fila_cond.append("🌬️")
-            if fila_cond:
-                out_events.append({"id": f"{ev.get('id')}-cond", "title": " ".join(fila_cond),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 1}})
-
-            # Bloque 3: lesiones / baja / notas
-            fila_extra = []
-            if details.get("lesion"): fila_extra.append("🤕")
-            if details.get("baja") and details.get("baja") != "No":
-                fila_extra.append("⛔")
-            if details.get("comentario_extra"): fila_extra.append("📝")
-            if fila_extra:
-                out_events.append({"id": f"{ev.get('id')}-extra", "title": " ".join(fila_extra),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 2}})
-
-            # Bloque 4: peso/déficit
-            fila_peso = []
-            if details.get("peso"): fila_peso.append(f"⚖️ {details['peso']}")
-            if details.get("deficit_calorico"): fila_peso.append("🍽️")
-            if fila_peso:
-                out_events.append({"id": f"{ev.get('id')}-peso", "title": " ".join(fila_peso),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 3}})
-
-            # Bloque 5: HRV / FC reposo
-            fila_hrv = []
-            if details.get("hrv"): fila_hrv.append(f"💓 {details['hrv']}")
-            if details.get("fc_reposo"): fila_hrv.append(f"❤️ {details['fc_reposo']}")
-            if fila_hrv:
-                out_events.append({"id": f"{ev.get('id')}-hrv", "title": " ".join(fila_hrv),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 4}})
-
-            # Bloque 6: sueño / wellness / RPE
-            fila_sueno = []
-            if details.get("sueno"): fila_sueno.append(f"😴 {details['sueno']}h")
-            if details.get("wellness"): fila_sueno.append(f"🌟 {details['wellness']}")
-            if details.get("rpe"): fila_sueno.append(f"💪 {details['rpe']}")
-            if fila_sueno:
-                out_events.append({"id": f"{ev.get('id')}-sueno", "title": " ".join(fila_sueno),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 5}})
-
-        elif tipo == "competicion":
-            # Solo icono 🏆, detalles en extendedProps
-            safe_details = normalize_details(details)
-            out_events.append({
-                "id": str(ev.get("id")),
-                "title": "🏆",
-                "start": fecha,
-                "allDay": True,
-                "backgroundColor": "#FFFFFF",
-                "borderColor": "#FFFFFF",
-                "textColor": "#000000",
-                "tipo_evento": tipo,
-                "extendedProps": {**safe_details, "displayOrder": 3, "tipo_evento": tipo, "id_base": ev.get("id")}
-            })
-
-        elif tipo == "cita_test":
-            # Solo icono 📅, detalles en extendedProps
-            safe_details = normalize_details(details)
-            out_events.append({
-                "id": str(ev.get("id")),
-                "title": "📅",
-                "start": fecha,
-                "allDay": True,
-                "backgroundColor": EVENT_STYLES["cita_test"]["bg"],
-                "borderColor": EVENT_STYLES["cita_test"]["border"],
-                "textColor": EVENT_STYLES["cita_test"]["text"],
-                "tipo_evento": tipo,
-                "extendedProps": {**safe_details, "displayOrder": 3, "tipo_evento": tipo, "id_base": ev.get("id")}
-            })
-
-        elif tipo == "metricas_rapidas":
-            safe_details = normalize_details(details)
-            extended = {**safe_details, "tipo_evento": tipo, "id_base": ev.get("id")}
-
-            # Bloque A: peso / déficit
-            fila_peso = []
-            if safe_details.get("peso"): fila_peso.append(f"⚖️ {safe_details['peso']}kg")
-            if safe_details.get("deficit_calorico"):
-                fila_peso.append(f"🍽️ {safe_details['deficit_calorico']}")
-            if fila_peso:
-                out_events.append({"id": f"{ev.get('id')}-peso", "title": " ".join(fila_peso),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 3}})
-
-            # Bloque B: HRV / FC reposo
-            fila_hrv = []
-            if safe_details.get("hrv"): fila_hrv.append(f"💓 {safe_details['hrv']}")
-            if safe_details.get("fc_reposo"): fila_hrv.append(f"❤️ {safe_details['fc_reposo']}")
-            if fila_hrv:
-                out_events.append({"id": f"{ev.get('id')}-hrv", "title": " ".join(fila_hrv),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 4}})
-
-            # Bloque C: sueño / wellness / RPE
-            fila_sueno = []
-            if safe_details.get("sueno"): fila_sueno.append(f"😴 {safe_details['sueno']}h")
-            if safe_details.get("wellness"): fila_sueno.append(f"🌟 {safe_details['wellness']}")
-            if safe_details.get("rpe"): fila_sueno.append(f"💪 {safe_details['rpe']}")
-            if fila_sueno:
-                out_events.append({"id": f"{ev.get('id')}-sueno", "title": " ".join(fila_sueno),
-                    "start": fecha, "allDay": True, "backgroundColor": "#FFFFFF",
-                    "borderColor": "#FFFFFF", "textColor": "#000000",
-                    "tipo_evento": tipo, "extendedProps": {**extended, "displayOrder": 5}})
+    # Fuera del rango cargado no hay eventos: FullCalendar no deja navegar hasta allí
+    rango_valido = {}
+    if desde:
+        rango_valido["start"] = desde.isoformat()
+    if hasta:
+        rango_valido["end"] = (hasta + datetime.timedelta(days=1)).isoformat()
 
     # Configuración del calendario (sin eventContent, usamos saltos de línea en title)
     calendar_options = {
         "initialView": "dayGridMonth",
+        "initialDate": mes_visible.isoformat(),
+        "validRange": rango_valido,
         "headerToolbar": {
-            "left": "prev,next today",
+            "left": "prev,next",
             "center": "title",
             "right": "dayGridMonth,timeGridWeek,listWeek"
         },
@@ -233,12 +332,13 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
 
     # Renderizar calendario (ahora \n se interpreta como salto de línea)
     # Renderizar calendario (una sola vez)
-    # 🔑 Usamos un key único combinando id_atleta y vista
+    # 🔑 Usamos un key único combinando id_atleta, vista y mes (al cambiar de mes se
+    # vuelve a montar en initialDate)
 
     cal = calendar(
         events=out_events,
         options=calendar_options,
-        key=f"calendar_{id_atleta if id_atleta is not None else 'none'}_{vista}"
+        key=f"calendar_{id_atleta if id_atleta is not None else 'none'}_{vista}_{mes_visible:%Y-%m}_{desde}_{hasta}"
     )
 
     # Modal de registro al hacer clic en un día vacío
@@ -284,7 +384,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
             usuario_id = st.session_state.get("USUARIO_ID", 0)
             if rol_actual == "atleta":
                 # 🔒 Forzamos que el atleta solo pueda registrar en su propio calendario
-                id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                id_atleta_forzado = identidad.id_atleta_de(usuario_id)
             else:
                 id_atleta_forzado = id_atleta
 
@@ -357,7 +457,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                         rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                         usuario_id = st.session_state.get("USUARIO_ID", 0)
                         if rol_actual == "atleta":
-                            id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                            id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                         else:
                             id_atleta_forzado = id_atleta
 
@@ -386,7 +486,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                         rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                         usuario_id = st.session_state.get("USUARIO_ID", 0)
                         if rol_actual == "atleta":
-                            id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                            id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                         else:
                             id_atleta_forzado = id_atleta
 
@@ -420,36 +520,37 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                         rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                         usuario_id = st.session_state.get("USUARIO_ID", 0)
                         if rol_actual == "atleta":
-                            id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                            id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                         else:
                             id_atleta_forzado = id_atleta
 
-                        # Guardamos en tabla métricas (histórico) con la fecha del evento
-                        if hrv != 0: 
-                            sql.crear_metrica(id_atleta_forzado, "hrv", hrv, "ms", fecha=fecha_local)
-                        if wellness != 0:
-                            sql.crear_metrica(id_atleta_forzado, "wellness", wellness, "score", fecha=fecha_local)
-                        if rpe != 0:
-                            sql.crear_metrica(id_atleta_forzado, "rpe", rpe, "score", fecha=fecha_local)
-                        if peso != 0.0:
-                            sql.crear_metrica(id_atleta_forzado, "peso", peso, "kg", fecha=fecha_local)
-                        if fc_reposo != 0:
-                            sql.crear_metrica(id_atleta_forzado, "fc_reposo", fc_reposo, "lpm", fecha=fecha_local)
-
-                        # Creamos también un evento de calendario para que aparezca en la cuadrícula
-                        sql.crear_evento_calendario(
-                            id_atleta=id_atleta_forzado,
-                            fecha=str(fecha_local),
-                            tipo_evento="metricas_rapidas",
-                            valor={k: v for k, v in {
-                                "hrv": hrv,
-                                "wellness": wellness,
-                                "rpe": rpe,
-                                "peso": peso,
-                                "fc_reposo": fc_reposo
-                            }.items() if v != 0},
-                            notas="Métricas rápidas registradas"
-                        )
+                        # Histórico y evento de calendario en una sola transacción (un commit, un backup)
+                        with sql.transaccion():
+                            # Guardamos en tabla métricas (histórico) con la fecha del evento, en un solo upsert
+                            sql.upsert_metricas(id_atleta_forzado, fecha_local, {
+                                tipo: (valor, unidad) for tipo, valor, unidad in [
+                                    ("hrv", hrv, "ms"),
+                                    ("wellness", wellness, "score"),
+                                    ("rpe", rpe, "score"),
+                                    ("peso", peso, "kg"),
+                                    ("fc_reposo", fc_reposo, "lpm"),
+                                ] if valor != 0
+                            })
+
+                            # Creamos también un evento de calendario para que aparezca en la cuadrícula
+                            sql.crear_evento_calendario(
+                                id_atleta=id_atleta_forzado,
+                                fecha=str(fecha_local),
+                                tipo_evento="metricas_rapidas",
+                                valor={k: v for k, v in {
+                                    "hrv": hrv,
+                                    "wellness": wellness,
+                                    "rpe": rpe,
+                                    "peso": peso,
+                                    "fc_reposo": fc_reposo
+                                }.items() if v != 0},
+                                notas="Métricas rápidas registradas"
+                            )
 
                         st.success("✅ Métricas rápidas registradas")
                         st.rerun()
@@ -510,7 +611,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                             rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                             usuario_id = st.session_state.get("USUARIO_ID", 0)
                             if rol_actual == "atleta":
-                                id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                                id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                             else:
                                 id_atleta_forzado = id_atleta
 
@@ -559,7 +660,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                             rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                             usuario_id = st.session_state.get("USUARIO_ID", 0)
                             if rol_actual == "atleta":
-                                id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                                id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                             else:
                                 id_atleta_forzado = id_atleta
 
@@ -603,7 +704,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                             rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                             usuario_id = st.session_state.get("USUARIO_ID", 0)
                             if rol_actual == "atleta":
-                                id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                                id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                             else:
                                 id_atleta_forzado = id_atleta
 
@@ -634,7 +735,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                             rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                             usuario_id = st.session_state.get("USUARIO_ID", 0)
                             if rol_actual == "atleta":
-                                id_atleta = sql.obtener_id_atleta_por_usuario(usuario_id)
+                                id_atleta = identidad.id_atleta_de(usuario_id)
                             ctx_evento = Contexto(
                                 rol_actual=rol_actual,
                                 usuario_id=usuario_id,
@@ -673,7 +774,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                             rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                             usuario_id = st.session_state.get("USUARIO_ID", 0)
                             if rol_actual == "atleta":
-                                id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                                id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                             else:
                                 id_atleta_forzado = id_atleta
 
@@ -704,7 +805,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                             rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                             usuario_id = st.session_state.get("USUARIO_ID", 0)
                             if rol_actual == "atleta":
-                                id_atleta = sql.obtener_id_atleta_por_usuario(usuario_id)
+                                id_atleta = identidad.id_atleta_de(usuario_id)
                             ctx_evento = Contexto(
                                 rol_actual=rol_actual,
                                 usuario_id=usuario_id,
@@ -753,24 +854,21 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                         # Guardamos en histórico (tabla métricas) con la fecha del evento
                         fecha_evento = ev.get("start") or fecha_local
                         if rol_actual == "atleta":
-                            id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                            id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                         else:
                             id_atleta_forzado = id_atleta
 
-                        if peso != 0.0:
-                            sql.crear_metrica(id_atleta_forzado, "peso", peso, "kg", fecha=fecha_evento)
-                        if deficit_calorico:
-                            sql.crear_metrica(id_atleta_forzado, "deficit_calorico", deficit_calorico, "kcal", fecha=fecha_evento)
-                        if hrv != 0:
-                            sql.crear_metrica(id_atleta_forzado, "hrv", hrv, "ms", fecha=fecha_evento)
-                        if fc_reposo != 0:
-                            sql.crear_metrica(id_atleta_forzado, "fc_reposo", fc_reposo, "lpm", fecha=fecha_evento)
-                        if sueno != 0.0:
-                            sql.crear_metrica(id_atleta_forzado, "sueno", sueno, "h", fecha=fecha_evento)
-                        if wellness != 0:
-                            sql.crear_metrica(id_atleta_forzado, "wellness", wellness, "score", fecha=fecha_evento)
-                        if rpe != 0:
-                            sql.crear_metrica(id_atleta_forzado, "rpe", rpe, "score", fecha=fecha_evento)
+                        sql.upsert_metricas(id_atleta_forzado, fecha_evento, {
+                            tipo: (valor, unidad) for tipo, valor, unidad in [
+                                ("peso", peso, "kg"),
+                                ("deficit_calorico", deficit_calorico, "kcal"),
+                                ("hrv", hrv, "ms"),
+                                ("fc_reposo", fc_reposo, "lpm"),
+                                ("sueno", sueno, "h"),
+                                ("wellness", wellness, "score"),
+                                ("rpe", rpe, "score"),
+                            ] if valor
+                        })
 
                         # Actualizamos el evento existente en calendario_eventos
                         event_id = props.get("id_base") or ev.get("id")
@@ -779,7 +877,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                             rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                             usuario_id = st.session_state.get("USUARIO_ID", 0)
                             if rol_actual == "atleta":
-                                id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                                id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                             else:
                                 id_atleta_forzado = id_atleta
 
@@ -816,7 +914,7 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                             rol_actual = st.session_state.get("ROL_SIMULADO", st.session_state.get("ROL_ACTUAL", "admin"))
                             usuario_id = st.session_state.get("USUARIO_ID", 0)
                             if rol_actual == "atleta":
-                                id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                                id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                             else:
                                 id_atleta_forzado = id_atleta
 
@@ -827,10 +925,11 @@ def mostrar_calendario_interactivo(fc_events, id_atleta, vista="Calendario"):
                                 propietario_id=id_atleta_forzado
                             )
                             if ctx_evento.rol_actual == "admin" or puede_borrar_evento_calendario(ctx_evento):
-                                eliminado = sql.borrar_evento_calendario(int(event_id))
-                                # 🔒 Además borramos métricas rápidas asociadas en BD
                                 fecha_evento = ev.get("start") or fecha_local
-                                borradas = sql.borrar_metricas_por_fecha(id_atleta_forzado, fecha_evento)
+                                with sql.transaccion():
+                                    eliminado = sql.borrar_evento_calendario(int(event_id))
+                                    # 🔒 Además borramos métricas rápidas asociadas en BD
+                                    borradas = sql.borrar_metricas_por_fecha(id_atleta_forzado, fecha_evento)
                                 if eliminado or borradas > 0:
                                     st.success("🗑️ Métricas rápidas eliminadas")
                                     st.rerun()
@@ -4,14 +4,14 @@ import src.persistencia.sql as sql
 
 # Importar control de roles
 from src.utils.roles import Contexto, puede_editar_perfil_atleta
+from src.utils import identidad
 from src.utils.seguridad import hash_password
 
 def mostrar_perfil(rol_actual="admin", usuario_id=None):
     st.header("👤 Perfil de Atleta")
 
     if rol_actual in ["entrenadora", "atleta"]:
-        usuarios = sql.obtener_usuarios()
-        nombre_usuario = next((u.nombre for u in usuarios if u.id_usuario == usuario_id), "—")
+        nombre_usuario = identidad.nombre_de(usuario_id)
         st.caption(f"🔐 Rol activo: {rol_actual} | Usuario: {nombre_usuario} (ID {usuario_id})")
     elif rol_actual == "admin":
         st.caption("🔐 Rol activo: admin")
@@ -25,13 +25,13 @@ def mostrar_perfil(rol_actual="admin", usuario_id=None):
 
         try:
             ruta_db = os.path.abspath(sql.engine.url.database)
-            num_usuarios = len(sql.obtener_usuarios())
-            num_atletas = len(sql.obtener_atletas())
-            num_eventos = len(sql.obtener_eventos())
+            conteos = sql.contar_entidades()
+            num_usuarios = conteos["tablas"]["usuarios"]
+            num_atletas = conteos["tablas"]["atletas"]
+            num_eventos = conteos["tablas"]["eventos"]
 
-            backups = backup_storage.listar_backups()
-            if backups:
-                ultimo = sorted(backups, key=lambda b: b["createdTime"], reverse=True)[0]
+            ultimo = backup_storage.ultimo_backup()
+            if ultimo:
                 fecha_backup = ultimo["createdTime"]
                 nombre_backup = ultimo["name"]
                 backup_info = f"📦 Último backup: {nombre_backup} ({fecha_backup})"
@@ -40,6 +40,10 @@ def mostrar_perfil(rol_actual="admin", usuario_id=None):
 
             st.info(f"🛠️ Base de datos activa: {ruta_db}")
             st.info(f"👥 Usuarios: {num_usuarios} | 🏃‍♂️ Atletas: {num_atletas} | 📅 Eventos: {num_eventos}")
+            st.info(
+                f"💽 Tamaño: {conteos['bytes'] / 1024 / 1024:.2f} MB | "
+                f"Páginas: {conteos['paginas']} × {conteos['tam_pagina']} B ({conteos['paginas_libres']} libres)"
+            )
             st.info(backup_info)
 
         except Exception as e:
@@ -53,7 +57,7 @@ def mostrar_perfil(rol_actual="admin", usuario_id=None):
     # Caso especial: atleta puede crear solo su propio perfil si aún no existe
     if rol_actual == "atleta":
         # 🔒 Blindaje: obtener directamente el atleta vinculado al usuario
-        id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+        id_atleta_forzado = identidad.id_atleta_de(usuario_id)
         atleta_obj = sql.obtener_atleta_por_id(id_atleta_forzado) if id_atleta_forzado else None
 
         if not atleta_obj:   # 🔑 solo si no tiene ninguno
@@ -115,7 +119,7 @@ def mostrar_perfil(rol_actual="admin", usuario_id=None):
                         # 🔒 El atleta solo puede crear su propio perfil vinculado a su usuario
                         atleta_usuario_id = usuario_id
                         propietario_id = usuario_id
-                        id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+                        id_atleta_forzado = identidad.id_atleta_de(usuario_id)
                     else:
                         atleta_usuario_id = None
                         propietario_id = None
@@ -171,7 +175,7 @@ def mostrar_perfil(rol_actual="admin", usuario_id=None):
 
     elif rol_actual == "atleta":
         # 🔒 Blindaje: el atleta solo puede ver su propio perfil
-        id_atleta_vinculado = sql.obtener_id_atleta_por_usuario(usuario_id)
+        id_atleta_vinculado = identidad.id_atleta_de(usuario_id)
         atleta_obj = sql.obtener_atleta_por_id(id_atleta_vinculado) if id_atleta_vinculado else None
         atletas = [atleta_obj] if atleta_obj else []
     else:
@@ -258,7 +262,7 @@ def mostrar_perfil(rol_actual="admin", usuario_id=None):
     # ───────────────────────────────
     # 🔒 Blindaje: si es atleta, forzar su propio id_atleta en el contexto
     if rol_actual == "atleta":
-        id_atleta_forzado = sql.obtener_id_atleta_por_usuario(usuario_id)
+        id_atleta_forzado = identidad.id_atleta_de(usuario_id)
         atleta = sql.obtener_atleta_por_id(id_atleta_forzado) if id_atleta_forzado else None
 
     ctx = Contexto(
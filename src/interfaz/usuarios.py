@@ -16,13 +16,13 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
 
         try:
             ruta_db = os.path.abspath(sql.engine.url.database)
-            num_usuarios = len(sql.obtener_usuarios())
-            num_atletas = len(sql.obtener_atletas())
-            num_eventos = len(sql.obtener_eventos())
+            conteos = sql.contar_entidades()
+            num_usuarios = conteos["tablas"]["usuarios"]
+            num_atletas = conteos["tablas"]["atletas"]
+            num_eventos = conteos["tablas"]["eventos"]
 
-            backups = backup_storage.listar_backups()
-            if backups:
-                ultimo = sorted(backups, key=lambda b: b["createdTime"], reverse=True)[0]
+            ultimo = backup_storage.ultimo_backup()
+            if ultimo:
                 fecha_backup = ultimo["createdTime"]
                 nombre_backup = ultimo["name"]
                 backup_info = f"📦 Último backup: {nombre_backup} ({fecha_backup})"
@@ -31,6 +31,10 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
 
             st.info(f"🛠️ Base de datos activa: {ruta_db}")
             st.info(f"👥 Usuarios: {num_usuarios} | 🏃‍♂️ Atletas: {num_atletas} | 📅 Eventos: {num_eventos}")
+            st.info(
+                f"💽 Tamaño: {conteos['bytes'] / 1024 / 1024:.2f} MB | "
+                f"Páginas: {conteos['paginas']} × {conteos['tam_pagina']} B ({conteos['paginas_libres']} libres)"
+            )
             st.info(backup_info)
 
         except Exception as e:
@@ -69,12 +73,12 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
                     st.error("Nombre, email y contraseña son obligatorios")
                 else:
                     ph = hash_password(password)
-                    usuario = sql.crear_usuario(nombre=nombre, email=email, rol=rol, password_hash=ph)
-                    st.success(f"✅ Usuario '{usuario.nombre}' creado correctamente con contraseña inicial")
-
-                    if rol == "atleta":
-                        if perfil_seleccionado_id:
-                            try:
+                    usuario = None
+                    try:
+                        # Alta y vínculo con el perfil en un único commit: o todo o nada
+                        with sql.transaccion():
+                            usuario = sql.crear_usuario(nombre=nombre, email=email, rol=rol, password_hash=ph)
+                            if rol == "atleta" and perfil_seleccionado_id:
                                 sql.actualizar_usuario(
                                     id_usuario=usuario.id_usuario,
                                     perfil_atleta_id=perfil_seleccionado_id
@@ -83,9 +87,16 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
                                     perfil_seleccionado_id,
                                     atleta_usuario_id=usuario.id_usuario
                                 )
-                                st.success(f"🔗 Usuario atleta asociado al perfil ID {perfil_seleccionado_id}.")
-                            except Exception as e:
-                                st.warning(f"No se pudo asociar al perfil seleccionado: {e}")
+                    except Exception as e:
+                        usuario = None
+                        st.error(f"No se pudo crear el usuario: {e}")
+
+                    if usuario:
+                        st.success(f"✅ Usuario '{usuario.nombre}' creado correctamente con contraseña inicial")
+
+                    if usuario and rol == "atleta":
+                        if perfil_seleccionado_id:
+                            st.success(f"🔗 Usuario atleta asociado al perfil ID {perfil_seleccionado_id}.")
                         else:
                             # Intento de autoasociación inmediata por nombre+apellidos
                             candidatos = [
@@ -97,14 +108,15 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
                             if len(candidatos) == 1:
                                 a = candidatos[0]
                                 try:
-                                    sql.actualizar_usuario(
-                                        id_usuario=usuario.id_usuario,
-                                        perfil_atleta_id=a.id_atleta
-                                    )
-                                    sql.actualizar_atleta(
-                                        a.id_atleta,
-                                        usuario_id=usuario.id_usuario
-                                    )
+                                    with sql.transaccion():
+                                        sql.actualizar_usuario(
+                                            id_usuario=usuario.id_usuario,
+                                            perfil_atleta_id=a.id_atleta
+                                        )
+                                        sql.actualizar_atleta(
+                                            a.id_atleta,
+                                            usuario_id=usuario.id_usuario
+                                        )
                                     st.success(f"🔗 Usuario atleta autoasociado al perfil '{a.nombre}' (ID {a.id_atleta}).")
                                 except Exception as e:
                                     st.warning(f"No se pudo completar la autoasociación: {e}")
@@ -118,7 +130,8 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
     # ───────────────────────────────
     st.subheader("📋 Usuarios registrados")
 
-    usuarios = sql.obtener_usuarios()
+    # Una sola consulta: usuario + perfil vinculado + entrenadora del perfil
+    usuarios = sql.obtener_usuarios_con_perfil()
     if not usuarios:
         st.info("No hay usuarios registrados todavía")
         return
@@ -131,11 +144,8 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
         "Creado en": u.creado_en.strftime("%Y-%m-%d %H:%M") if isinstance(u.creado_en, datetime) else str(u.creado_en),
         # 🔑 Si es atleta, mostramos entrenadora del perfil asociado con blindaje
         "Entrenadora asignada": (
-            sql.obtener_atleta_por_id(u.perfil_atleta_id).usuario.nombre
-            if u.rol == "atleta"
-            and u.perfil_atleta_id
-            and sql.obtener_atleta_por_id(u.perfil_atleta_id)
-            and sql.obtener_atleta_por_id(u.perfil_atleta_id).usuario
+            u.entrenadora_nombre
+            if u.rol == "atleta" and u.entrenadora_nombre
             else "—"
         )
     } for u in usuarios])
@@ -165,11 +175,8 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
                 - **Email:** {usuario.email}
                 - **Rol:** {usuario.rol}
                 - **Creado en:** {usuario.creado_en}
-                {"- **Entrenadora asignada:** " + sql.obtener_atleta_por_id(usuario.perfil_atleta_id).usuario.nombre
-                 if usuario.rol == "atleta"
-                 and getattr(usuario, "perfil_atleta_id", None)
-                 and sql.obtener_atleta_por_id(usuario.perfil_atleta_id)
-                 and sql.obtener_atleta_por_id(usuario.perfil_atleta_id).usuario
+                {"- **Entrenadora asignada:** " + usuario.entrenadora_nombre
+                 if usuario.rol == "atleta" and usuario.entrenadora_nombre
                  else ""}
                 """)
     else:
@@ -230,8 +237,9 @@ def mostrar_usuarios(rol_actual: str, usuario_id: int):
                         # 🔗 Asociación en edición
                         if nuevo_rol == "atleta" and perfil_edicion_id:
                             try:
-                                sql.actualizar_usuario(id_usuario=usuario.id_usuario, perfil_atleta_id=perfil_edicion_id)
-                                sql.actualizar_atleta(perfil_edicion_id, atleta_usuario_id=usuario.id_usuario)
+                                with sql.transaccion():
+                                    sql.actualizar_usuario(id_usuario=usuario.id_usuario, perfil_atleta_id=perfil_edicion_id)
+                                    sql.actualizar_atleta(perfil_edicion_id, atleta_usuario_id=usuario.id_usuario)
                                 st.success(f"🔗 Usuario atleta asociado al perfil ID {perfil_edicion_id} en edición.")
                             except Exception as e:
                                 st.warning(f"No se pudo asociar al perfil en edición: {e}")
@@ -0,0 +1,177 @@
+"""
+Programador de backups en segundo plano.
+Las escrituras solo marcan la base como "sucia"; un hilo daemon agrupa todas
+las marcas dentro de una ventana de debounce y ejecuta una única subida.
+"""
+
+import atexit
+import os
+import threading
+import time
+
+# ─────────────────────────────────────────────
+# CONFIGURACIÓN
+# ─────────────────────────────────────────────
+
+# Segundos sin escrituras antes de lanzar la subida
+DEBOUNCE_SEGUNDOS = float(os.getenv("BACKUP_DEBOUNCE_SEGUNDOS", "10"))
+# Máximo que puede retrasarse una subida con escrituras continuas
+MAX_ESPERA_SEGUNDOS = float(os.getenv("BACKUP_MAX_ESPERA_SEGUNDOS", "60"))
+# Tope del reintento exponencial tras un fallo
+MAX_REINTENTO_SEGUNDOS = float(os.getenv("BACKUP_MAX_REINTENTO_SEGUNDOS", "300"))
+
+
+class BackupScheduler:
+    """Agrupa marcas de escritura y ejecuta `tarea` una vez por ventana.
+
+    Cada marca incrementa una generación; una subida correcta deja como
+    durables todas las generaciones marcadas antes de empezar.
+    """
+
+    def __init__(self, tarea, debounce=DEBOUNCE_SEGUNDOS, max_espera=MAX_ESPERA_SEGUNDOS):
+        self._tarea = tarea
+        self.debounce = debounce
+        self.max_espera = max_espera
+        self._cond = threading.Condition()
+        self._generacion = 0        # última generación marcada
+        self._durable = 0           # última generación subida con éxito
+        self._fallos_totales = 0    # subidas fallidas desde el arranque (solo crece)
+        self._fallos_seguidos = 0   # fallos desde la última subida correcta (backoff)
+        self._primera_marca = None  # inicio de la ventana actual
+        self._ultima_marca = None
+        self._urgente = False
+        self._parar = False
+        self._hilo = None
+        self.ultimo_error = None
+        self.subidas = 0
+
+    # --- API pública ---
+
+    def marcar_sucio(self) -> int:
+        """Registra una escritura y devuelve su generación."""
+        with self._cond:
+            self._generacion += 1
+            ahora = time.monotonic()
+            self._ultima_marca = ahora
+            if self._primera_marca is None:
+                self._primera_marca = ahora
+            # Una escritura tras flush() reactiva el hilo aunque siga vivo: sin esto
+            # la ventana de debounce se saltaría y subiría al instante
+            self._parar = False
+            self._arrancar()
+            self._cond.notify_all()
+            return self._generacion
+
+    def pendiente(self) -> bool:
+        with self._cond:
+            return self._durable < self._generacion
+
+    def esperar_durable(self, timeout: float | None = None) -> bool:
+        """
+        Fuerza la subida de lo pendiente y bloquea hasta que esté en Drive.
+        Devuelve False si vence el timeout o el intento falla.
+        """
+        with self._cond:
+            objetivo = self._generacion
+            if self._durable >= objetivo:
+                return True
+            fallidos_previos = self._fallos_totales
+            self._urgente = True
+            self._arrancar()
+            self._cond.notify_all()
+            limite = None if timeout is None else time.monotonic() + timeout
+            while self._durable < objetivo:
+                if self._fallos_totales > fallidos_previos:
+                    return False
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante)
+            return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Sube lo pendiente y detiene el hilo (uso al apagar el proceso)."""
+        ok = self.esperar_durable(timeout)
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+        return ok
+
+    # --- Internos ---
+
+    def _arrancar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._parar = False
+            self._hilo = threading.Thread(target=self._bucle, name="backup-scheduler", daemon=True)
+            self._hilo.start()
+
+    def _esperar_ventana(self):
+        """Bloquea hasta que toque subir; devuelve la generación objetivo o None para salir."""
+        with self._cond:
+            while True:
+                if self._durable >= self._generacion:
+                    if self._parar:
+                        return None
+                    self._cond.wait()
+                    continue
+                if self._urgente or self._parar:
+                    break
+                ahora = time.monotonic()
+                espera = self.debounce
+                if self._fallos_seguidos:
+                    espera = min(self.debounce * 2 ** self._fallos_seguidos, MAX_REINTENTO_SEGUNDOS)
+                limite = min(self._ultima_marca + espera, self._primera_marca + max(espera, self.max_espera))
+                if ahora >= limite:
+                    break
+                self._cond.wait(limite - ahora)
+            self._primera_marca = None
+            self._urgente = False
+            return self._generacion
+
+    def _bucle(self):
+        while True:
+            objetivo = self._esperar_ventana()
+            if objetivo is None:
+                return
+            try:
+                self._tarea()
+                ok = True
+            except Exception as e:
+                ok = False
+                self.ultimo_error = e
+                print(f"⚠️ Error en backup programado: {e}")
+            with self._cond:
+                if ok:
+                    self._durable = max(self._durable, objetivo)
+                    self._fallos_seguidos = 0
+                    self.ultimo_error = None
+                    self.subidas += 1
+                else:
+                    self._fallos_totales += 1
+                    self._fallos_seguidos += 1
+                    if self._parar:
+                        self._cond.notify_all()
+                        return
+                    # Reabrimos ventana para reintentar con backoff
+                    ahora = time.monotonic()
+                    self._primera_marca = ahora
+                    self._ultima_marca = ahora
+                self._cond.notify_all()
+
+
+_programadores: list[BackupScheduler] = []
+
+
+def crear_programador(tarea, **kwargs) -> BackupScheduler:
+    """Crea un programador y lo registra para el flush al salir del proceso."""
+    programador = BackupScheduler(tarea, **kwargs)
+    _programadores.append(programador)
+    return programador
+
+
+@atexit.register
+def _flush_al_salir():
+    for programador in _programadores:
+        if programador.pendiente():
+            print("💾 Subiendo backup pendiente antes de salir...")
+            programador.flush(timeout=MAX_ESPERA_SEGUNDOS)
@@ -4,19 +4,42 @@ Encapsula autenticación y operaciones CRUD sobre backups.
 Versión OAuth (con refresh tokens desde st.secrets["google_drive"]).
 """
 
-from datetime import datetime
+from datetime import datetime, timezone
 import streamlit as st
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, MediaFileUpload, MediaIoBaseDownload
 import io
 import os
 import json
 import requests
 import time
-import shutil
 import threading
 from datetime import timedelta
-from src.persistencia import sql
+from src.persistencia import snapshot
+
+# Modo de backup: "completo" (artefacto compactado en cada subida) o "delta" (solo páginas cambiadas)
+MODO_BACKUP = os.getenv("BACKUP_MODO", "completo")
+# En modo delta, nº máximo de parches antes de subir una base completa nueva
+DELTA_MAX_PARCHES = int(os.getenv("BACKUP_DELTA_MAX_PARCHES", "24"))
+# Si cambia más de esta proporción de páginas, compensa subir una base nueva
+DELTA_MAX_PROPORCION = float(os.getenv("BACKUP_DELTA_MAX_PROPORCION", "0.5"))
+# Timeout de cada petición HTTP a Drive
+HTTP_TIMEOUT = int(os.getenv("DRIVE_HTTP_TIMEOUT", "60"))
+# Segundos que el catálogo local se da por bueno sin volver a listar Drive
+CATALOGO_TTL = int(os.getenv("BACKUP_CATALOGO_TTL", "300"))
+# Copia en disco del catálogo (sobrevive a los reinicios del proceso)
+CATALOGO_PATH = os.getenv("BACKUP_CATALOGO_PATH", os.path.join("/tmp", "backups_catalogo.json"))
+# Política de retención: últimos N + uno por día durante D días + uno por semana durante S semanas
+RETENER_ULTIMOS = int(os.getenv("BACKUP_RETENER_ULTIMOS", "5"))
+RETENER_DIARIOS = int(os.getenv("BACKUP_RETENER_DIARIOS", "7"))
+RETENER_SEMANALES = int(os.getenv("BACKUP_RETENER_SEMANALES", "4"))
+# Drive admite como máximo 100 llamadas por petición batch
+BATCH_MAX_PETICIONES = 100
+# Campos de Drive que guarda el catálogo por cada backup
+CAMPOS_BACKUP = "id, name, createdTime, size, md5Checksum, appProperties"
 
 def _load_oauth_cfg():
     """Carga configuración OAuth desde st.secrets['google_drive']."""
@@ -73,28 +96,215 @@ def _ensure_access_token(cfg: dict) -> str:
         return _refresh_access_token(cfg)
     return token
 
+class _SesionDrive:
+    """
+    Cliente Drive compartido por todo el proceso (thread-safe).
+    - La configuración y el token se cargan una vez; el token se reutiliza hasta `expires_at`
+      y las credenciales se refrescan solas al caducar.
+    - `build` se llama una sola vez (discovery estático, sin petición HTTP).
+    - Cada hilo reutiliza su propio transporte autorizado (httplib2 no es thread-safe).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cfg = None
+        self._creds = None
+        self._service = None
+        self._local = threading.local()
+
+    def cfg(self):
+        with self._lock:
+            if self._cfg is None:
+                self._cfg = _load_oauth_cfg()  # no cacheamos None: se reintenta en la próxima llamada
+            return self._cfg
+
+    def servicio(self):
+        with self._lock:
+            if self._service is not None:
+                return self._service
+            cfg = self.cfg()
+            if not cfg:
+                return None
+            token = _ensure_access_token(cfg)
+            if not token:
+                return None
+            try:
+                from google.oauth2.credentials import Credentials
+                self._creds = Credentials(
+                    token=token,
+                    refresh_token=cfg["refresh_token"],
+                    token_uri=cfg["token_uri"],
+                    client_id=cfg["client_id"],
+                    client_secret=cfg["client_secret"],
+                    scopes=[cfg["scope"]],
+                    # google-auth espera UTC naive
+                    expiry=datetime.fromtimestamp(int(cfg["expires_at"]), timezone.utc).replace(tzinfo=None),
+                )
+                self._service = build(
+                    "drive", "v3",
+                    http=self._http(),
+                    requestBuilder=self._crear_request,
+                    cache_discovery=False,
+                    static_discovery=True,
+                )
+            except Exception as e:
+                st.error(f"❌ Error al inicializar cliente Drive (OAuth): {e}")
+                self._creds = None
+                return None
+            return self._service
+
+    def reiniciar(self):
+        """Descarta token y cliente (p.ej. tras cambiar los secrets)."""
+        with self._lock:
+            self._cfg = None
+            self._creds = None
+            self._service = None
+            self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None or http.credentials is not self._creds:
+            http = AuthorizedHttp(self._creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            self._local.http = http
+        return http
+
+    def _crear_request(self, http, *args, **kwargs):
+        # Cada petición usa el transporte del hilo que la ejecuta
+        return HttpRequest(self._http(), *args, **kwargs)
+
+
+_sesion = _SesionDrive()
+
 def _get_service():
-    """Inicializa cliente Drive usando OAuth tokens desde secrets."""
-    cfg = _load_oauth_cfg()
-    if not cfg:
-        return None
-    token = _ensure_access_token(cfg)
-    if not token:
-        return None
-    try:
-        from google.oauth2.credentials import Credentials
-        creds = Credentials(
-            token=token,
-            refresh_token=cfg["refresh_token"],
-            token_uri=cfg["token_uri"],
-            client_id=cfg["client_id"],
-            client_secret=cfg["client_secret"],
-            scopes=[cfg["scope"]],
-        )
-        return build("drive", "v3", credentials=creds, cache_discovery=False)
-    except Exception as e:
-        st.error(f"❌ Error al inicializar cliente Drive (OAuth): {e}")
-        return None
+    """Devuelve el cliente Drive del proceso (se construye la primera vez)."""
+    return _sesion.servicio()
+
+def reiniciar_sesion_drive():
+    """Fuerza a recargar secrets, token y cliente en la próxima llamada."""
+    _sesion.reiniciar()
+
+# --- Catálogo local de backups ---
+
+class _CatalogoBackups:
+    """
+    Índice local de los backups de la carpeta Drive (memoria + JSON en disco).
+    - La subida y la rotación lo actualizan al momento, sin volver a listar Drive.
+    - Solo se refresca contra Drive al vencer CATALOGO_TTL o cuando se pide.
+    - Cada cambio incrementa `version` y avisa a los suscriptores.
+    """
+
+    def __init__(self, ruta: str):
+        self._lock = threading.RLock()
+        self._ruta = ruta
+        self._backups = []       # ordenados por createdTime desc
+        self._refrescado = 0.0   # epoch del último listado completo en Drive
+        self._cargado = False
+        self._suscriptores = []
+        self.version = 0
+
+    def vigente(self) -> bool:
+        with self._lock:
+            self._cargar()
+            return time.time() - self._refrescado < CATALOGO_TTL
+
+    def listar(self, max_results: int | None = None) -> list[dict]:
+        with self._lock:
+            self._cargar()
+            return [dict(b) for b in self._backups[:max_results]]
+
+    def ultimo(self) -> dict | None:
+        with self._lock:
+            self._cargar()
+            return dict(self._backups[0]) if self._backups else None
+
+    def reemplazar(self, backups: list[dict]) -> None:
+        with self._lock:
+            self._backups = [_entrada_catalogo(b) for b in backups]
+            self._refrescado = time.time()
+        self._cambiado()
+
+    def anadir(self, backup: dict) -> None:
+        with self._lock:
+            self._cargar()
+            resto = [b for b in self._backups if b["id"] != backup["id"]]
+            self._backups = _ordenar_backups([_entrada_catalogo(backup)] + resto)
+        self._cambiado()
+
+    def quitar(self, ids) -> None:
+        ids = set(ids)
+        with self._lock:
+            self._cargar()
+            self._backups = [b for b in self._backups if b["id"] not in ids]
+        self._cambiado()
+
+    def invalidar(self) -> None:
+        """Fuerza a listar Drive en la próxima consulta."""
+        with self._lock:
+            self._refrescado = 0.0
+
+    def suscribir(self, callback) -> None:
+        with self._lock:
+            self._suscriptores.append(callback)
+
+    def _cargar(self):
+        if self._cargado:
+            return
+        self._cargado = True
+        try:
+            with open(self._ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            self._backups = _ordenar_backups(datos.get("backups", []))
+            self._refrescado = float(datos.get("refrescado", 0))
+        except (OSError, ValueError):
+            pass
+
+    def _cambiado(self):
+        with self._lock:
+            self.version += 1
+            datos = {"refrescado": self._refrescado, "backups": self._backups}
+            tmp = self._ruta + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(datos, f)
+                os.replace(tmp, self._ruta)
+            except OSError as e:
+                print(f"⚠️ No se pudo guardar el catálogo de backups: {e}")
+            backups = [dict(b) for b in self._backups]
+            suscriptores = list(self._suscriptores)
+        # Avisamos fuera del lock: un suscriptor puede volver a consultar el catálogo
+        for callback in suscriptores:
+            try:
+                callback(backups)
+            except Exception as e:
+                print(f"⚠️ Error en suscriptor del catálogo de backups: {e}")
+
+
+def _entrada_catalogo(backup: dict) -> dict:
+    campos = ("id", "name", "createdTime", "size", "md5Checksum", "appProperties")
+    return {k: backup[k] for k in campos if backup.get(k) is not None}
+
+def _ordenar_backups(backups: list[dict]) -> list[dict]:
+    # createdTime es ISO 8601 en UTC: el orden de texto es el cronológico
+    return sorted(backups, key=lambda b: b.get("createdTime", ""), reverse=True)
+
+
+_catalogo = _CatalogoBackups(CATALOGO_PATH)
+
+def ultimo_backup() -> dict | None:
+    """Último backup conocido según el catálogo local (sin llamar a Drive salvo TTL vencido)."""
+    if not _catalogo.vigente():
+        try:
+            listar_backups(refrescar=True)
+        except Exception as e:
+            print(f"⚠️ No se pudo refrescar el catálogo de backups: {e}")
+    return _catalogo.ultimo()
+
+def suscribir_catalogo(callback) -> None:
+    """Registra `callback(backups)`; se llama tras cada cambio del catálogo."""
+    _catalogo.suscribir(callback)
+
+def invalidar_catalogo() -> None:
+    _catalogo.invalidar()
 
 # --- Funciones públicas ---
 
@@ -107,12 +317,10 @@ def subir_backup(local_path: str, remote_name: str = None) -> str:
     if service is None:
         return ""
 
-    cfg = _load_oauth_cfg()
-    folder_id = cfg.get("folder_id", "")
+    folder_id = _sesion.cfg().get("folder_id", "")
     if not folder_id:
         st.error("❌ No se ha configurado folder_id en secrets[google_drive].")
-        return []
-    query = f"'{folder_id}' in parents and trashed=false"
+        return ""
     if remote_name is None:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base = os.path.basename(local_path)
@@ -120,102 +328,394 @@ def subir_backup(local_path: str, remote_name: str = None) -> str:
         remote_name = f"{name}_{timestamp}{ext}"
 
     file_metadata = {"name": remote_name, "parents": [folder_id]}
-    media = MediaFileUpload(local_path, resumable=True)
 
-    # Ejecuta con header Authorization Bearer
-    access_token = _ensure_access_token(cfg)
-    if not access_token:
-        return ""
-    try:
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields="id, name"
-        ).execute(http=service._http)  # http ya usa creds Bearer
-    except Exception:
-        # En algunos entornos, googleapiclient toma creds del objeto service; si falla, reconstruimos con creds Bearer
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields="id, name"
-        ).execute()
+    # Si es una base SQLite (posiblemente en uso) subimos un artefacto compactado y comprimido
+    # a partir de un snapshot consistente, no el fichero vivo
+    if snapshot.es_sqlite(local_path) and MODO_BACKUP == "delta":
+        return _subir_incremental(service, file_metadata, local_path)
+    if snapshot.es_sqlite(local_path):
+        with snapshot.artefacto_temporal(local_path) as (ruta_artefacto, formato, sha256, huella):
+            extension = snapshot.EXTENSIONES.get(formato, "")
+            if not file_metadata["name"].endswith(extension):
+                file_metadata["name"] += extension
+            # Marcador de formato para que la restauración sepa cómo descomprimir
+            file_metadata["appProperties"] = {"formato": formato, "sha256": sha256}
+            file = _crear_archivo(service, file_metadata, ruta_artefacto)
+        _guardar_meta_local(local_path, file, huella, "subida")
+    else:
+        file = _crear_archivo(service, file_metadata, local_path)
 
     return file.get("id")
 
-def listar_backups(max_results: int = 10) -> list[dict]:
+# --- Metadatos de la base local (sidecar) ---
+# `<db>.meta.json` registra qué backup de Drive corresponde al contenido local
+# (tras subirlo o restaurarlo), para no descargar de nuevo una base idéntica al arrancar.
+
+def _ruta_meta(local_path: str) -> str:
+    return local_path + ".meta.json"
+
+def leer_meta_local(local_path: str) -> dict | None:
+    """Devuelve {remote_id, md5Checksum, huella, origen, fecha} o None si no hay sidecar."""
+    try:
+        with open(_ruta_meta(local_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _guardar_meta_local(local_path: str, file: dict, huella: str, origen: str) -> None:
+    meta = {
+        "remote_id": file.get("id"),
+        "md5Checksum": file.get("md5Checksum"),
+        "huella": huella,
+        "origen": origen,
+        "fecha": datetime.now(timezone.utc).isoformat(),
+    }
+    tmp = _ruta_meta(local_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _ruta_meta(local_path))
+
+# --- Backups incrementales (modo delta) ---
+
+def _ruta_manifest(local_path: str) -> str:
+    return local_path + ".manifest.json"
+
+def _leer_manifest(local_path: str) -> dict | None:
+    try:
+        with open(_ruta_manifest(local_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _guardar_manifest(local_path: str, manifest: dict) -> None:
+    tmp = _ruta_manifest(local_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, _ruta_manifest(local_path))
+
+def _borrar_manifest(local_path: str) -> None:
+    if os.path.exists(_ruta_manifest(local_path)):
+        os.remove(_ruta_manifest(local_path))
+
+def _subir_incremental(service, file_metadata: dict, local_path: str) -> str:
+    """
+    Modo delta: compara los hashes de página del snapshot con el manifest local
+    del último backup y sube solo las páginas cambiadas como parche.
+    Cada DELTA_MAX_PARCHES parches (o si cambia demasiado) sube una base completa nueva.
+    """
+    manifest = _leer_manifest(local_path)
+    formato = snapshot.FORMATO_COMPRESION
+    extension = snapshot.EXTENSIONES.get(formato, "")
+    with snapshot.snapshot_temporal(local_path) as ruta_snapshot:
+        page_size, hashes = snapshot.hashes_paginas(ruta_snapshot)
+        sha256 = snapshot.sha256_fichero(ruta_snapshot)
+        huella = snapshot.huella_contenido(ruta_snapshot)
+
+        cambiadas = None
+        if manifest and manifest.get("page_size") == page_size:
+            previos = manifest["hashes"]
+            cambiadas = [n for n, h in enumerate(hashes) if n >= len(previos) or previos[n] != h]
+            if not cambiadas and len(hashes) == len(previos):
+                return manifest["ultimo_id"]  # nada nuevo que subir
+
+        nueva_base = (
+            cambiadas is None
+            or manifest["secuencia"] >= DELTA_MAX_PARCHES
+            or len(cambiadas) > len(hashes) * DELTA_MAX_PROPORCION
+        )
+        artefacto = ruta_snapshot + (".base" if nueva_base else ".delta") + extension
+        try:
+            if nueva_base:
+                snapshot.comprimir(ruta_snapshot, artefacto, formato)
+                metadata = {
+                    **file_metadata,
+                    "name": file_metadata["name"] + extension,
+                    "appProperties": {"formato": formato, "sha256": sha256, "tipo": "base"},
+                }
+            else:
+                secuencia = manifest["secuencia"] + 1
+                cabecera = {
+                    "base_id": manifest["base_id"],
+                    "secuencia": secuencia,
+                    "page_size": page_size,
+                    "paginas_totales": len(hashes),
+                    "sha256": sha256,
+                }
+                snapshot.escribir_parche(ruta_snapshot, cambiadas, cabecera, artefacto, formato)
+                metadata = {
+                    **file_metadata,
+                    "name": file_metadata["name"] + ".delta" + extension,
+                    "appProperties": {
+                        "formato": formato, "sha256": sha256, "tipo": "delta",
+                        "base_id": manifest["base_id"], "secuencia": str(secuencia),
+                    },
+                }
+            file = _crear_archivo(service, metadata, artefacto)
+        finally:
+            if os.path.exists(artefacto):
+                os.remove(artefacto)
+
+    file_id = file.get("id")
+    if nueva_base:
+        manifest = {"base_id": file_id, "secuencia": 0}
+    else:
+        manifest = {**manifest, "secuencia": manifest["secuencia"] + 1}
+        print(f"🧩 Parche {manifest['secuencia']} subido: {len(cambiadas)}/{len(hashes)} páginas")
+    manifest.update({"page_size": page_size, "hashes": hashes, "sha256": sha256, "ultimo_id": file_id})
+    _guardar_manifest(local_path, manifest)
+    _guardar_meta_local(local_path, file, huella, "subida")
+    return file_id
+
+def _reconstruir_incremental(service, props: dict, destino: str) -> None:
+    """Descarga la base de la cadena y le aplica en orden los parches 1..secuencia."""
+    base_id = props["base_id"]
+    objetivo = int(props["secuencia"])
+    parches = service.files().list(
+        q=f"appProperties has {{ key='base_id' and value='{base_id}' }} and trashed=false",
+        pageSize=1000,
+        fields="files(id, appProperties)"
+    ).execute().get("files", [])
+    por_secuencia = {int(p["appProperties"]["secuencia"]): p["id"] for p in parches}
+    faltan = [n for n in range(1, objetivo + 1) if n not in por_secuencia]
+    if faltan:
+        raise RuntimeError(f"Cadena incremental incompleta, faltan parches {faltan}")
+
+    _descargar_fichero(service, base_id, destino)
+    tmp_parche = destino + ".parche"
+    try:
+        for n in range(1, objetivo + 1):
+            _descargar_fichero(service, por_secuencia[n], tmp_parche, descomprimir=False)
+            cabecera = snapshot.aplicar_parche(tmp_parche, destino)
+            if cabecera.get("secuencia") != n or cabecera.get("base_id") != base_id:
+                raise RuntimeError(f"Parche {n} no pertenece a la cadena {base_id}")
+    finally:
+        if os.path.exists(tmp_parche):
+            os.remove(tmp_parche)
+
+def _crear_archivo(service, file_metadata: dict, ruta: str) -> dict:
+    media = MediaFileUpload(ruta, resumable=True)
+    # El transporte autorizado (Bearer) lo aporta la sesión Drive del hilo actual
+    file = service.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields=CAMPOS_BACKUP
+    ).execute()
+    _catalogo.anadir(file)
+    return file
+
+def listar_backups(max_results: int | None = 10, refrescar: bool = False) -> list[dict]:
     """
-    Lista los últimos backups en la carpeta de Drive.
-    Devuelve una lista de diccionarios con id, nombre y fecha.
+    Lista los últimos backups (más reciente primero) desde el catálogo local.
+    Solo consulta Drive si el catálogo ha caducado o con `refrescar=True`.
+    Devuelve diccionarios con id, name, createdTime, size, md5Checksum y appProperties.
     """
+    if not refrescar and _catalogo.vigente():
+        return _catalogo.listar(max_results)
+
     service = _get_service()
     if service is None:
         return []
 
-    cfg = _load_oauth_cfg()
-    folder_id = cfg.get("folder_id", "")
+    folder_id = _sesion.cfg().get("folder_id", "")
     query = f"'{folder_id}' in parents and trashed=false"
 
-    access_token = _ensure_access_token(cfg)
-    if not access_token:
-        return []
-    results = service.files().list(
-        q=query,
-        pageSize=max_results,
-        orderBy="createdTime desc",
-        fields="files(id, name, createdTime, size)"
-    ).execute()
+    backups, token = [], None
+    while True:
+        results = service.files().list(
+            q=query,
+            pageSize=1000,
+            pageToken=token,
+            orderBy="createdTime desc",
+            fields=f"nextPageToken, files({CAMPOS_BACKUP})"
+        ).execute()
+        backups.extend(results.get("files", []))
+        token = results.get("nextPageToken")
+        if not token:
+            break
 
-    return results.get("files", [])
+    _catalogo.reemplazar(backups)
+    return _catalogo.listar(max_results)
+
+def borrar_backup(file_id: str) -> None:
+    """Elimina un backup de Drive y del catálogo local (si ya no existía, solo del catálogo)."""
+    service = _get_service()
+    if service is None:
+        return
+    try:
+        service.files().delete(fileId=file_id).execute()
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+    _catalogo.quitar([file_id])
 
 
-def rotar_backups(max_backups: int = 5) -> None:
+def rotar_backups(max_backups: int = RETENER_ULTIMOS, diarios: int = RETENER_DIARIOS,
+                  semanales: int = RETENER_SEMANALES) -> int:
     """
-    Mantiene solo los últimos N backups en la carpeta de Drive.
-    Elimina los más antiguos.
+    Aplica la política de retención: últimos N + uno por día (D días) + uno por semana (S semanas).
+    La decisión se toma con el catálogo local; solo se llama a Drive si hay algo que borrar,
+    y los borrados van en peticiones batch. Devuelve el nº de backups eliminados.
     """
+    backups = listar_backups(max_results=None)  # todos, desde el catálogo
+    sobrantes = _backups_a_rotar(backups, max_backups, diarios, semanales)
+    if not sobrantes:
+        return 0
     service = _get_service()
     if service is None:
-        return
+        return 0
+    return _borrar_en_batch(service, [b["id"] for b in sobrantes])
+
+def _borrar_en_batch(service, ids: list[str]) -> int:
+    """Borra ficheros de Drive agrupando hasta BATCH_MAX_PETICIONES por petición HTTP."""
+    borrados, errores = [], []
+
+    def al_responder(request_id, response, exception):
+        # 404: ya no existía (p.ej. lo rotó otra instancia); basta con quitarlo del catálogo
+        if exception is None or (isinstance(exception, HttpError) and exception.resp.status == 404):
+            borrados.append(request_id)
+        else:
+            errores.append(f"{request_id}: {exception}")
+
+    for i in range(0, len(ids), BATCH_MAX_PETICIONES):
+        batch = service.new_batch_http_request(callback=al_responder)
+        for file_id in ids[i:i + BATCH_MAX_PETICIONES]:
+            batch.add(service.files().delete(fileId=file_id), request_id=file_id)
+        batch.execute()
 
-    backups = listar_backups(max_results=100)  # obtenemos todos
-    if len(backups) > max_backups:
-        for old in backups[max_backups:]:
-            service.files().delete(fileId=old["id"]).execute()
+    _catalogo.quitar(borrados)
+    if errores:
+        print(f"⚠️ Rotación: {len(errores)} borrados fallidos ({'; '.join(errores[:3])})")
+    return len(borrados)
+
+def _backups_a_rotar(backups: list[dict], max_backups: int, diarios: int = 0,
+                     semanales: int = 0, ahora: datetime | None = None) -> list[dict]:
+    """
+    Decide qué borrar. Se conservan los `max_backups` puntos más recientes, el más
+    reciente de cada uno de los últimos `diarios` días y el de cada una de las
+    últimas `semanales` semanas ISO.
+    Si el backup más reciente es una base o un parche, su cadena (base + parches)
+    cuenta como un único punto de restauración y nunca se rompe; los parches de
+    cadenas antiguas se borran porque su base ya no es la vigente.
+    """
+    props = lambda b: b.get("appProperties") or {}
+    # Solo el backup más reciente decide (vienen ordenados por createdTime desc): si es
+    # una subida completa, las cadenas anteriores ya no son las vigentes y no se protegen
+    cadena = set()
+    ultimo = props(backups[0]) if backups else {}
+    if ultimo.get("tipo") == "delta":
+        base_id = ultimo["base_id"]
+        cadena = {base_id} | {x["id"] for x in backups if props(x).get("base_id") == base_id}
+    elif ultimo.get("tipo") == "base":
+        cadena = {backups[0]["id"]}
+
+    puntos = [b for b in backups if props(b).get("tipo") != "delta"]
+    conservar = set(cadena)
+    restantes = max_backups - (1 if cadena else 0)
+    for b in puntos:
+        if restantes <= 0:
+            break
+        if b["id"] not in cadena:
+            conservar.add(b["id"])
+            restantes -= 1
+
+    ahora = ahora or datetime.now(timezone.utc)
+    dias, semanas = set(), set()
+    for b in puntos:
+        fecha = datetime.fromisoformat(b["createdTime"].replace("Z", "+00:00"))
+        dia = fecha.date()
+        if (ahora.date() - dia).days < diarios and dia not in dias:
+            dias.add(dia)
+            conservar.add(b["id"])
+        semana = fecha.isocalendar()[:2]
+        if ahora - fecha < timedelta(weeks=semanales) and semana not in semanas:
+            semanas.add(semana)
+            conservar.add(b["id"])
+
+    return [b for b in backups if b["id"] not in conservar]
 
 
 def descargar_backup(file_id: str, destino: str) -> None:
     """
     Descarga un backup desde Drive y lo guarda en destino local.
+    Descomprime de forma transparente y, si es un parche incremental,
+    reconstruye base + parches. Valida el sha256 cuando el backup lo registra.
+    """
+    tmp_base = destino + ".restaurando"
+    try:
+        info = descargar_backup_verificado(file_id, tmp_base)
+        if info is None:
+            return
+        os.replace(tmp_base, destino)
+    finally:
+        if os.path.exists(tmp_base):
+            os.remove(tmp_base)
+    registrar_restauracion(destino, info)
+
+def descargar_backup_verificado(file_id: str, ruta: str) -> dict | None:
+    """
+    Descarga (y reconstruye si es delta) el backup en `ruta` sin tocar la base activa
+    y comprueba su sha256. Devuelve los metadatos del fichero en Drive (None sin servicio).
     """
     service = _get_service()
     if service is None:
-        return
+        return None
+
+    info = service.files().get(fileId=file_id, fields="id, name, md5Checksum, appProperties").execute()
+    props = info.get("appProperties") or {}
+    try:
+        if props.get("tipo") == "delta":
+            _reconstruir_incremental(service, props, ruta)
+        else:
+            _descargar_fichero(service, file_id, ruta)
+        if props.get("sha256") and snapshot.sha256_fichero(ruta) != props["sha256"]:
+            raise RuntimeError(f"Checksum incorrecto al restaurar {info.get('name')}")
+    except Exception:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        raise
+    return info
 
-    request = service.files().get_media(fileId=file_id)
-    fh = io.FileIO(destino, "wb")
-    downloader = MediaIoBaseDownload(fh, request)
+def registrar_restauracion(destino: str, info: dict) -> None:
+    """Tras sustituir `destino` por el backup `info`: invalida el manifest y escribe el sidecar."""
+    # La base local ya no coincide con el manifest: el próximo backup delta será una base nueva
+    _borrar_manifest(destino)
+    if snapshot.es_sqlite(destino):
+        _guardar_meta_local(destino, info, snapshot.huella_contenido(destino), "restauración")
 
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
+def _descargar_fichero(service, file_id: str, destino: str, descomprimir: bool = True) -> None:
+    """Descarga un fichero de Drive por bloques; por defecto lo descomprime en streaming (zstd/gzip)."""
+    tmp_descarga = destino + ".descarga"
+    try:
+        request = service.files().get_media(fileId=file_id)
+        with io.FileIO(tmp_descarga, "wb") as fh:
+            downloader = MediaIoBaseDownload(fh, request, chunksize=snapshot.TAMANO_BLOQUE * 8)
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+        if descomprimir:
+            snapshot.descomprimir(tmp_descarga, destino)
+        else:
+            os.replace(tmp_descarga, destino)
+    finally:
+        if os.path.exists(tmp_descarga):
+            os.remove(tmp_descarga)
 
 # --- Funciones de blindaje y automatización ---
 
-def crear_backup_async():
+def crear_backup_async(ruta_db: str):
     """
     Crea un backup en segundo plano:
-    - Copia temporal de la base local (.bak)
+    - Snapshot consistente de la base local (API de backup de SQLite)
     - Subida a Drive
     - Rotación automática
     - Registro en session_state
     """
     def tarea():
         try:
-            tmp_path = sql.DB_PATH + ".bak"
-            shutil.copy(sql.DB_PATH, tmp_path)
-            file_id = subir_backup(tmp_path)
+            # subir_backup toma el snapshot; ya no pisamos el .bak de restauración
+            file_id = subir_backup(ruta_db)
             if file_id:
-                rotar_backups(max_backups=5)
+                rotar_backups()
                 st.session_state["LAST_BACKUP"] = datetime.now()
                 print(f"✅ Backup creado: {file_id}")
             else:
@@ -224,11 +724,11 @@ def crear_backup_async():
             print(f"❌ Excepción en backup: {e}")
     threading.Thread(target=tarea, daemon=True).start()
 
-def backup_diario():
+def backup_diario(ruta_db: str):
     """
     Dispara un backup automático si han pasado más de 24h desde el último.
     """
     last = st.session_state.get("LAST_BACKUP")
     if not last or datetime.now() - last > timedelta(hours=24):
-        crear_backup_async()
+        crear_backup_async(ruta_db)
 
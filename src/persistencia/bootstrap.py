@@ -0,0 +1,266 @@
+"""
+Arranque de la base de datos local.
+Máquina de estados que se ejecuta una vez por proceso en un hilo de fondo:
+comprobar_local → comparar_remoto → descargar (solo si la copia local no es la
+última de Drive; incluye migrar) → migrar. La interfaz muestra un aviso mientras tanto en lugar
+de bloquear el import de `sql` esperando a Drive.
+"""
+
+import os
+import shutil
+import threading
+import time
+
+import streamlit as st
+
+from src.persistencia import backup_storage
+from src.persistencia import snapshot
+from src.persistencia import sql
+
+# ─────────────────────────────────────────────
+# CONFIGURACIÓN
+# ─────────────────────────────────────────────
+
+# Máximo que la interfaz espera al arranque antes de mostrar un error
+TIMEOUT_SEGUNDOS = float(os.getenv("BOOTSTRAP_TIMEOUT_SEGUNDOS", "120"))
+# Base semilla del repositorio, usada si no hay copia local válida ni backup accesible
+RUTA_SEMILLA = "base.db"
+
+ETAPAS = {
+    "pendiente": "en espera",
+    "comprobar_local": "comprobando base local",
+    "comparar_remoto": "consultando el último backup en Drive",
+    "descargar": "descargando backup",
+    "migrar": "aplicando migraciones",
+    "listo": "lista",
+    "error": "error",
+}
+
+
+class _Arranque:
+    """Estado del arranque del proceso; `tiempos` guarda los segundos de cada etapa."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._terminado = threading.Event()
+        self._hilo = None
+        self.etapa = "pendiente"
+        self.origen = None   # "local", "drive", "semilla" o "vacía"
+        self.error = None
+        self.tiempos = {}
+        self.inicio = None
+        self.duracion = None
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is not None and self.etapa != "error":
+                return
+            self._terminado.clear()
+            self.error = None
+            self.tiempos = {}
+            self.inicio = time.monotonic()
+            self.duracion = None
+            self._hilo = threading.Thread(target=self._ejecutar, name="bootstrap-db", daemon=True)
+            self._hilo.start()
+
+    def esperar(self, timeout: float | None = None) -> bool:
+        return self._terminado.wait(timeout)
+
+    def _etapa(self, nombre, funcion, *args):
+        self.etapa = nombre
+        t0 = time.monotonic()
+        try:
+            return funcion(*args)
+        finally:
+            self.tiempos[nombre] = time.monotonic() - t0
+
+    def _ejecutar(self):
+        try:
+            local_ok = self._etapa("comprobar_local", _base_local_valida, sql.DB_PATH)
+            remoto_ok, ultimo = self._etapa("comparar_remoto", _ultimo_backup_remoto)
+
+            if ultimo and not (local_ok and _coincide(ultimo, sql.DB_PATH)):
+                try:
+                    self._etapa("descargar", restaurar_fichero, ultimo["id"])
+                    self.origen = "drive"
+                    print(f"📦 Restaurado backup inicial desde Drive: {ultimo['name']}")
+                except Exception as e:
+                    print(f"⚠️ Error al restaurar backup inicial: {e}")
+                    self.origen = "local" if local_ok else _sembrar(sql.DB_PATH)
+            elif local_ok:
+                self.origen = "local"
+                if ultimo:
+                    print("ℹ️ La base local ya coincide con el último backup: no se descarga.")
+                else:
+                    print("ℹ️ Sin backup remoto disponible: se usa la base local.")
+            else:
+                self.origen = _sembrar(sql.DB_PATH)
+
+            # Tras una restauración la base ya viene migrada (restaurar_fichero)
+            if self.origen != "drive":
+                self._etapa("migrar", sql.migrar)
+            # Sin backups en Drive (y Drive accesible): subimos la base actual como primero
+            if remoto_ok and not ultimo:
+                sql._sync_backup()
+            self.etapa = "listo"
+        except Exception as e:
+            self.error = e
+            self.etapa = "error"
+            print(f"❌ Error en el arranque de la base: {e}")
+        finally:
+            self.duracion = time.monotonic() - self.inicio
+            detalle = " | ".join(f"{k} {v:.2f}s" for k, v in self.tiempos.items())
+            print(f"⏱️ Arranque de la base en {self.duracion:.2f}s ({detalle})")
+            self._terminado.set()
+
+
+def _base_local_valida(ruta: str) -> bool:
+    if not snapshot.es_sqlite(ruta):
+        return False
+    try:
+        snapshot.verificar_integridad(ruta)
+        return True
+    except Exception as e:
+        print(f"⚠️ Base local descartada: {e}")
+        return False
+
+
+def _ultimo_backup_remoto():
+    """Devuelve (drive_accesible, último backup o None)."""
+    try:
+        if backup_storage._get_service() is None:
+            return False, None
+        # Al arrancar siempre listamos Drive: el catálogo en disco puede ser de otra instancia
+        backups = backup_storage.listar_backups(max_results=1, refrescar=True)
+        return True, (backups[0] if backups else None)
+    except Exception as e:
+        print(f"⚠️ Error al consultar backups en Drive: {e}")
+        return False, None
+
+
+def _coincide(backup: dict, ruta: str) -> bool:
+    """
+    True si la base local ya es el contenido de `backup`, según el sidecar
+    (`<db>.meta.json`, escrito tras cada subida o restauración): mismo id y md5 en Drive
+    y la huella local no ha cambiado desde entonces. Sin sidecar se descarga siempre:
+    el sha256 del backup es el del artefacto compactado (VACUUM INTO), que nunca
+    coincide byte a byte con una base que ha abierto el motor.
+    """
+    meta = backup_storage.leer_meta_local(ruta)
+    return bool(
+        meta
+        and meta.get("remote_id") == backup.get("id")
+        and meta.get("md5Checksum") == backup.get("md5Checksum")
+        and meta.get("huella") == snapshot.huella_contenido(ruta)
+    )
+
+
+def _sembrar(ruta: str) -> str:
+    """Sin copia local ni backup: copia la base semilla del repo o deja una vacía."""
+    if os.path.exists(RUTA_SEMILLA) and snapshot.es_sqlite(RUTA_SEMILLA):
+        shutil.copy(RUTA_SEMILLA, ruta)
+        print("📄 Copiado base.db local al /tmp como semilla.")
+        return "semilla"
+    open(ruta, "wb").close()
+    print("ℹ️ No hay backups en Drive: se iniciará base vacía.")
+    return "vacía"
+
+
+_arranque = _Arranque()
+
+# ─────────────────────────────────────────────
+# API PÚBLICA
+# ─────────────────────────────────────────────
+
+def iniciar() -> None:
+    """Lanza el arranque en segundo plano (una vez por proceso; reintenta si falló)."""
+    _arranque.iniciar()
+
+
+def ejecutar(timeout: float | None = None) -> bool:
+    """Arranque síncrono para scripts: devuelve True si la base quedó lista."""
+    iniciar()
+    _arranque.esperar(timeout)
+    return _arranque.etapa == "listo"
+
+
+def lista() -> bool:
+    return _arranque.etapa == "listo"
+
+
+def estado() -> dict:
+    """Foto del arranque: etapa, origen, error, tiempos por etapa y duración total."""
+    transcurrido = _arranque.duracion
+    if transcurrido is None and _arranque.inicio is not None:
+        transcurrido = time.monotonic() - _arranque.inicio
+    return {
+        "etapa": _arranque.etapa,
+        "origen": _arranque.origen,
+        "error": _arranque.error,
+        "tiempos": dict(_arranque.tiempos),
+        "duracion": transcurrido,
+    }
+
+
+def esperar_en_ui(timeout: float = TIMEOUT_SEGUNDOS) -> bool:
+    """
+    Muestra un aviso "restaurando…" con la etapa en curso hasta que la base esté lista.
+    Devuelve False (tras mostrar el error) si el arranque falla o supera `timeout`.
+    """
+    iniciar()
+    if not _arranque.esperar(0):
+        aviso = st.empty()
+        limite = time.monotonic() + timeout
+        while not _arranque.esperar(0.25):
+            info = estado()
+            if time.monotonic() >= limite:
+                aviso.error(
+                    f"❌ La base no estuvo lista en {timeout:.0f}s "
+                    f"(etapa: {ETAPAS[info['etapa']]}). Recarga la página para reintentar."
+                )
+                return False
+            aviso.info(f"⏳ Restaurando base de datos… {ETAPAS[info['etapa']]} ({info['duracion']:.1f}s)")
+        aviso.empty()
+    if _arranque.etapa == "error":
+        st.error(f"❌ No se pudo preparar la base de datos: {_arranque.error}")
+        iniciar()  # reintento en la próxima recarga
+        return False
+    return True
+
+
+def restaurar_fichero(file_id: str) -> None:
+    """
+    Sustituye la base activa por un backup de Drive y la migra. La descarga va a un
+    temporal sin tocar la base; después, con los checkouts del pool bloqueados
+    (`sql.fichero_bloqueado`), se borran los -wal/-shm de la base anterior, se
+    reemplaza el fichero y se migra antes de dejar pasar a nadie más.
+    """
+    temporal = sql.DB_PATH + ".descargado"
+    try:
+        info = backup_storage.descargar_backup_verificado(file_id, temporal)
+        if info is None:
+            raise RuntimeError("Drive no disponible")
+        with sql.fichero_bloqueado():
+            for sufijo in ("-wal", "-shm", "-journal"):
+                if os.path.exists(sql.DB_PATH + sufijo):
+                    os.remove(sql.DB_PATH + sufijo)
+            os.replace(temporal, sql.DB_PATH)
+            backup_storage.registrar_restauracion(sql.DB_PATH, info)
+            sql.migrar()
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def restaurar_backup(file_id: str) -> str:
+    """
+    Restauración manual desde la UI: guarda antes una copia consistente de la base
+    actual en `.bak` y restaura (ya migrada). Devuelve la ruta de la copia.
+    """
+    copia = sql.DB_PATH + ".bak"
+    if snapshot.es_sqlite(sql.DB_PATH):
+        if os.path.exists(copia):
+            os.remove(copia)
+        snapshot.crear_snapshot(sql.DB_PATH, copia)
+    restaurar_fichero(file_id)
+    return copia
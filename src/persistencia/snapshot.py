@@ -0,0 +1,339 @@
+"""
+Snapshots consistentes de la base SQLite.
+Usa la API de backup online de sqlite3 (copia incremental por páginas) para
+obtener una copia puntual sin bloquear a los escritores de la app, y genera
+artefactos compactados (VACUUM INTO) y comprimidos en streaming para Drive.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import zstandard as zstd
+except ImportError:  # dependencia opcional: sin ella usamos gzip
+    zstd = None
+
+# ─────────────────────────────────────────────
+# CONFIGURACIÓN
+# ─────────────────────────────────────────────
+
+# Páginas copiadas por paso; entre pasos se libera el lock de lectura
+PAGINAS_POR_PASO = int(os.getenv("SNAPSHOT_PAGINAS_POR_PASO", "256"))
+# Pausa entre pasos para dejar pasar a los escritores
+PAUSA_ENTRE_PASOS = float(os.getenv("SNAPSHOT_PAUSA_SEGUNDOS", "0.005"))
+# Cada escritura ajena reinicia la copia incremental; tras N reinicios copiamos en un solo paso
+MAX_REINICIOS = int(os.getenv("SNAPSHOT_MAX_REINICIOS", "3"))
+
+# Formato de compresión de los artefactos: "zstd", "gzip" o "ninguno"
+FORMATO_COMPRESION = os.getenv("BACKUP_COMPRESION", "zstd" if zstd else "gzip")
+# Tamaño de bloque para leer/escribir en streaming
+TAMANO_BLOQUE = 1024 * 1024
+
+CABECERA_SQLITE = b"SQLite format 3\x00"
+CABECERA_GZIP = b"\x1f\x8b"
+CABECERA_ZSTD = b"\x28\xb5\x2f\xfd"
+
+EXTENSIONES = {"zstd": ".zst", "gzip": ".gz", "ninguno": ""}
+
+
+def es_sqlite(ruta: str) -> bool:
+    """True si el fichero empieza por la cabecera de SQLite."""
+    try:
+        with open(ruta, "rb") as f:
+            return f.read(len(CABECERA_SQLITE)) == CABECERA_SQLITE
+    except OSError:
+        return False
+
+
+def verificar_integridad(ruta: str) -> None:
+    """Lanza RuntimeError si `PRAGMA quick_check` no devuelve 'ok'."""
+    conn = sqlite3.connect(ruta)
+    try:
+        filas = conn.execute("PRAGMA quick_check;").fetchall()
+    finally:
+        conn.close()
+    resultado = [f[0] for f in filas]
+    if resultado != ["ok"]:
+        raise RuntimeError(f"Snapshot corrupto ({ruta}): {'; '.join(resultado[:5])}")
+
+
+def crear_snapshot(origen: str, destino: str, paginas: int = PAGINAS_POR_PASO,
+                   pausa: float = PAUSA_ENTRE_PASOS) -> str:
+    """
+    Copia `origen` en `destino` con `sqlite3.Connection.backup`.
+    La copia es un punto en el tiempo aunque haya escrituras concurrentes,
+    y se verifica con quick_check antes de devolver la ruta.
+    """
+    estado = {"restantes": None, "reinicios": 0}
+
+    def progreso(status, restantes, total):
+        # Si quedan más páginas que en el paso anterior, SQLite reinició la copia
+        if estado["restantes"] is not None and restantes > estado["restantes"]:
+            estado["reinicios"] += 1
+            if estado["reinicios"] > MAX_REINICIOS:
+                raise _DemasiadosReinicios()
+        estado["restantes"] = restantes
+
+    src = sqlite3.connect(origen)
+    dst = sqlite3.connect(destino)
+    try:
+        try:
+            src.backup(dst, pages=paginas, progress=progreso, sleep=pausa)
+        except _DemasiadosReinicios:
+            # Con escrituras continuas la copia incremental no converge:
+            # copiamos en un paso (en WAL no bloquea a los escritores)
+            src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    verificar_integridad(destino)
+    return destino
+
+
+class _DemasiadosReinicios(Exception):
+    pass
+
+
+def _ruta_temporal(origen: str, sufijo: str) -> str:
+    """Reserva un fichero temporal vacío en el mismo directorio que `origen`."""
+    fd, ruta = tempfile.mkstemp(
+        prefix=os.path.basename(origen) + ".", suffix=sufijo,
+        dir=os.path.dirname(os.path.abspath(origen)),
+    )
+    os.close(fd)
+    return ruta
+
+
+def _borrar(*rutas):
+    for ruta in rutas:
+        if ruta and os.path.exists(ruta):
+            os.remove(ruta)
+
+
+@contextmanager
+def snapshot_temporal(origen: str):
+    """Crea un snapshot en un fichero temporal junto al origen y lo borra al salir."""
+    ruta = _ruta_temporal(origen, ".snapshot")
+    try:
+        yield crear_snapshot(origen, ruta)
+    finally:
+        _borrar(ruta)
+
+
+# ─────────────────────────────────────────────
+# COMPACTACIÓN Y COMPRESIÓN
+# ─────────────────────────────────────────────
+
+def compactar(origen: str, destino: str) -> str:
+    """Escribe en `destino` una copia sin páginas libres (`VACUUM INTO`)."""
+    _borrar(destino)  # VACUUM INTO exige que el destino no exista
+    conn = sqlite3.connect(origen)
+    try:
+        conn.execute("VACUUM INTO ?", (destino,))
+    finally:
+        conn.close()
+    return destino
+
+
+def _escritor_comprimido(f, formato: str):
+    if formato == "zstd":
+        if zstd is None:
+            raise RuntimeError("Formato zstd solicitado pero el paquete 'zstandard' no está instalado")
+        return zstd.ZstdCompressor(level=10).stream_writer(f, closefd=False)
+    if formato == "gzip":
+        return gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6)
+    raise ValueError(f"Formato de compresión desconocido: {formato}")
+
+
+def comprimir(origen: str, destino: str, formato: str = FORMATO_COMPRESION) -> str:
+    """
+    Comprime `origen` en `destino` por bloques, sin cargar el fichero en memoria.
+    Devuelve el sha256 del contenido sin comprimir.
+    """
+    sha = hashlib.sha256()
+    with open(origen, "rb") as entrada, open(destino, "wb") as salida:
+        if formato == "ninguno":
+            escritor = salida
+        else:
+            escritor = _escritor_comprimido(salida, formato)
+        try:
+            while bloque := entrada.read(TAMANO_BLOQUE):
+                sha.update(bloque)
+                escritor.write(bloque)
+        finally:
+            if escritor is not salida:
+                escritor.close()
+    return sha.hexdigest()
+
+
+def detectar_formato(ruta: str) -> str:
+    """Identifica el formato de un artefacto por sus bytes mágicos."""
+    with open(ruta, "rb") as f:
+        cabecera = f.read(len(CABECERA_SQLITE))
+    if cabecera.startswith(CABECERA_ZSTD):
+        return "zstd"
+    if cabecera.startswith(CABECERA_GZIP):
+        return "gzip"
+    return "ninguno"
+
+
+def _lector_descomprimido(f, formato: str):
+    if formato == "zstd":
+        if zstd is None:
+            raise RuntimeError("El backup está en zstd pero el paquete 'zstandard' no está instalado")
+        return zstd.ZstdDecompressor().stream_reader(f, closefd=False)
+    return gzip.GzipFile(fileobj=f, mode="rb")
+
+
+def descomprimir(origen: str, destino: str) -> str:
+    """Descomprime `origen` en `destino` por bloques (detecta el formato); devuelve el formato."""
+    formato = detectar_formato(origen)
+    if formato == "ninguno":
+        shutil.copyfile(origen, destino)
+        return formato
+    with open(origen, "rb") as entrada, open(destino, "wb") as salida:
+        lector = _lector_descomprimido(entrada, formato)
+        try:
+            shutil.copyfileobj(lector, salida, TAMANO_BLOQUE)
+        finally:
+            lector.close()
+    return formato
+
+
+@contextmanager
+def artefacto_temporal(origen: str, formato: str = FORMATO_COMPRESION):
+    """
+    Pipeline completo de backup: snapshot consistente → VACUUM INTO → compresión.
+    Produce (ruta_artefacto, formato, sha256_sin_comprimir, huella_del_snapshot)
+    y limpia los temporales.
+    """
+    compacto = _ruta_temporal(origen, ".vacuum")
+    artefacto = _ruta_temporal(origen, ".artefacto" + EXTENSIONES.get(formato, ""))
+    try:
+        with snapshot_temporal(origen) as ruta_snapshot:
+            huella = huella_contenido(ruta_snapshot)
+            compactar(ruta_snapshot, compacto)
+        sha256 = comprimir(compacto, artefacto, formato)
+        _borrar(compacto)
+        yield artefacto, formato, sha256, huella
+    finally:
+        _borrar(compacto, artefacto)
+
+
+# ─────────────────────────────────────────────
+# BACKUPS INCREMENTALES POR PÁGINAS
+# ─────────────────────────────────────────────
+
+CABECERA_PARCHE = b"ATPDELTA1\n"
+
+
+def tamano_pagina(ruta: str) -> int:
+    """Lee el tamaño de página de la cabecera SQLite (offset 16, big-endian; 1 = 65536)."""
+    with open(ruta, "rb") as f:
+        cabecera = f.read(100)
+    valor = int.from_bytes(cabecera[16:18], "big")
+    return 65536 if valor == 1 else valor
+
+
+def hashes_paginas(ruta: str) -> tuple[int, list[str]]:
+    """Devuelve (page_size, [hash de cada página]) leyendo el fichero por páginas."""
+    page_size = tamano_pagina(ruta)
+    hashes = []
+    with open(ruta, "rb") as f:
+        while pagina := f.read(page_size):
+            hashes.append(hashlib.blake2b(pagina, digest_size=16).hexdigest())
+    return page_size, hashes
+
+
+def sha256_fichero(ruta: str) -> str:
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while bloque := f.read(TAMANO_BLOQUE):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def huella_contenido(ruta: str) -> str:
+    """
+    sha256 de la base ignorando los contadores de la cabecera que la API de backup
+    reescribe (cambios 24-27, cookie de esquema 40-43, versión 92-95): un snapshot
+    y su origen en reposo dan la misma huella.
+    """
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        cabecera = bytearray(f.read(100))
+        for inicio in (24, 40, 92):
+            cabecera[inicio:inicio + 4] = bytes(4)
+        sha.update(cabecera)
+        while bloque := f.read(TAMANO_BLOQUE):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def escribir_parche(origen: str, paginas: list[int], cabecera: dict, destino: str,
+                    formato: str = FORMATO_COMPRESION) -> None:
+    """
+    Escribe en `destino` (comprimido) las páginas indicadas de `origen`.
+    Formato: CABECERA_PARCHE + cabecera JSON + n × (nº de página u32 + página).
+    """
+    page_size = cabecera["page_size"]
+    with open(origen, "rb") as entrada, open(destino, "wb") as salida:
+        escritor = salida if formato == "ninguno" else _escritor_comprimido(salida, formato)
+        try:
+            escritor.write(CABECERA_PARCHE)
+            escritor.write(json.dumps(cabecera).encode("utf-8") + b"\n")
+            for n in paginas:
+                entrada.seek(n * page_size)
+                escritor.write(n.to_bytes(4, "big"))
+                escritor.write(entrada.read(page_size))
+        finally:
+            if escritor is not salida:
+                escritor.close()
+
+
+def aplicar_parche(parche: str, base: str) -> dict:
+    """Aplica en `base` las páginas de un parche (descomprimiendo en streaming); devuelve su cabecera."""
+    formato = detectar_formato(parche)
+    with open(parche, "rb") as f:
+        lector = f if formato == "ninguno" else _lector_descomprimido(f, formato)
+        try:
+            if _leer_exacto(lector, len(CABECERA_PARCHE)) != CABECERA_PARCHE:
+                raise RuntimeError(f"{parche} no es un parche de backup válido")
+            linea = b""
+            while not linea.endswith(b"\n"):
+                caracter = lector.read(1)
+                if not caracter:
+                    raise RuntimeError("Cabecera de parche truncada")
+                linea += caracter
+            cabecera = json.loads(linea)
+            page_size = cabecera["page_size"]
+            with open(base, "r+b") as salida:
+                while numero := _leer_exacto(lector, 4):
+                    pagina = _leer_exacto(lector, page_size)
+                    if len(numero) != 4 or len(pagina) != page_size:
+                        raise RuntimeError("Parche truncado")
+                    salida.seek(int.from_bytes(numero, "big") * page_size)
+                    salida.write(pagina)
+                salida.truncate(cabecera["paginas_totales"] * page_size)
+        finally:
+            if lector is not f:
+                lector.close()
+    return cabecera
+
+
+def _leer_exacto(lector, n: int) -> bytes:
+    """read() de los lectores comprimidos puede devolver menos bytes de los pedidos."""
+    partes = []
+    while n > 0:
+        bloque = lector.read(n)
+        if not bloque:
+            break
+        partes.append(bloque)
+        n -= len(bloque)
+    return b"".join(partes)
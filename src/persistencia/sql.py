@@ -1,14 +1,28 @@
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Text, Boolean, DateTime, Date, ForeignKey
+    create_engine, event, select, func, or_, tuple_, literal, Column, Integer, Float, String, Text, Boolean, DateTime, Date, ForeignKey, Index
 )
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 from datetime import datetime, date, timezone, UTC
 from sqlalchemy import JSON  # si usas SQLAlchemy 1.4+ puedes definir JSON
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker, joinedload
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, joinedload, aliased
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from dataclasses import dataclass
+from contextvars import ContextVar
+import atexit
+import copy
+import functools
 import json
+import math
 import os
-import shutil
+import threading
+import time
 import src.persistencia.backup_storage as backup_storage
+import src.persistencia.backup_scheduler as backup_scheduler
+import pandas as pd
 import sqlite3
 import streamlit as st
 
@@ -17,32 +31,142 @@ import streamlit as st
  # ─────────────────────────────────────────────
 
 DB_PATH = os.path.join("/tmp", "base.db")
-# Inicialización robusta: siempre intentamos restaurar el último backup desde Drive.
-# Si no hay backups, arrancamos vacíos y generamos el primer backup.
-NEED_INIT_SCHEMA = False
-try:
-    backups = backup_storage.listar_backups()
-    if backups:
-        ultimo = sorted(backups, key=lambda b: b["createdTime"], reverse=True)[0]
-        backup_storage.descargar_backup(ultimo["id"], DB_PATH)
-        print(f"📦 Restaurado backup inicial desde Drive: {ultimo['name']}")
-    else:
-        print("ℹ️ No hay backups en Drive: se iniciará base vacía.")
-        # Creamos un archivo vacío; el esquema se creará tras configurar el engine.
-        open(DB_PATH, "wb").close()
-        NEED_INIT_SCHEMA = True
-except Exception as e:
-    print(f"⚠️ Error al consultar/restaurar backups: {e}")
-    # Fallback: si existe base local en el repo la copiamos; si no, vacía.
-    if os.path.exists("base.db"):
-        shutil.copy("base.db", DB_PATH)
-        print("📄 Copiado base.db local al /tmp como semilla.")
-    else:
-        open(DB_PATH, "wb").close()
-        NEED_INIT_SCHEMA = True
-
+# La restauración desde Drive y las migraciones las hace src.persistencia.bootstrap
+# en segundo plano: importar este módulo no toca la red ni el fichero.
 DATABASE_URL = f"sqlite:///{DB_PATH}"
-engine = create_engine(DATABASE_URL, echo=False)
+
+# PRAGMAs de cada conexión (WAL: los lectores no bloquean al escritor ni al snapshot de backup)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# cache_size negativo = KiB por conexión
+SQLITE_CACHE_KIB = int(os.getenv("SQLITE_CACHE_KIB", "16384"))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(64 * 1024 * 1024)))
+# Pool compartido por las sesiones de Streamlit y los hilos de backup
+POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+POOL_MAX_OVERFLOW = int(os.getenv("SQLITE_POOL_MAX_OVERFLOW", "8"))
+POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+
+
+def _configurar_conexion(dbapi_conn, _registro):
+    """Aplica los PRAGMAs a cada conexión nueva del pool."""
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE};")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS};")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KIB};")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES};")
+    cursor.execute("PRAGMA temp_store=MEMORY;")
+    cursor.close()
+
+
+def crear_engine(url: str = DATABASE_URL, **kwargs):
+    """
+    Engine SQLite para uso multihilo: QueuePool con conexiones compartibles entre hilos
+    (`check_same_thread=False`; el pool garantiza que cada una la usa un hilo a la vez)
+    y los PRAGMAs de `_configurar_conexion` aplicados al abrir cada conexión.
+    """
+    nuevo = create_engine(
+        url,
+        echo=False,
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        **kwargs,
+    )
+    event.listen(nuevo, "connect", _configurar_conexion)
+    return nuevo
+
+
+engine = crear_engine()
+# Al salir cerramos el pool: la última conexión hace checkpoint y el -wal queda vacío
+atexit.register(engine.dispose)
+
+
+class _PuertaConexiones:
+    """
+    Bloquea los checkouts del pool mientras se sustituye el fichero de la base
+    (restauración): nadie abre ni reutiliza conexiones sobre un -wal a punto de borrarse.
+    El hilo que cierra la puerta sigue pudiendo usar la base (migraciones).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._dueno = None
+        self._en_uso = 0
+        # Cambia con cada fichero nuevo: las conexiones abiertas sobre el anterior se descartan
+        self.generacion = 0
+
+    def _esperar_paso(self):
+        while self._dueno is not None and self._dueno != threading.get_ident():
+            self._cond.wait()
+
+    def al_conectar(self, _dialecto, registro, _cargs, _cparams):
+        """Antes de abrir el fichero (do_connect): espera si se está sustituyendo."""
+        with self._cond:
+            self._esperar_paso()
+            registro.info["generacion_fichero"] = self.generacion
+
+    def al_sacar(self, _dbapi_conn, registro, _proxy):
+        with self._cond:
+            self._esperar_paso()
+            if registro.info.get("generacion_fichero") != self.generacion:
+                # El pool la descarta y abre otra sobre el fichero actual
+                raise DisconnectionError("conexión abierta sobre una base ya sustituida")
+            registro.info["en_uso"] = True
+            self._en_uso += 1
+
+    def al_devolver(self, _dbapi_conn, registro):
+        with self._cond:
+            if registro.info.pop("en_uso", False):
+                self._en_uso -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def cerrada(self, timeout: float = POOL_TIMEOUT):
+        """Cierra la puerta y espera a que se devuelvan las conexiones en uso."""
+        with self._cond:
+            self._esperar_paso()
+            self._dueno = threading.get_ident()
+            if not self._cond.wait_for(lambda: self._en_uso == 0, timeout):
+                self._dueno = None
+                self._cond.notify_all()
+                raise TimeoutError(f"{self._en_uso} conexiones siguen en uso tras {timeout:.0f}s")
+            self.generacion += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._dueno = None
+                self._cond.notify_all()
+
+
+_puerta = _PuertaConexiones()
+event.listen(engine, "do_connect", _puerta.al_conectar)
+event.listen(engine, "checkout", _puerta.al_sacar)
+event.listen(engine, "checkin", _puerta.al_devolver)
+
+
+# Serializa la sustitución del fichero con las subidas a Drive, que leen DB_PATH
+# directamente con sqlite3 (snapshot / parches) sin pasar por el pool
+_lock_fichero = threading.Lock()
+
+
+@contextmanager
+def fichero_bloqueado():
+    """
+    Sustitución segura del fichero de la base: espera a que termine la subida en curso
+    (y bloquea las siguientes), bloquea los checkouts, espera a las conexiones en uso y
+    cierra el pool. Dentro se pueden borrar -wal/-shm, reemplazar DB_PATH y migrar;
+    al salir las conexiones nuevas abren ya el fichero nuevo.
+    """
+    with _lock_fichero, _puerta.cerrada():
+        engine.dispose()
+        yield
+
+
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
 Base = declarative_base()
 
@@ -87,14 +211,338 @@ def ensure_schema_usuarios():
         print(f"⚠️ Error al asegurar esquema usuarios: {e}")
 
 
-# Helper para sincronizar backup tras cada commit
-def _sync_backup():
-    try:
+# ─────────────────────────────────────────────
+# BACKUP DIFERIDO TRAS CADA COMMIT
+# ─────────────────────────────────────────────
+def _ejecutar_backup():
+    """Sube la base a Drive y rota; se ejecuta en el hilo del programador."""
+    # Nunca a la vez que una restauración: subiría el fichero viejo o un parche contra el nuevo
+    with _lock_fichero:
         file_id = backup_storage.subir_backup(DB_PATH)
-        backup_storage.rotar_backups(max_backups=5)
-        print(f"Backup actualizado en Drive: {file_id}")
+    if not file_id:
+        raise RuntimeError("la subida no devolvió file_id")
+    print(f"Backup actualizado en Drive: {file_id}")
+    # La subida ya es durable: un fallo al rotar no debe provocar otra subida
+    try:
+        borrados = backup_storage.rotar_backups()
+        if borrados:
+            print(f"♻️ Rotación: {borrados} backups antiguos eliminados")
     except Exception as e:
-        print(f"⚠️ Error al subir backup: {e}")
+        print(f"⚠️ Error al rotar backups: {e}")
+
+programador_backups = backup_scheduler.crear_programador(_ejecutar_backup)
+
+# Helper para sincronizar backup tras cada commit: solo marca la base como sucia,
+# el programador agrupa las escrituras de la ventana en una única subida.
+def _sync_backup():
+    programador_backups.marcar_sucio()
+
+def esperar_backup(timeout: float | None = 60) -> bool:
+    """
+    Bloquea hasta que todas las escrituras previas estén subidas a Drive.
+    Solo para los flujos que necesitan durabilidad inmediata.
+    """
+    return programador_backups.esperar_durable(timeout)
+
+def flush_backups(timeout: float | None = 60) -> bool:
+    """Sube cualquier escritura pendiente y detiene el hilo de backups."""
+    return programador_backups.flush(timeout)
+
+# ─────────────────────────────────────────────
+# UNIDAD DE TRABAJO: VARIAS LLAMADAS CRUD, UN COMMIT
+# ─────────────────────────────────────────────
+# Sesión de la transacción abierta en el hilo/contexto actual (None si no hay)
+_transaccion_activa: ContextVar = ContextVar("transaccion_activa", default=None)
+
+@contextmanager
+def transaccion():
+    """
+    Agrupa varias llamadas CRUD en una sola transacción:
+
+        with sql.transaccion():
+            usuario = sql.crear_usuario(...)
+            sql.actualizar_atleta(id_atleta, atleta_usuario_id=usuario.id_usuario)
+
+    Los helpers llamados dentro comparten la sesión y solo hacen flush; al salir
+    se hace un único commit y se marca un único backup. Cualquier excepción
+    deshace todo el bloque (`st.rerun()` también lanza una, así que va fuera).
+    Un `transaccion()` anidado se une al exterior.
+    """
+    activa = _transaccion_activa.get()
+    if activa is not None:
+        yield activa
+        return
+    session = SessionLocal()
+    token = _transaccion_activa.set(session)
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        _transaccion_activa.reset(token)
+        session.close()
+    _sync_backup()
+
+@contextmanager
+def _sesion():
+    """Sesión de la transacción activa (sin cerrarla) o una nueva de SessionLocal."""
+    activa = _transaccion_activa.get()
+    if activa is not None:
+        yield activa
+    else:
+        with SessionLocal() as session:
+            yield session
+
+def _confirmar(session):
+    """Commit + backup; dentro de `transaccion()` solo flush (el commit lo hace el bloque)."""
+    if session is _transaccion_activa.get():
+        session.flush()
+    else:
+        session.commit()
+        _sync_backup()
+
+# ─────────────────────────────────────────────
+# CACHÉ DE LECTURAS CON INVALIDACIÓN POR ESCRITURA
+# ─────────────────────────────────────────────
+# Las lecturas decoradas con @_cacheada guardan su resultado junto a la generación
+# de las tablas de las que dependen; cada commit que escribe en una tabla sube su
+# generación, así que la siguiente lectura ve el dato nuevo. Las escrituras de otros
+# procesos se detectan por la huella del fichero (_SenalFichero).
+CACHE_MAX_ENTRADAS = int(os.getenv("SQL_CACHE_MAX_ENTRADAS", "256"))
+# Antigüedad máxima de una lectura cacheada (red de seguridad para cambios externos)
+CACHE_TTL_SEGUNDOS = float(os.getenv("SQL_CACHE_TTL_SEGUNDOS", "300"))
+_generaciones: dict[str, int] = {}
+_generaciones_lock = threading.Lock()
+
+
+class CacheLecturas:
+    """LRU de resultados de lectura con estadísticas de aciertos/fallos (y TTL opcional)."""
+
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS, ttl_segundos: float | None = None):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()  # clave -> (generaciones, valor, guardado_en)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def obtener(self, clave, generaciones):
+        """Devuelve (True, valor) si hay entrada vigente para esas generaciones."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] == generaciones and (
+                self.ttl_segundos is None or time.monotonic() - entrada[2] < self.ttl_segundos
+            ):
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return True, entrada[1]
+            self.fallos += 1
+            return False, None
+
+    def guardar(self, clave, generaciones, valor):
+        with self._lock:
+            self._entradas[clave] = (generaciones, valor, time.monotonic())
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.expulsiones += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+                "ratio_aciertos": self.aciertos / consultas if consultas else 0.0,
+            }
+
+
+cache_lecturas = CacheLecturas(ttl_segundos=CACHE_TTL_SEGUNDOS)
+
+
+class _SenalFichero:
+    """
+    Detecta escrituras de otros procesos (scripts/ contra la misma base), que no pasan
+    por los eventos de sesión: huella (inode, mtime, tamaño) de la base y su -wal.
+    Si cambia sin un commit propio que la reconozca, sube `generacion`, que forma parte
+    de la clave de todas las lecturas cacheadas. Solo hace stat: no abre conexiones.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vista = None
+        self.generacion = 0
+
+    @staticmethod
+    def _huella():
+        huella = []
+        for ruta in (DB_PATH, DB_PATH + "-wal"):
+            try:
+                datos = os.stat(ruta)
+                huella.append((datos.st_ino, datos.st_mtime_ns, datos.st_size))
+            except FileNotFoundError:
+                huella.append(None)
+        return tuple(huella)
+
+    def actual(self) -> int:
+        huella = self._huella()
+        with self._lock:
+            if huella != self._vista:
+                if self._vista is not None:
+                    self.generacion += 1
+                self._vista = huella
+            return self.generacion
+
+    def reconocer(self):
+        """
+        Tras un commit propio (ya invalidado por tablas): su cambio de huella no cuenta.
+        Un cambio externo justo en ese instante quedaría absorbido; lo acota el TTL de la caché.
+        """
+        huella = self._huella()
+        with self._lock:
+            self._vista = huella
+
+
+_senal_fichero = _SenalFichero()
+
+def estadisticas_cache() -> dict:
+    return cache_lecturas.estadisticas()
+
+def _subir_generaciones(tablas):
+    with _generaciones_lock:
+        for tabla in tablas:
+            _generaciones[tabla] = _generaciones.get(tabla, 0) + 1
+
+def invalidar_cache():
+    """Descarta todas las lecturas cacheadas (restauraciones, migraciones, escrituras fuera del ORM)."""
+    cache_lecturas.limpiar()
+    _subir_generaciones(list(_generaciones) + list(Base.metadata.tables))
+    _subir_version_vinculos()
+
+def _anotar_tablas(session, tablas):
+    session.info.setdefault("tablas_modificadas", set()).update(tablas)
+
+@event.listens_for(SessionLocal, "after_flush")
+def _tablas_tras_flush(session, _contexto):
+    _anotar_tablas(session, {
+        obj.__table__.name for obj in (*session.new, *session.dirty, *session.deleted)
+        if hasattr(obj, "__table__")
+    })
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _tablas_sentencia(estado):
+    # INSERT/UPDATE/DELETE directos (upserts, query.delete()) no pasan por el flush
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        tabla = getattr(estado.statement, "table", None)
+        if tabla is not None:
+            _anotar_tablas(estado.session, {tabla.name})
+
+@event.listens_for(SessionLocal, "after_commit")
+def _tablas_tras_commit(session):
+    tablas = session.info.pop("tablas_modificadas", None)
+    if tablas:
+        _subir_generaciones(tablas)
+        _senal_fichero.reconocer()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _tablas_tras_rollback(session):
+    session.info.pop("tablas_modificadas", None)
+
+_filas_por_modelo: dict[type, type] = {}
+
+def _instantanea(valor):
+    """
+    Copia inmutable de un resultado: los objetos ORM pasan a namedtuple con sus
+    columnas (sin relaciones) y las listas a tuplas. Los dicts se guardan tal cual
+    y se copian al servirlos.
+    """
+    if isinstance(valor, Base):
+        modelo = type(valor)
+        fila = _filas_por_modelo.get(modelo)
+        if fila is None:
+            fila = namedtuple(f"{modelo.__name__}Fila", [c.key for c in modelo.__mapper__.column_attrs])
+            _filas_por_modelo[modelo] = fila
+        return fila(*(getattr(valor, campo) for campo in fila._fields))
+    if isinstance(valor, Pagina):
+        return Pagina(_instantanea(valor.filas), valor.siguiente)
+    if isinstance(valor, (list, tuple)) and not hasattr(valor, "_fields"):
+        return tuple(_instantanea(v) for v in valor)
+    return valor
+
+def _servir(valor):
+    """Lo que recibe el llamante en un acierto: listas nuevas y dicts copiados."""
+    if isinstance(valor, tuple) and not hasattr(valor, "_fields"):
+        return [_servir(v) for v in valor]
+    if isinstance(valor, Pagina):
+        return Pagina(_servir(valor.filas), valor.siguiente)
+    if isinstance(valor, dict):
+        return copy.deepcopy(valor)
+    return valor
+
+def _congelar(valor):
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return tuple(_congelar(v) for v in valor)
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _congelar(v)) for k, v in valor.items()))
+    return valor
+
+def _cacheada(*tablas):
+    """Cachea una lectura por argumentos + generación de `tablas`; no actúa dentro de transaccion()."""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if _transaccion_activa.get() is not None:
+                return funcion(*args, **kwargs)
+            clave = (funcion.__name__, _congelar(args), _congelar(kwargs))
+            # Generación leída antes de consultar: una escritura concurrente deja la entrada caducada
+            generaciones = (_senal_fichero.actual(), *(_generaciones.get(t, 0) for t in tablas))
+            encontrado, valor = cache_lecturas.obtener(clave, generaciones)
+            if not encontrado:
+                valor = _instantanea(funcion(*args, **kwargs))
+                cache_lecturas.guardar(clave, generaciones, valor)
+            return _servir(valor)
+        return envoltura
+    return decorador
+
+# ─────────────────────────────────────────────
+# PAGINACIÓN POR CURSOR (keyset)
+# ─────────────────────────────────────────────
+PAGINA_POR_DEFECTO = 50
+
+@dataclass(frozen=True)
+class Pagina:
+    """Página de resultados; `siguiente` es el cursor (fecha, id) de la próxima o None si no hay más."""
+    filas: list
+    siguiente: tuple | None
+
+def _paginar(query, col_fecha, col_id, limit=PAGINA_POR_DEFECTO, after_fecha=None, after_id=None,
+             descendente=True, convertir=None) -> Pagina:
+    """
+    Aplica el cursor (after_fecha, after_id) y devuelve `limit` filas ordenadas por (fecha, id).
+    La comparación por tupla la resuelve SQLite recorriendo el índice (id_atleta, …, fecha).
+    """
+    if after_fecha is not None:
+        cursor = tuple_(col_fecha, col_id)
+        limite = tuple_(literal(after_fecha, col_fecha.type), literal(after_id if after_id is not None else 0))
+        query = query.filter(cursor < limite if descendente else cursor > limite)
+    orden = (col_fecha.desc(), col_id.desc()) if descendente else (col_fecha.asc(), col_id.asc())
+    filas = query.order_by(*orden).limit(limit + 1).all()
+    siguiente = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        ultima = filas[-1]
+        siguiente = (getattr(ultima, col_fecha.key), getattr(ultima, col_id.key))
+    return Pagina([convertir(f) for f in filas] if convertir else filas, siguiente)
 
 # ─────────────────────────────────────────────
 # BACKUP AUTOMÁTICO CADA 24H
@@ -104,15 +552,14 @@ from datetime import timedelta
 def backup_diario():
     """Ejecuta un backup si han pasado ≥24h desde el último en Drive."""
     try:
-        backups = backup_storage.listar_backups()
-        if backups:
-            ultimo = sorted(backups, key=lambda b: b["createdTime"], reverse=True)[0]
+        ultimo = backup_storage.ultimo_backup()
+        if ultimo:
             fecha_ultimo = datetime.fromisoformat(
                 ultimo["createdTime"].replace("Z", "+00:00")
             )
             if datetime.now(UTC) - fecha_ultimo >= timedelta(hours=24):
                 file_id = backup_storage.subir_backup(DB_PATH)
-                backup_storage.rotar_backups(max_backups=5)
+                backup_storage.rotar_backups()
                 print(f"📦 Backup diario ejecutado: {file_id}")
             else:
                 print("ℹ️ Último backup <24h, no se crea uno nuevo.")
@@ -122,34 +569,14 @@ def backup_diario():
     except Exception as e:
         print(f"⚠️ Error en backup diario: {e}")
 
-# Si se marcó que no había backups, inicializamos el esquema y creamos el primer backup vacío.
-if NEED_INIT_SCHEMA:
-    try:
-        # Nota: el esquema se define más adelante con los modelos; este bloque se ejecutará al final del import.
-        # Para asegurar creación del esquema, lo reforzaremos en init_db() también.
-        print("🛠️ Inicializando esquema en base vacía...")
-        # La función init_db se define más abajo; si aún no existe en este punto por orden de import,
-        # se recomienda llamar a Base.metadata.create_all en init_db() al primer uso.
-        # Aquí no llamamos directamente para evitar dependencia del orden: se crea en init_db().
-    except Exception as e:
-        print(f"⚠️ Error al inicializar esquema: {e}")
-
-# Ejecutar migraciones defensivas tras levantar engine (aplica a DB restaurada)
-try:
-    ensure_schema()
-    ensure_schema_usuarios()
-except Exception as e:
-    print(f"⚠️ Error en migraciones defensivas: {e}")
-
 # ─────────────────────────────────────────────
 # CHECK VISUAL DE BACKUPS
 # ─────────────────────────────────────────────
 def mostrar_estado_backups():
     """Renderiza en Streamlit el estado del último backup y si toca ejecutar el diario."""
     try:
-        backups = backup_storage.listar_backups()
-        if backups:
-            ultimo = sorted(backups, key=lambda b: b["createdTime"], reverse=True)[0]
+        ultimo = backup_storage.ultimo_backup()
+        if ultimo:
             fecha_ultimo = datetime.fromisoformat(
                 ultimo["createdTime"].replace("Z", "+00:00")
             )
@@ -170,6 +597,9 @@ def mostrar_estado_backups():
 
 class Usuario(Base):
     __tablename__ = "usuarios"
+    __table_args__ = (
+        Index("ix_usuarios_perfil_atleta", "perfil_atleta_id"),
+    )
 
     id_usuario = Column(Integer, primary_key=True, autoincrement=True)
     nombre = Column(String, nullable=False)
@@ -197,6 +627,11 @@ class Usuario(Base):
 
 class Atleta(Base):
     __tablename__ = "atletas"
+    __table_args__ = (
+        Index("ix_atletas_usuario", "id_usuario"),
+        Index("ix_atletas_propietario", "propietario_id"),
+        Index("ix_atletas_atleta_usuario", "atleta_usuario_id"),
+    )
 
     id_atleta = Column(Integer, primary_key=True, autoincrement=True)
     id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=True)
@@ -243,6 +678,9 @@ class Atleta(Base):
 
 class Evento(Base):
     __tablename__ = "eventos"
+    __table_args__ = (
+        Index("ix_eventos_atleta_fecha", "id_atleta", "fecha"),
+    )
 
     id_evento = Column(Integer, primary_key=True, autoincrement=True)
     id_atleta = Column(Integer, ForeignKey("atletas.id_atleta"), nullable=False)
@@ -265,49 +703,257 @@ class Evento(Base):
 def init_db():
     Base.metadata.create_all(bind=engine)
 
+def migrar():
+    """Crea las tablas que falten y aplica las migraciones defensivas (lo invoca el bootstrap)."""
+    init_db()
+    ensure_schema()
+    ensure_schema_usuarios()
+    ensure_schema_metricas()
+    ensure_schema_calendario()
+    ensure_indices()
+    # La base puede venir de una restauración: nada de lo cacheado sigue valiendo
+    invalidar_cache()
+
+def ensure_schema_metricas():
+    """
+    Añade `metricas.dia` y `metricas.valor_num` y los rellena (valor_num solo al crear
+    la columna); si aún no existe el índice único que usan los upserts, elimina antes
+    los duplicados (atleta, tipo, día) conservando el de fecha más reciente.
+    """
+    with engine.begin() as conn:
+        cols = [fila[1] for fila in conn.exec_driver_sql("PRAGMA table_info(metricas);")]
+        if "dia" not in cols:
+            conn.exec_driver_sql("ALTER TABLE metricas ADD COLUMN dia DATE;")
+            print("✅ Esquema metricas actualizado (dia)")
+        if "valor_num" not in cols:
+            conn.exec_driver_sql("ALTER TABLE metricas ADD COLUMN valor_num REAL;")
+            print("✅ Esquema metricas actualizado (valor_num)")
+            # Relleno único al crear la columna: después cada escritura ya lo calcula, y las
+            # métricas de texto (valor_num NULL para siempre) no se vuelven a parsear en cada arranque.
+            # El parseo de texto a número se hace en Python (mismo criterio que al escribir)
+            pendientes = conn.exec_driver_sql(
+                "SELECT id_metrica, valor FROM metricas WHERE valor IS NOT NULL;"
+            ).fetchall()
+            numericas = [(n, id_metrica) for id_metrica, valor in pendientes if (n := _a_numero(valor)) is not None]
+            if numericas:
+                conn.exec_driver_sql("UPDATE metricas SET valor_num = ? WHERE id_metrica = ?;", numericas)
+                print(f"✅ valor_num rellenado en {len(numericas)} métricas")
+        conn.exec_driver_sql("UPDATE metricas SET dia = date(fecha) WHERE dia IS NULL;")
+        # Con el índice único ya creado no puede haber duplicados: no se recorre la tabla
+        indice_unico = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_metricas_atleta_tipo_dia';"
+        ).first()
+        borradas = 0
+        if indice_unico is None:
+            # Sobrevive la fila con la fecha más reciente del día (la que mostraba la app)
+            borradas = conn.exec_driver_sql("""
+                DELETE FROM metricas WHERE id_metrica IN (
+                    SELECT id_metrica FROM (
+                        SELECT id_metrica, ROW_NUMBER() OVER (
+                            PARTITION BY id_atleta, tipo_metrica, dia
+                            ORDER BY fecha DESC, id_metrica DESC
+                        ) AS orden
+                        FROM metricas
+                    ) WHERE orden > 1
+                );
+            """).rowcount
+    if borradas:
+        print(f"🧹 Métricas duplicadas eliminadas: {borradas}")
+
+def ensure_schema_calendario():
+    """Añade `calendario_eventos.actualizado_en` (versión del evento) inicializada a `creado_en`."""
+    with engine.begin() as conn:
+        cols = [fila[1] for fila in conn.exec_driver_sql("PRAGMA table_info(calendario_eventos);")]
+        if "actualizado_en" not in cols:
+            conn.exec_driver_sql("ALTER TABLE calendario_eventos ADD COLUMN actualizado_en DATETIME;")
+            print("✅ Esquema calendario_eventos actualizado (actualizado_en)")
+        conn.exec_driver_sql(
+            "UPDATE calendario_eventos SET actualizado_en = creado_en WHERE actualizado_en IS NULL;"
+        )
+
+def ensure_indices():
+    """
+    Crea los índices declarados en los modelos que falten en una base restaurada.
+    `create_all` solo los crea junto con tablas nuevas; aquí usamos CREATE INDEX IF NOT EXISTS.
+    """
+    creados = []
+    with engine.begin() as conn:
+        existentes = {
+            fila[0] for fila in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type='index'")
+        }
+        for tabla in Base.metadata.tables.values():
+            for indice in tabla.indexes:
+                if indice.name in existentes:
+                    continue
+                columnas = ", ".join(c.name for c in indice.columns)
+                unico = "UNIQUE " if indice.unique else ""
+                conn.exec_driver_sql(
+                    f"CREATE {unico}INDEX IF NOT EXISTS {indice.name} ON {tabla.name} ({columnas})"
+                )
+                creados.append(indice.name)
+        if creados:
+            # Estadísticas para el planificador, como las tendrá cualquier base con uso real
+            conn.exec_driver_sql("ANALYZE")
+    if creados:
+        print(f"✅ Índices creados: {', '.join(creados)}")
+    return creados
+
+def _consultas_criticas():
+    """Consultas calientes de la app (mismos filtros y orden que las funciones CRUD)."""
+    hoy = date.today()
+    return {
+        "obtener_eventos_filtrados": select(CalendarioEvento)
+            .where(CalendarioEvento.id_atleta == 1, CalendarioEvento.fecha >= hoy, CalendarioEvento.fecha <= hoy)
+            .order_by(CalendarioEvento.fecha.desc()),
+        "obtener_competiciones_por_atleta": select(CalendarioEvento)
+            .where(CalendarioEvento.id_atleta == 1, CalendarioEvento.tipo_evento == "competicion")
+            .order_by(CalendarioEvento.fecha.desc()),
+        "borrar_metricas_por_fecha": select(Metrica)
+            .where(Metrica.id_atleta == 1, Metrica.tipo_metrica.in_(["peso", "hrv"]), Metrica.dia == hoy),
+        "obtener_metricas_por_tipo": select(Metrica)
+            .where(Metrica.id_atleta == 1, Metrica.tipo_metrica == "peso").order_by(Metrica.fecha),
+        "obtener_comentarios_por_atleta": select(Comentario)
+            .where(Comentario.id_atleta == 1, Comentario.visible_para.in_(["atleta", "todos"]))
+            .order_by(Comentario.fecha.desc()),
+        "obtener_sesiones_por_atleta": select(Sesion)
+            .where(Sesion.id_atleta == 1).order_by(Sesion.fecha.desc()),
+        "obtener_id_atleta_por_usuario": select(Atleta).where(Atleta.atleta_usuario_id == 1),
+        "obtener_atletas_permitidos": select(Atleta.id_atleta)
+            .where(or_(Atleta.id_usuario == 1, Atleta.propietario_id == 1)),
+    }
+
+# Con ANALYZE, en tablas de menos filas el planificador prefiere recorrerlas (y es barato)
+PLANES_MIN_FILAS = int(os.getenv("SQL_PLANES_MIN_FILAS", "1000"))
+
+def _tabla_de_paso(paso: str) -> str:
+    """Tabla de un paso 'SCAN tabla [AS alias]' (o 'SCAN TABLE tabla' en SQLite antiguos)."""
+    palabras = paso.split()
+    return palabras[2] if len(palabras) > 2 and palabras[1] == "TABLE" else palabras[1]
+
+def verificar_planes() -> list[dict]:
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre las consultas críticas.
+    Devuelve [{consulta, plan, usa_indice, tablas_pequenas}]; usa_indice es False si se
+    recorre entera alguna tabla de al menos PLANES_MIN_FILAS filas. Los recorridos de
+    tablas más pequeñas se toleran y se listan en tablas_pequenas.
+    """
+    resultados = []
+    filas_por_tabla = {}
+    with engine.connect() as conn:
+        for nombre, consulta in _consultas_criticas().items():
+            compilada = consulta.compile(bind=engine, compile_kwargs={"render_postcompile": True})
+            parametros = tuple(compilada.params[k] for k in compilada.positiontup)
+            filas = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compilada}", parametros).fetchall()
+            plan = [fila[-1] for fila in filas]
+            recorridas = {_tabla_de_paso(p) for p in plan if p.startswith("SCAN ") and "USING" not in p}
+            for tabla in recorridas - filas_por_tabla.keys():
+                filas_por_tabla[tabla] = conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{tabla}"').scalar()
+            pequenas = sorted(t for t in recorridas if filas_por_tabla[t] < PLANES_MIN_FILAS)
+            resultados.append({
+                "consulta": nombre,
+                "plan": plan,
+                "usa_indice": len(pequenas) == len(recorridas),
+                "tablas_pequenas": pequenas,
+            })
+    return resultados
+
+# ─────────────────────────────────────────────
+# ESTADÍSTICAS PARA LOS PANELES DE ADMIN
+# ─────────────────────────────────────────────
+def contar_entidades() -> dict:
+    """
+    Conteos de todas las tablas (un SELECT COUNT(*) por tabla, sin cargar objetos)
+    y tamaño del fichero: {"tablas": {nombre: n}, "paginas", "tam_pagina",
+    "paginas_libres", "bytes"} (bytes incluye el -wal pendiente de checkpoint).
+    """
+    with engine.connect() as conn:
+        tablas = {
+            nombre: conn.execute(select(func.count()).select_from(tabla)).scalar_one()
+            for nombre, tabla in Base.metadata.tables.items()
+        }
+        paginas = conn.exec_driver_sql("PRAGMA page_count;").scalar_one()
+        tam_pagina = conn.exec_driver_sql("PRAGMA page_size;").scalar_one()
+        paginas_libres = conn.exec_driver_sql("PRAGMA freelist_count;").scalar_one()
+    tam_bytes = sum(
+        os.path.getsize(ruta) for ruta in (DB_PATH, DB_PATH + "-wal") if os.path.exists(ruta)
+    )
+    return {
+        "tablas": tablas,
+        "paginas": paginas,
+        "tam_pagina": tam_pagina,
+        "paginas_libres": paginas_libres,
+        "bytes": tam_bytes,
+    }
+
 # ─────────────────────────────────────────────
 # FUNCIONES CRUD: USUARIOS
 # ─────────────────────────────────────────────
 
 def crear_usuario(nombre, email, rol, password_hash: str):
     """Crea un usuario con contraseña ya hasheada"""
-    with SessionLocal() as session:
+    with _sesion() as session:
         usuario = Usuario(nombre=nombre, email=email, rol=rol, password_hash=password_hash)
         session.add(usuario)
         session.flush()
         session.refresh(usuario)
-        session.commit()
-        _sync_backup()
+        _marcar_vinculos(session)
+        _confirmar(session)
         return usuario
 
 def obtener_usuarios():
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Usuario).all()
 
+@dataclass(frozen=True)
+class UsuarioResumen:
+    """Fila de lectura para la tabla de usuarios: usuario + perfil atleta vinculado + su entrenadora."""
+    id_usuario: int
+    nombre: str
+    email: str
+    rol: str
+    creado_en: datetime | None
+    perfil_atleta_id: int | None
+    perfil_nombre: str | None
+    entrenadora_nombre: str | None
+
+def obtener_usuarios_con_perfil() -> list[UsuarioResumen]:
+    """
+    Usuarios con el nombre de su perfil atleta y de la entrenadora de ese perfil,
+    en una sola consulta (LEFT JOIN usuarios → atletas → usuarios).
+    """
+    entrenadora = aliased(Usuario)
+    consulta = select(
+        Usuario.id_usuario, Usuario.nombre, Usuario.email, Usuario.rol, Usuario.creado_en,
+        Usuario.perfil_atleta_id, Atleta.nombre, entrenadora.nombre,
+    ).outerjoin(Atleta, Atleta.id_atleta == Usuario.perfil_atleta_id)\
+     .outerjoin(entrenadora, entrenadora.id_usuario == Atleta.id_usuario)\
+     .order_by(Usuario.id_usuario)
+    with _sesion() as session:
+        return [UsuarioResumen(*fila) for fila in session.execute(consulta)]
+
 def obtener_usuario_por_email(email: str):
     """Devuelve un usuario por email o None"""
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Usuario).filter_by(email=email).first()
 
 def obtener_usuario_por_id(id_usuario: int):
     """Devuelve un usuario por id o None"""
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Usuario).filter_by(id_usuario=id_usuario).first()
 
 def actualizar_password(id_usuario: int, nuevo_hash: str):
     """Actualiza la contraseña de un usuario"""
-    with SessionLocal() as session:
+    with _sesion() as session:
         usuario = session.query(Usuario).filter_by(id_usuario=id_usuario).first()
         if not usuario:
             return None
         usuario.password_hash = nuevo_hash
-        session.commit()
+        _confirmar(session)
         session.refresh(usuario)
-        _sync_backup()
         return usuario
 
 def actualizar_usuario(id_usuario, **kwargs):
-    with SessionLocal() as session:
+    with _sesion() as session:
         usuario = session.query(Usuario).filter_by(id_usuario=id_usuario).first()
         if not usuario:
             return None
@@ -321,13 +967,14 @@ def actualizar_usuario(id_usuario, **kwargs):
         for campo, valor in kwargs.items():
             if hasattr(usuario, campo):
                 setattr(usuario, campo, valor)
-        session.commit()
+        if CAMPOS_VINCULO_USUARIO & kwargs.keys():
+            _marcar_vinculos(session)
+        _confirmar(session)
         session.refresh(usuario)
-        _sync_backup()
         return usuario
 
 def borrar_usuario(id_usuario):
-    with SessionLocal() as session:
+    with _sesion() as session:
         usuario = session.query(Usuario).filter_by(id_usuario=id_usuario).first()
         if not usuario:
             return False
@@ -339,8 +986,8 @@ def borrar_usuario(id_usuario):
                 raise ValueError("⚠️ No se puede eliminar el último admin del sistema")
 
         session.delete(usuario)
-        session.commit()
-        _sync_backup()
+        _marcar_vinculos(session)
+        _confirmar(session)
         return True
 
 # ─────────────────────────────────────────────
@@ -348,30 +995,31 @@ def borrar_usuario(id_usuario):
 # ─────────────────────────────────────────────
 
 def crear_atleta(**kwargs):
-    with SessionLocal() as session:
+    with _sesion() as session:
         atleta = Atleta(**kwargs)
         session.add(atleta)
         session.flush()
         session.refresh(atleta)
-        session.commit()
-        _sync_backup()
+        if CAMPOS_VINCULO_ATLETA & kwargs.keys():
+            _marcar_vinculos(session)
+        _confirmar(session)
         return atleta
 
 def obtener_atletas():
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Atleta)\
             .options(joinedload(Atleta.usuario))\
             .all()
 
 def obtener_atletas_por_usuario(id_usuario):
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Atleta)\
             .options(joinedload(Atleta.usuario))\
             .filter_by(id_usuario=id_usuario)\
             .all()
 
 def obtener_atleta_por_id(id_atleta):
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Atleta)\
             .options(joinedload(Atleta.usuario))\
             .filter_by(id_atleta=id_atleta)\
@@ -383,7 +1031,7 @@ def actualizar_atleta(id_atleta, **kwargs):
     Uso:
         actualizar_atleta(3, nombre="Nuevo", nivel="Avanzado")
     """
-    with SessionLocal() as session:
+    with _sesion() as session:
         atleta = session.query(Atleta).filter_by(id_atleta=id_atleta).first()
         if not atleta:
             return None
@@ -392,26 +1040,27 @@ def actualizar_atleta(id_atleta, **kwargs):
         for campo, valor in kwargs.items():
             if hasattr(atleta, campo):
                 setattr(atleta, campo, valor)
+        if CAMPOS_VINCULO_ATLETA & kwargs.keys():
+            _marcar_vinculos(session)
 
-        session.commit()
+        _confirmar(session)
         session.refresh(atleta)
-        _sync_backup()
         return atleta
 
 def borrar_atleta(id_atleta):
-    with SessionLocal() as session:
+    with _sesion() as session:
         atleta = session.query(Atleta).filter_by(id_atleta=id_atleta).first()
         if atleta:
             session.delete(atleta)
-            session.commit()
-            _sync_backup()
+            _marcar_vinculos(session)
+            _confirmar(session)
 
 # ─────────────────────────────────────────────
 # FUNCIONES CRUD: EVENTOS
 # ─────────────────────────────────────────────
 
 def crear_evento(id_atleta, titulo, fecha, descripcion=None, lugar=None, tipo=None):
-    with SessionLocal() as session:
+    with _sesion() as session:
         evento = Evento(
             id_atleta=id_atleta,
             titulo=titulo,
@@ -423,39 +1072,36 @@ def crear_evento(id_atleta, titulo, fecha, descripcion=None, lugar=None, tipo=No
         session.add(evento)
         session.flush()
         session.refresh(evento)
-        session.commit()
-        _sync_backup()
+        _confirmar(session)
         return evento
 
 def obtener_eventos():
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Evento).all()
 
 def obtener_eventos_basicos_por_atleta(id_atleta):
     """Obtiene eventos de la tabla 'eventos' asociados a un atleta"""
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Evento).filter_by(id_atleta=id_atleta).all()
 
 def actualizar_evento(id_evento, **kwargs):
-    with SessionLocal() as session:
+    with _sesion() as session:
         evento = session.query(Evento).filter_by(id_evento=id_evento).first()
         if not evento:
             return None
         for campo, valor in kwargs.items():
             if hasattr(evento, campo):
                 setattr(evento, campo, valor)
-        session.commit()
+        _confirmar(session)
         session.refresh(evento)
-        _sync_backup()
         return evento
 
 def borrar_evento(id_evento):
-    with SessionLocal() as session:
+    with _sesion() as session:
         evento = session.query(Evento).filter_by(id_evento=id_evento).first()
         if evento:
             session.delete(evento)
-            session.commit()
-            _sync_backup()
+            _confirmar(session)
 
 # ─────────────────────────────────────────────
 # MODELOS EXTRA: CALENDARIO, SESIONES, MÉTRICAS, COMENTARIOS
@@ -463,6 +1109,12 @@ def borrar_evento(id_evento):
 
 class CalendarioEvento(Base):
     __tablename__ = "calendario_eventos"
+    __table_args__ = (
+        # Rango de fechas por atleta (obtener_eventos_filtrados) y orden por fecha
+        Index("ix_calendario_atleta_fecha", "id_atleta", "fecha"),
+        # Listados por tipo (competiciones, citas/test, métricas rápidas)
+        Index("ix_calendario_atleta_tipo_fecha", "id_atleta", "tipo_evento", "fecha"),
+    )
 
     id_evento = Column(Integer, primary_key=True, autoincrement=True)
     id_atleta = Column(Integer, ForeignKey("atletas.id_atleta"), nullable=False)
@@ -471,9 +1123,16 @@ class CalendarioEvento(Base):
     valor = Column(Text)  # JSON serializado o string según tipo
     notas = Column(Text)  # notas libres
     creado_en = Column(DateTime(timezone=True), default=lambda: datetime.now(UTC))
+    # Cambia en cada UPDATE: versión del evento para la proyección cacheada del calendario
+    actualizado_en = Column(
+        DateTime(timezone=True), default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC)
+    )
 
 class Sesion(Base):
     __tablename__ = "sesiones"
+    __table_args__ = (
+        Index("ix_sesiones_atleta_fecha", "id_atleta", "fecha"),
+    )
 
     id_sesion = Column(Integer, primary_key=True, autoincrement=True)
     id_atleta = Column(Integer, ForeignKey("atletas.id_atleta"), nullable=False)
@@ -484,12 +1143,21 @@ class Sesion(Base):
 
 class Metrica(Base):
     __tablename__ = "metricas"
+    __table_args__ = (
+        # Una métrica por atleta, tipo y día: destino del ON CONFLICT de los upserts
+        Index("ux_metricas_atleta_tipo_dia", "id_atleta", "tipo_metrica", "dia", unique=True),
+        # Series por tipo ordenadas por fecha
+        Index("ix_metricas_atleta_tipo_fecha", "id_atleta", "tipo_metrica", "fecha"),
+    )
 
     id_metrica = Column(Integer, primary_key=True, autoincrement=True)
     id_atleta = Column(Integer, ForeignKey("atletas.id_atleta"), nullable=False)
     fecha = Column(DateTime(timezone=True), nullable=False)
+    dia = Column(Date, nullable=False, default=lambda ctx: _normalizar_dia(ctx.get_current_parameters()["fecha"]))
     tipo_metrica = Column(String, nullable=False)
     valor = Column(String)
+    # Valor numérico de `valor` (None si no es un número): permite agregados en SQL
+    valor_num = Column(Float, default=lambda ctx: _a_numero(ctx.get_current_parameters().get("valor")))
     unidad = Column(String)
 
     atleta = relationship("Atleta", back_populates="metricas")
@@ -497,6 +1165,9 @@ class Metrica(Base):
 
 class Comentario(Base):
     __tablename__ = "comentarios"
+    __table_args__ = (
+        Index("ix_comentarios_atleta_visible_fecha", "id_atleta", "visible_para", "fecha"),
+    )
 
     id_comentario = Column(Integer, primary_key=True, autoincrement=True)
     id_atleta = Column(Integer, ForeignKey("atletas.id_atleta"), nullable=False)
@@ -511,7 +1182,7 @@ class Comentario(Base):
 # CRUD: CALENDARIO
 # ─────────────────────────────────────────────
 def crear_evento_calendario(id_atleta, fecha, tipo_evento, valor, notas=None):
-    with SessionLocal() as session:
+    with _sesion() as session:
         # Normalizamos fecha a medianoche sin zona horaria (naive)
         if isinstance(fecha, datetime):
             fecha = fecha.date()
@@ -534,9 +1205,8 @@ def crear_evento_calendario(id_atleta, fecha, tipo_evento, valor, notas=None):
             notas=notas,
         )
         session.add(evento)
-        session.commit()
+        _confirmar(session)
         session.refresh(evento)
-        _sync_backup()
         return evento
 
 # ─────────────────────────────────────────────
@@ -577,7 +1247,9 @@ def evento_to_dict(evento):
         # Aquí ya entregamos el dict deserializado para que mostrar_calendario_interactivo
         # pueda acceder a claves como "Síntomas", "Menstruacion", etc.
         "extendedProps": normalizado,
-        "notas": evento.notas or ""
+        "notas": evento.notas or "",
+        # Versión para la proyección memoizada del calendario interactivo
+        "version": str(evento.actualizado_en or evento.creado_en or ""),
     }
 
 # ─────────────────────────────────────────────
@@ -606,14 +1278,14 @@ def crear_cita_test(id_atleta, fecha, detalles, notas=None):
     return crear_evento_calendario(id_atleta, fecha, "cita_test", detalles, notas)
 
 def obtener_competiciones_por_atleta(id_atleta):
-    with SessionLocal() as session:
+    with _sesion() as session:
         eventos = session.query(CalendarioEvento).filter_by(
             id_atleta=id_atleta, tipo_evento="competicion"
         ).order_by(CalendarioEvento.fecha.desc()).all()
         return [evento_to_dict(ev) for ev in eventos]
 
 def obtener_citas_test_por_atleta(id_atleta):
-    with SessionLocal() as session:
+    with _sesion() as session:
         eventos = session.query(CalendarioEvento).filter_by(
             id_atleta=id_atleta, tipo_evento="cita_test"
         ).order_by(CalendarioEvento.fecha.desc()).all()
@@ -624,7 +1296,7 @@ def actualizar_evento_calendario(id_atleta, fecha, valores_actualizados, notas=N
     Actualiza un evento de calendario existente para un atleta en una fecha concreta.
     Si no existe, devuelve None.
     """
-    with SessionLocal() as session:
+    with _sesion() as session:
         # Normalizamos fecha a medianoche sin zona horaria (naive)
         if isinstance(fecha, datetime):
             fecha = fecha.date()
@@ -651,9 +1323,8 @@ def actualizar_evento_calendario(id_atleta, fecha, valores_actualizados, notas=N
         if notas is not None:
             evento.notas = notas
 
-        session.commit()
+        _confirmar(session)
         session.refresh(evento)
-        _sync_backup()
         return evento
 
 def actualizar_evento_calendario_por_id(id_evento: int, valores_actualizados, notas=None):
@@ -661,7 +1332,7 @@ def actualizar_evento_calendario_por_id(id_evento: int, valores_actualizados, no
     Actualiza un evento de calendario existente usando su id_evento único.
     Devuelve el evento actualizado o None si no existe.
     """
-    with SessionLocal() as session:
+    with _sesion() as session:
         evento = session.query(CalendarioEvento).filter_by(id_evento=id_evento).first()
         if not evento:
             return None
@@ -670,13 +1341,13 @@ def actualizar_evento_calendario_por_id(id_evento: int, valores_actualizados, no
         if notas is not None:
             evento.notas = notas
 
-        session.commit()
+        _confirmar(session)
         session.refresh(evento)
-        _sync_backup()
         return evento
 
+@_cacheada("calendario_eventos")
 def obtener_eventos_calendario_por_atleta(id_atleta, rol_actual="admin"):
-    with SessionLocal() as session:
+    with _sesion() as session:
         query = session.query(CalendarioEvento).filter_by(id_atleta=id_atleta)
         if rol_actual == "admin":
             eventos = query.order_by(CalendarioEvento.fecha.desc()).all()
@@ -694,23 +1365,40 @@ def obtener_eventos_calendario_por_atleta(id_atleta, rol_actual="admin"):
         # 🔑 Transformamos cada evento a dict con valor deserializado
         return [evento_to_dict(ev) for ev in eventos]
 
+@_cacheada("calendario_eventos")
+def obtener_eventos_calendario_por_atleta_pagina(id_atleta, rol_actual="admin", limit=PAGINA_POR_DEFECTO,
+                                                 after_fecha=None, after_id=None) -> Pagina:
+    """Como obtener_eventos_calendario_por_atleta, por páginas (cursor en Pagina.siguiente)."""
+    if rol_actual not in ("admin", "entrenadora", "atleta"):
+        return Pagina([], None)
+    with _sesion() as session:
+        query = _query_eventos_visibles(session, id_atleta, rol_actual)
+        return _paginar(query, CalendarioEvento.fecha, CalendarioEvento.id_evento, limit,
+                        after_fecha, after_id, convertir=evento_to_dict)
+
 # ─────────────────────────────────────────────
 # NUEVO: obtener_eventos_filtrados
 # ─────────────────────────────────────────────
+def _query_eventos_visibles(session, id_atleta, rol_actual="admin", tipos=None):
+    """Query de eventos del atleta con los filtros de rol y tipo aplicados."""
+    query = session.query(CalendarioEvento).filter_by(id_atleta=id_atleta)
+
+    # Filtro por rol
+    if rol_actual == "entrenadora":
+        query = query.filter(CalendarioEvento.tipo_evento.notin_(["PrivadoAtleta"]))
+    elif rol_actual == "atleta":
+        query = query.filter(CalendarioEvento.tipo_evento.notin_(["PrivadoStaff"]))
+
+    # Filtro por tipo de evento
+    if tipos:
+        query = query.filter(CalendarioEvento.tipo_evento.in_(tipos))
+    return query
+
+@_cacheada("calendario_eventos")
 def obtener_eventos_filtrados(id_atleta, rol_actual="admin", tipos=None, fecha_inicio=None, fecha_fin=None):
     """Obtiene eventos filtrados dinámicamente por rol, tipo y rango de fechas."""
-    with SessionLocal() as session:
-        query = session.query(CalendarioEvento).filter_by(id_atleta=id_atleta)
-
-        # Filtro por rol
-        if rol_actual == "entrenadora":
-            query = query.filter(CalendarioEvento.tipo_evento.notin_(["PrivadoAtleta"]))
-        elif rol_actual == "atleta":
-            query = query.filter(CalendarioEvento.tipo_evento.notin_(["PrivadoStaff"]))
-
-        # Filtro por tipo de evento
-        if tipos:
-            query = query.filter(CalendarioEvento.tipo_evento.in_(tipos))
+    with _sesion() as session:
+        query = _query_eventos_visibles(session, id_atleta, rol_actual, tipos)
 
         # Filtro por rango de fechas
         if fecha_inicio:
@@ -721,18 +1409,68 @@ def obtener_eventos_filtrados(id_atleta, rol_actual="admin", tipos=None, fecha_i
         eventos = query.order_by(CalendarioEvento.fecha.desc()).all()
         return [evento_to_dict(ev) for ev in eventos]
 
+@_cacheada("calendario_eventos")
+def obtener_eventos_filtrados_pagina(id_atleta, rol_actual="admin", tipos=None, fecha_inicio=None, fecha_fin=None,
+                                     limit=PAGINA_POR_DEFECTO, after_fecha=None, after_id=None) -> Pagina:
+    """Como obtener_eventos_filtrados, por páginas (cursor en Pagina.siguiente)."""
+    with _sesion() as session:
+        query = _query_eventos_visibles(session, id_atleta, rol_actual, tipos)
+        if fecha_inicio:
+            query = query.filter(CalendarioEvento.fecha >= fecha_inicio)
+        if fecha_fin:
+            query = query.filter(CalendarioEvento.fecha <= fecha_fin)
+        return _paginar(query, CalendarioEvento.fecha, CalendarioEvento.id_evento, limit,
+                        after_fecha, after_id, convertir=evento_to_dict)
+
+def _meses_entre(desde: date, hasta: date) -> list[tuple[int, int]]:
+    """(año, mes) de cada mes que toca el rango [desde, hasta]."""
+    meses = []
+    anio, mes = desde.year, desde.month
+    while (anio, mes) <= (hasta.year, hasta.month):
+        meses.append((anio, mes))
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return meses
+
+@_cacheada("calendario_eventos")
+def obtener_eventos_mes(id_atleta, anio: int, mes: int, rol_actual="admin", tipos=None):
+    """Eventos de un mes natural (cubo de caché de obtener_eventos_por_rango)."""
+    inicio = date(anio, mes, 1)
+    siguiente = date(anio + 1, 1, 1) if mes == 12 else date(anio, mes + 1, 1)
+    with _sesion() as session:
+        eventos = (
+            _query_eventos_visibles(session, id_atleta, rol_actual, tipos)
+            .filter(CalendarioEvento.fecha >= inicio, CalendarioEvento.fecha < siguiente)
+            .order_by(CalendarioEvento.fecha.desc())
+            .all()
+        )
+        return [evento_to_dict(ev) for ev in eventos]
+
+def obtener_eventos_por_rango(id_atleta, desde, hasta, rol_actual="admin", tipos=None):
+    """
+    Eventos entre `desde` y `hasta` (inclusive) leídos por meses: cada mes se cachea
+    aparte, así que al navegar el calendario solo se consultan los meses nuevos.
+    Mismo orden que obtener_eventos_filtrados (fecha descendente).
+    """
+    desde, hasta = _normalizar_dia(desde), _normalizar_dia(hasta)
+    eventos = []
+    for anio, mes in reversed(_meses_entre(desde, hasta)):
+        eventos.extend(
+            e for e in obtener_eventos_mes(id_atleta, anio, mes, rol_actual=rol_actual, tipos=tipos)
+            if desde.isoformat() <= e["start"][:10] <= hasta.isoformat()
+        )
+    return eventos
+
 def borrar_evento_calendario(id_evento: int) -> bool:
     """
     Elimina un evento de calendario por su id_evento único.
     Devuelve True si se eliminó, False si no existía.
     """
-    with SessionLocal() as session:
+    with _sesion() as session:
         evento = session.query(CalendarioEvento).filter_by(id_evento=id_evento).first()
         if not evento:
             return False
         session.delete(evento)
-        session.commit()
-        _sync_backup()
+        _confirmar(session)
         return True
 
 def borrar_evento_calendario_por_fecha(id_atleta, fecha) -> bool:
@@ -740,7 +1478,7 @@ def borrar_evento_calendario_por_fecha(id_atleta, fecha) -> bool:
     Elimina un evento de calendario por atleta y fecha (normalizada a medianoche sin zona horaria).
     Devuelve True si se eliminó, False si no existía.
     """
-    with SessionLocal() as session:
+    with _sesion() as session:
         # Normalizamos fecha a medianoche sin zona horaria (naive)
         if isinstance(fecha, datetime):
             fecha = fecha.date()
@@ -763,15 +1501,14 @@ def borrar_evento_calendario_por_fecha(id_atleta, fecha) -> bool:
             return False
 
         session.delete(evento)
-        session.commit()
-        _sync_backup()
+        _confirmar(session)
         return True
 
 # ─────────────────────────────────────────────
 # CRUD: SESIONES
 # ─────────────────────────────────────────────
 def crear_sesion(id_atleta, fecha, tipo_sesion, planificado_json=None, realizado_json=None):
-    with SessionLocal() as session:
+    with _sesion() as session:
         sesion = Sesion(
             id_atleta=id_atleta,
             fecha=fecha,
@@ -780,171 +1517,342 @@ def crear_sesion(id_atleta, fecha, tipo_sesion, planificado_json=None, realizado
             realizado_json=realizado_json
         )
         session.add(sesion)
-        session.commit()
+        _confirmar(session)
         session.refresh(sesion)
-        _sync_backup()
         return sesion
 
+@_cacheada("sesiones")
 def obtener_sesiones_por_atleta(id_atleta):
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Sesion).filter_by(id_atleta=id_atleta).order_by(Sesion.fecha.desc()).all()
 
+@_cacheada("sesiones")
+def obtener_sesiones_por_atleta_pagina(id_atleta, limit=PAGINA_POR_DEFECTO, after_fecha=None, after_id=None) -> Pagina:
+    """Sesiones del atleta de la más reciente a la más antigua, por páginas."""
+    with _sesion() as session:
+        query = session.query(Sesion).filter_by(id_atleta=id_atleta)
+        return _paginar(query, Sesion.fecha, Sesion.id_sesion, limit, after_fecha, after_id)
+
 def actualizar_sesion(id_sesion, **kwargs):
-    with SessionLocal() as session:
+    with _sesion() as session:
         sesion = session.query(Sesion).filter_by(id_sesion=id_sesion).first()
         if not sesion:
             return None
         for campo, valor in kwargs.items():
             if hasattr(sesion, campo):
                 setattr(sesion, campo, valor)
-        session.commit()
+        _confirmar(session)
         session.refresh(sesion)
-        _sync_backup()
         return sesion
 
 def borrar_sesion(id_sesion):
-    with SessionLocal() as session:
+    with _sesion() as session:
         sesion = session.query(Sesion).filter_by(id_sesion=id_sesion).first()
         if sesion:
             session.delete(sesion)
-            session.commit()
-            _sync_backup()
+            _confirmar(session)
 
 # ─────────────────────────────────────────────
 # CRUD: MÉTRICAS
 # ─────────────────────────────────────────────
+def _normalizar_dia(fecha) -> date:
+    """Convierte datetime / date / 'YYYY-MM-DD[...]' en date (hoy en UTC si es None)."""
+    if fecha is None:
+        return datetime.now(timezone.utc).date()
+    if isinstance(fecha, datetime):
+        return fecha.date()
+    if isinstance(fecha, date):
+        return fecha
+    return date.fromisoformat(str(fecha)[:10])
+
+def _a_numero(valor) -> float | None:
+    """Convierte el valor de una métrica a float ('-350', '7,5', 70…); None si no es numérico."""
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        numero = float(valor)
+    else:
+        try:
+            numero = float(str(valor).strip().replace(",", "."))
+        except ValueError:
+            return None
+    return numero if math.isfinite(numero) else None
+
+def _upsert_metricas_stmt(filas: list[dict] | None = None):
+    """
+    INSERT … ON CONFLICT (id_atleta, tipo_metrica, dia) DO UPDATE para varias filas.
+    Sin `filas` devuelve la sentencia parametrizada para ejecutarla con executemany.
+    """
+    stmt = sqlite_insert(Metrica)
+    if filas is not None:
+        stmt = stmt.values(filas)
+    return stmt.on_conflict_do_update(
+        index_elements=[Metrica.id_atleta, Metrica.tipo_metrica, Metrica.dia],
+        set_={
+            "valor": stmt.excluded.valor,
+            "valor_num": stmt.excluded.valor_num,
+            "unidad": stmt.excluded.unidad,
+            "fecha": stmt.excluded.fecha,
+        },
+    )
+
+def _fila_metrica(id_atleta, tipo_metrica, valor, unidad, dia: date) -> dict:
+    return {
+        "id_atleta": id_atleta,
+        "tipo_metrica": tipo_metrica,
+        "valor": str(valor),
+        "valor_num": _a_numero(valor),
+        "unidad": unidad,
+        # Guardamos con la fecha del evento, no con "ahora"
+        "fecha": datetime.combine(dia, datetime.min.time(), timezone.utc),
+        "dia": dia,
+    }
+
 def crear_metrica(id_atleta, tipo_metrica, valor, unidad, fecha=None):
     """
     Inserta o actualiza una métrica rápida, garantizando que solo exista
-    un registro por día y tipo para cada atleta.
+    un registro por día y tipo para cada atleta (upsert atómico sobre el índice único).
     """
-    fecha = fecha or datetime.now(timezone.utc).date()
-    # 🔒 Normalizamos fecha para que siempre sea un objeto date
-    if isinstance(fecha, datetime):
-        fecha = fecha.date()
-    elif isinstance(fecha, str):
-        # Ajusta el formato según cómo venga desde el calendario (ej. "2025-11-07")
-        fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
-    inicio = datetime.combine(fecha, datetime.min.time(), timezone.utc)
-    fin = datetime.combine(fecha, datetime.max.time(), timezone.utc)
-
-    with SessionLocal() as session:
-        existente = session.query(Metrica).filter(
-            Metrica.id_atleta == id_atleta,
-            Metrica.tipo_metrica == tipo_metrica,
-            Metrica.fecha >= inicio,
-            Metrica.fecha <= fin
-        ).first()
+    dia = _normalizar_dia(fecha)
+    stmt = _upsert_metricas_stmt([_fila_metrica(id_atleta, tipo_metrica, valor, unidad, dia)])
+    with _sesion() as session:
+        metrica = session.scalars(
+            stmt.returning(Metrica), execution_options={"populate_existing": True}
+        ).one()
+        _confirmar(session)
+        return metrica
 
-        if existente:
-            # 🔑 Actualizamos en vez de duplicar
-            existente.valor = str(valor)
-            existente.unidad = unidad
-            # Guardamos con la fecha del evento, no con "ahora"
-            if isinstance(fecha, datetime):
-                fecha = fecha.date()
-            elif isinstance(fecha, str):
-                fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
-            existente.fecha = datetime.combine(fecha, datetime.min.time(), timezone.utc)
-            session.commit()
-            session.refresh(existente)
-            _sync_backup()
-            return existente
-        else:
-            # Insertar nueva métrica
-            if isinstance(fecha, datetime):
-                fecha = fecha.date()
-            elif isinstance(fecha, str):
-                fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
-            metrica = Metrica(
-                id_atleta=id_atleta,
-                fecha=datetime.combine(fecha, datetime.min.time(), timezone.utc),
-                tipo_metrica=tipo_metrica,
-                valor=str(valor),
-                unidad=unidad
-            )
-            session.add(metrica)
-            session.commit()
-            session.refresh(metrica)
-            _sync_backup()
-            return metrica
+def upsert_metricas(id_atleta, fecha, metricas: dict) -> int:
+    """
+    Guarda de una vez todas las métricas de un día: {tipo: (valor, unidad)}.
+    Una sola sentencia INSERT … ON CONFLICT DO UPDATE, una transacción y un backup.
+    Devuelve el nº de métricas escritas.
+    """
+    if not metricas:
+        return 0
+    dia = _normalizar_dia(fecha)
+    filas = [
+        _fila_metrica(id_atleta, tipo, valor, unidad, dia)
+        for tipo, (valor, unidad) in metricas.items()
+    ]
+    with _sesion() as session:
+        session.execute(_upsert_metricas_stmt(filas))
+        _confirmar(session)
+    return len(filas)
+
+# Filas por transacción en la importación masiva
+IMPORTACION_CHUNK = int(os.getenv("IMPORTACION_CHUNK", "5000"))
+COLUMNAS_IMPORTACION = ["id_atleta", "fecha", "tipo_metrica", "valor", "unidad"]
+
+def _validar_importacion(datos: pd.DataFrame, id_atleta=None) -> tuple[pd.DataFrame, dict]:
+    """
+    Valida y normaliza en bloque (sin bucles por fila) las métricas a importar.
+    Devuelve (filas válidas listas para insertar, {motivo: nº de filas rechazadas}).
+    """
+    datos = datos.rename(columns={"tipo": "tipo_metrica"})
+    if id_atleta is not None:
+        datos["id_atleta"] = id_atleta
+    faltan = [c for c in COLUMNAS_IMPORTACION if c not in datos.columns and c != "unidad"]
+    if faltan:
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(faltan)}")
+    if "unidad" not in datos.columns:
+        datos["unidad"] = None
+
+    ids = pd.to_numeric(datos["id_atleta"], errors="coerce")
+    fechas = pd.to_datetime(datos["fecha"], errors="coerce", utc=True)
+    tipos = datos["tipo_metrica"].astype("string").str.strip().str.lower()
+    texto = datos["valor"].astype("string").str.strip()
+    numeros = pd.to_numeric(texto.str.replace(",", ".", regex=False), errors="coerce")
+    numeros = numeros.where(numeros.abs() != float("inf"))
+
+    with _sesion() as session:
+        existentes = set(session.scalars(select(Atleta.id_atleta)))
+
+    motivos = {
+        "id_atleta inválido": ids.isna() | (ids % 1 != 0),
+        "atleta inexistente": ids.notna() & ~ids.isin(existentes),
+        "fecha inválida": fechas.isna(),
+        "tipo vacío": tipos.isna() | (tipos == ""),
+        "valor vacío": texto.isna() | (texto == ""),
+    }
+    rechazo = pd.Series(False, index=datos.index)
+    rechazadas = {}
+    for motivo, mascara in motivos.items():
+        nuevas = mascara.fillna(True) & ~rechazo
+        if nuevas.any():
+            rechazadas[motivo] = int(nuevas.sum())
+        rechazo |= nuevas
+
+    validas = pd.DataFrame({
+        "id_atleta": ids[~rechazo].astype(int),
+        "tipo_metrica": tipos[~rechazo],
+        "valor": texto[~rechazo],
+        "valor_num": numeros[~rechazo],
+        "unidad": datos["unidad"][~rechazo],
+        # Misma convención que crear_metrica: medianoche UTC del día del dato
+        "fecha": fechas[~rechazo].dt.normalize(),
+    })
+    validas["dia"] = validas["fecha"].dt.date
+    # Si el origen repite (atleta, tipo, día) gana la última fila, como en el upsert
+    validas = validas.drop_duplicates(["id_atleta", "tipo_metrica", "dia"], keep="last")
+    validas = validas.astype(object).where(validas.notna(), None)
+    return validas, rechazadas
+
+def importar_metricas(filas, id_atleta=None, chunk: int = IMPORTACION_CHUNK) -> dict:
+    """
+    Importación masiva de histórico de métricas (HRV, peso, RPE…).
+    `filas`: ruta a un CSV, DataFrame o iterable de dicts con columnas
+    id_atleta, fecha, tipo_metrica (o tipo), valor y unidad (opcional);
+    `id_atleta` rellena/sustituye esa columna para importar un solo atleta.
+
+    Las filas se validan con pandas y se escriben con el mismo upsert que
+    crear_metrica (executemany), en transacciones de `chunk` filas y con un
+    único backup al final. Devuelve {leidas, importadas, rechazadas, motivos,
+    segundos, filas_por_segundo}.
+    """
+    inicio = time.perf_counter()
+    if isinstance(filas, pd.DataFrame):
+        datos = filas.copy()
+    elif isinstance(filas, (str, os.PathLike)):
+        datos = pd.read_csv(filas, dtype=str, keep_default_na=False, na_values=[""])
+    else:
+        datos = pd.DataFrame(list(filas))
+
+    validas, motivos = _validar_importacion(datos, id_atleta)
+    registros = validas[["id_atleta", "fecha", "dia", "tipo_metrica", "valor", "valor_num", "unidad"]] \
+        .to_dict("records")
+    stmt = _upsert_metricas_stmt()
+    for i in range(0, len(registros), chunk):
+        with engine.begin() as conn:
+            conn.execute(stmt, registros[i:i + chunk])
+    if registros:
+        _subir_generaciones({"metricas"})
+        _sync_backup()
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "leidas": len(datos),
+        "importadas": len(registros),
+        "rechazadas": sum(motivos.values()),
+        "motivos": motivos,
+        "segundos": segundos,
+        "filas_por_segundo": len(registros) / segundos if segundos else 0.0,
+    }
 
 def borrar_metricas_por_fecha(id_atleta, fecha):
     """
     Elimina todas las métricas rápidas de un atleta en una fecha concreta.
     Se usa al borrar un evento de calendario para que las gráficas se actualicen.
     """
-    # 🔒 Normalizamos fecha a objeto date
-    if isinstance(fecha, datetime):
-        fecha = fecha.date()
-    elif isinstance(fecha, str):
-        fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
-
-    inicio = datetime.combine(fecha, datetime.min.time(), timezone.utc)
-    fin = datetime.combine(fecha, datetime.max.time(), timezone.utc)
-
+    dia = _normalizar_dia(fecha)
     tipos = ["hrv", "wellness", "rpe", "peso", "fc_reposo", "deficit_calorico", "sueno"]
 
-    with SessionLocal() as session:
+    with _sesion() as session:
         metricas = session.query(Metrica).filter(
             Metrica.id_atleta == id_atleta,
             Metrica.tipo_metrica.in_(tipos),
-            Metrica.fecha >= inicio,
-            Metrica.fecha <= fin
+            Metrica.dia == dia
         ).all()
         for m in metricas:
             session.delete(m)
 
-        session.commit()
-        _sync_backup()
+        _confirmar(session)
         return len(metricas)
 
 def obtener_metricas_por_tipo(id_atleta, tipo_metrica):
-    with SessionLocal() as session:
+    with _sesion() as session:
         return session.query(Metrica).filter_by(id_atleta=id_atleta, tipo_metrica=tipo_metrica).order_by(Metrica.fecha).all()
 
+def obtener_metricas_por_tipo_pagina(id_atleta, tipo_metrica, limit=PAGINA_POR_DEFECTO,
+                                     after_fecha=None, after_id=None) -> Pagina:
+    """Serie de una métrica en orden cronológico (como obtener_metricas_por_tipo), por páginas."""
+    with _sesion() as session:
+        query = session.query(Metrica).filter_by(id_atleta=id_atleta, tipo_metrica=tipo_metrica)
+        return _paginar(query, Metrica.fecha, Metrica.id_metrica, limit, after_fecha, after_id, descendente=False)
+
 def actualizar_metrica(id_metrica, **kwargs):
-    with SessionLocal() as session:
+    with _sesion() as session:
         metrica = session.query(Metrica).filter_by(id_metrica=id_metrica).first()
         if not metrica:
             return None
         for campo, valor in kwargs.items():
             if hasattr(metrica, campo):
                 setattr(metrica, campo, valor)
-        session.commit()
+        if "fecha" in kwargs:
+            metrica.dia = _normalizar_dia(metrica.fecha)
+        if "valor" in kwargs:
+            metrica.valor_num = _a_numero(metrica.valor)
+        _confirmar(session)
         session.refresh(metrica)
-        _sync_backup()
         return metrica
 
 def borrar_metrica(id_metrica):
-    with SessionLocal() as session:
+    with _sesion() as session:
         metrica = session.query(Metrica).filter_by(id_metrica=id_metrica).first()
         if metrica:
             session.delete(metrica)
-            session.commit()
-            _sync_backup()
+            _confirmar(session)
 
 # ─────────────────────────────────────────────
 # HELPERS: MÉTRICAS RÁPIDAS
 # ─────────────────────────────────────────────
-def obtener_metricas_rapidas(id_atleta):
+TIPOS_METRICAS_RAPIDAS = ("hrv", "wellness", "rpe", "peso", "fc_reposo")
+MetricaRapida = namedtuple("MetricaRapida", ["fecha", "tipo_metrica", "valor_num", "unidad", "valor"])
+
+@_cacheada("metricas")
+def obtener_metricas_rapidas(id_atleta, desde=None, hasta=None) -> list[MetricaRapida]:
     """
     Devuelve las métricas rápidas únicas por día (HRV, Wellness, RPE, Peso, FC reposo).
-    Si hubo varias inserciones en el mismo día, se conserva solo la última.
+    Si hubo varias inserciones en el mismo día, se conserva solo la última; el descarte
+    lo hace SQLite (ROW_NUMBER) y solo viajan las filas que se devuelven, en orden cronológico.
+    `desde`/`hasta` filtran por día.
     """
-    tipos = ["hrv", "wellness", "rpe", "peso", "fc_reposo"]
-    with SessionLocal() as session:
-        metricas = session.query(Metrica)\
-            .filter(Metrica.id_atleta == id_atleta, Metrica.tipo_metrica.in_(tipos))\
-            .order_by(Metrica.fecha).all()
-
-        # Agrupar por fecha y tipo, quedándose con la última
-        unicas = {}
-        for m in metricas:
-            clave = (m.tipo_metrica, m.fecha.date())
-            unicas[clave] = m
+    orden = func.row_number().over(
+        partition_by=(Metrica.tipo_metrica, func.date(Metrica.fecha)),
+        order_by=(Metrica.fecha.desc(), Metrica.id_metrica.desc()),
+    ).label("orden")
+    candidatas = select(*(getattr(Metrica, c) for c in MetricaRapida._fields), orden).where(
+        Metrica.id_atleta == id_atleta, Metrica.tipo_metrica.in_(TIPOS_METRICAS_RAPIDAS)
+    )
+    if desde:
+        candidatas = candidatas.where(Metrica.dia >= _normalizar_dia(desde))
+    if hasta:
+        candidatas = candidatas.where(Metrica.dia <= _normalizar_dia(hasta))
+    candidatas = candidatas.subquery()
+    consulta = (
+        select(*(candidatas.c[c] for c in MetricaRapida._fields))
+        .where(candidatas.c.orden == 1)
+        .order_by(candidatas.c.fecha)
+    )
+    with _sesion() as session:
+        return [MetricaRapida(*fila) for fila in session.execute(consulta)]
 
-        return list(unicas.values())
+@_cacheada("metricas")
+def resumen_metricas(id_atleta, tipos=None, desde=None, hasta=None) -> dict:
+    """
+    Agregados por tipo calculados en SQLite sobre `valor_num`:
+    {tipo: {"n", "media", "minimo", "maximo", "ultimo_dia"}}. `desde`/`hasta` filtran por día.
+    """
+    consulta = select(
+        Metrica.tipo_metrica,
+        func.count(Metrica.valor_num),
+        func.avg(Metrica.valor_num),
+        func.min(Metrica.valor_num),
+        func.max(Metrica.valor_num),
+        func.max(Metrica.dia),
+    ).where(Metrica.id_atleta == id_atleta, Metrica.valor_num.is_not(None))
+    if tipos:
+        consulta = consulta.where(Metrica.tipo_metrica.in_(tipos))
+    if desde:
+        consulta = consulta.where(Metrica.dia >= _normalizar_dia(desde))
+    if hasta:
+        consulta = consulta.where(Metrica.dia <= _normalizar_dia(hasta))
+    with _sesion() as session:
+        filas = session.execute(consulta.group_by(Metrica.tipo_metrica)).all()
+    return {
+        tipo: {"n": n, "media": media, "minimo": minimo, "maximo": maximo, "ultimo_dia": ultimo}
+        for tipo, n, media, minimo, maximo, ultimo in filas
+    }
 
 # ─────────────────────────────────────────────
 # HELPERS: VÍNCULO USUARIO ↔ ATLETA
@@ -954,14 +1862,83 @@ def obtener_id_atleta_por_usuario(usuario_id: int) -> int | None:
     Devuelve el id_atleta vinculado a un usuario dado.
     Usa la columna atleta_usuario_id en la tabla Atleta.
     """
-    with SessionLocal() as session:
+    with _sesion() as session:
         atleta = session.query(Atleta).filter(Atleta.atleta_usuario_id == usuario_id).first()
         return atleta.id_atleta if atleta else None
 
 
+# Versión de los vínculos usuario ↔ atleta ↔ entrenadora (y nombre/rol de usuario).
+# La UI cachea la identidad de la sesión con esta versión y la recalcula al cambiar;
+# incluye la señal de fichero para enterarse también de escrituras de otros procesos.
+CAMPOS_VINCULO_USUARIO = {"rol", "nombre", "perfil_atleta_id"}
+CAMPOS_VINCULO_ATLETA = {"id_usuario", "propietario_id", "atleta_usuario_id"}
+_vinculos_lock = threading.Lock()
+_version_vinculos = 0
+
+def version_vinculos() -> tuple[int, int]:
+    return _version_vinculos, _senal_fichero.actual()
+
+def _marcar_vinculos(session):
+    """Anota en la sesión que cambian vínculos; la versión sube solo si hay commit."""
+    session.info["vinculos_cambiados"] = True
+
+def _subir_version_vinculos():
+    global _version_vinculos
+    with _vinculos_lock:
+        _version_vinculos += 1
+
+@event.listens_for(SessionLocal, "after_commit")
+def _tras_commit_vinculos(session):
+    if session.info.pop("vinculos_cambiados", False):
+        _subir_version_vinculos()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _tras_rollback_vinculos(session):
+    session.info.pop("vinculos_cambiados", None)
+
+@dataclass(frozen=True)
+class Identidad:
+    """Usuario en sesión con su atleta vinculado y la entrenadora de ese atleta."""
+    id_usuario: int
+    nombre: str
+    rol: str
+    id_atleta: int | None
+    entrenadora_id: int | None
+    entrenadora_nombre: str | None
+
+def obtener_identidad(usuario_id: int) -> Identidad | None:
+    """Resuelve en una consulta usuario + atleta vinculado (atleta_usuario_id) + entrenadora."""
+    entrenadora = aliased(Usuario)
+    consulta = select(
+        Usuario.id_usuario, Usuario.nombre, Usuario.rol,
+        Atleta.id_atleta, Atleta.id_usuario, entrenadora.nombre,
+    ).outerjoin(Atleta, Atleta.atleta_usuario_id == Usuario.id_usuario)\
+     .outerjoin(entrenadora, entrenadora.id_usuario == Atleta.id_usuario)\
+     .where(Usuario.id_usuario == usuario_id)\
+     .order_by(Atleta.id_atleta)\
+     .limit(1)
+    with _sesion() as session:
+        fila = session.execute(consulta).first()
+    return Identidad(*fila) if fila else None
+
+def obtener_atletas_permitidos(usuario_id: int, rol: str) -> frozenset[int]:
+    """
+    Ids de los atletas sobre los que puede actuar un usuario no admin, en una consulta:
+    entrenadora → asignados (id_usuario) o creados por ella (propietario_id);
+    atleta → su perfil vinculado (atleta_usuario_id).
+    """
+    if rol == "entrenadora":
+        condicion = or_(Atleta.id_usuario == usuario_id, Atleta.propietario_id == usuario_id)
+    elif rol == "atleta":
+        condicion = Atleta.atleta_usuario_id == usuario_id
+    else:
+        return frozenset()
+    with _sesion() as session:
+        return frozenset(session.scalars(select(Atleta.id_atleta).where(condicion)))
+
 def obtener_usuario_por_atleta(id_atleta: int) -> int | None:
     """Devuelve el objeto Usuario vinculado a un atleta dado."""
-    with SessionLocal() as session:
+    with _sesion() as session:
         atleta = session.query(Atleta).filter(Atleta.id_atleta == id_atleta).first()
         return session.query(Usuario).filter(Usuario.id_usuario == atleta.atleta_usuario_id).first() if atleta else None
 
@@ -969,7 +1946,7 @@ def obtener_usuario_por_atleta(id_atleta: int) -> int | None:
 # CRUD: COMENTARIOS
 # ─────────────────────────────────────────────
 def crear_comentario(id_atleta, texto, visible_para="staff", id_autor=None):
-    with SessionLocal() as session:
+    with _sesion() as session:
         comentario = Comentario(
             id_atleta=id_atleta,
             id_autor=id_autor,
@@ -977,13 +1954,13 @@ def crear_comentario(id_atleta, texto, visible_para="staff", id_autor=None):
             visible_para=visible_para,
         )
         session.add(comentario)
-        session.commit()
+        _confirmar(session)
         session.refresh(comentario)
-        _sync_backup()
         return comentario
 
+@_cacheada("comentarios")
 def obtener_comentarios_por_atleta(id_atleta, rol_actual="admin"):
-    with SessionLocal() as session:
+    with _sesion() as session:
         query = session.query(Comentario).filter_by(id_atleta=id_atleta)
         if rol_actual == "admin":
             return query.order_by(Comentario.fecha.desc()).all()
@@ -994,40 +1971,37 @@ def obtener_comentarios_por_atleta(id_atleta, rol_actual="admin"):
         else:
             return []
 
+@_cacheada("comentarios")
+def obtener_comentarios_por_atleta_pagina(id_atleta, rol_actual="admin", limit=PAGINA_POR_DEFECTO,
+                                          after_fecha=None, after_id=None) -> Pagina:
+    """Como obtener_comentarios_por_atleta, por páginas (cursor en Pagina.siguiente)."""
+    visibles = {"entrenadora": ["entrenadora", "staff", "todos"], "atleta": ["atleta", "todos"]}
+    if rol_actual != "admin" and rol_actual not in visibles:
+        return Pagina([], None)
+    with _sesion() as session:
+        query = session.query(Comentario).filter_by(id_atleta=id_atleta)
+        if rol_actual in visibles:
+            query = query.filter(Comentario.visible_para.in_(visibles[rol_actual]))
+        return _paginar(query, Comentario.fecha, Comentario.id_comentario, limit, after_fecha, after_id)
+
 def actualizar_comentario(id_comentario, **kwargs):
-    with SessionLocal() as session:
+    with _sesion() as session:
         comentario = session.query(Comentario).filter_by(id_comentario=id_comentario).first()
         if not comentario:
             return None
         for campo, valor in kwargs.items():
             if hasattr(comentario, campo):
                 setattr(comentario, campo, valor)
-        session.commit()
+        _confirmar(session)
         session.refresh(comentario)
-        _sync_backup()
         return comentario
 
 def borrar_comentario(id_comentario):
-    with SessionLocal() as session:
+    with _sesion() as session:
         comentario = session.query(Comentario).filter_by(id_comentario=id_comentario).first()
         if comentario:
             session.delete(comentario)
-            session.commit()
-            _sync_backup()
-
-# ─────────────────────────────────────────────
-# Inicialización del esquema si no había backups
-# ─────────────────────────────────────────────
-try:
-    if 'NEED_INIT_SCHEMA' in globals() and NEED_INIT_SCHEMA:
-        print("🛠️ Creando esquema inicial en base vacía...")
-        Base.metadata.create_all(bind=engine)
-        _sync_backup()  # subimos primer backup vacío
-        print("✅ Esquema creado y primer backup generado")
-        # Ejecutamos backup diario al arrancar
-        backup_diario()
-except Exception as e:
-    print(f"⚠️ Error al crear esquema inicial: {e}")
+            _confirmar(session)
 
 # Prueba
 def reset_metricas_rapidas(id_atleta: int):
@@ -1036,7 +2010,7 @@ def reset_metricas_rapidas(id_atleta: int):
     Uso puntual de reset.
     """
     tipos = ["hrv", "wellness", "rpe", "peso", "fc_reposo"]
-    with SessionLocal() as session:
+    with _sesion() as session:
         # 1. Borrar métricas rápidas del histórico
         session.query(Metrica).filter(
             Metrica.id_atleta == id_atleta,
@@ -1049,6 +2023,5 @@ def reset_metricas_rapidas(id_atleta: int):
             CalendarioEvento.tipo_evento == "metricas_rapidas"
         ).delete(synchronize_session=False)
 
-        session.commit()
-        _sync_backup()
+        _confirmar(session)
 # -----
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+Identidad del usuario en sesión (nombre, rol, atleta vinculado y entrenadora).
+Se resuelve una vez por sesión y se guarda en st.session_state; solo se vuelve
+a consultar cuando cambia el usuario o `sql.version_vinculos()`.
+"""
+import streamlit as st
+import src.persistencia.sql as sql
+
+CLAVE_SESION = "IDENTIDAD"
+CLAVE_ALCANCE = "ALCANCE_ATLETAS"
+
+
+def actual() -> sql.Identidad | None:
+    """Identidad del usuario logueado (None si no hay sesión o el usuario ya no existe)."""
+    usuario_id = st.session_state.get("USUARIO_ID")
+    if usuario_id is None:
+        return None
+    # La versión se lee antes de consultar: un cambio posterior invalida lo cacheado
+    version = sql.version_vinculos()
+    cache = st.session_state.get(CLAVE_SESION)
+    if cache and cache[0] == usuario_id and cache[1] == version:
+        return cache[2]
+    identidad = sql.obtener_identidad(usuario_id)
+    st.session_state[CLAVE_SESION] = (usuario_id, version, identidad)
+    return identidad
+
+
+def id_atleta_de(usuario_id) -> int | None:
+    """Como sql.obtener_id_atleta_por_usuario, sin consulta si es el usuario en sesión."""
+    identidad = actual()
+    if identidad is not None and identidad.id_usuario == usuario_id:
+        return identidad.id_atleta
+    return sql.obtener_id_atleta_por_usuario(usuario_id)
+
+
+def nombre_de(usuario_id) -> str:
+    """Nombre para mostrar del usuario ("—" si no existe)."""
+    identidad = actual()
+    if identidad is not None and identidad.id_usuario == usuario_id:
+        return identidad.nombre
+    usuario = sql.obtener_usuario_por_id(usuario_id) if usuario_id is not None else None
+    return usuario.nombre if usuario else "—"
+
+
+def atletas_permitidos(usuario_id, rol: str) -> frozenset[int]:
+    """
+    Conjunto de atletas sobre los que actúa (usuario, rol), cargado una vez por
+    versión de vínculos: los permisos quedan en una comprobación `in` sin SQL.
+    """
+    version = sql.version_vinculos()
+    cache = st.session_state.get(CLAVE_ALCANCE)
+    if not cache or cache[0] != version:
+        cache = (version, {})
+        st.session_state[CLAVE_ALCANCE] = cache
+    clave = (usuario_id, rol)
+    if clave not in cache[1]:
+        cache[1][clave] = sql.obtener_atletas_permitidos(usuario_id, rol)
+    return cache[1][clave]
+
+
+def olvidar():
+    """Descarta la identidad y los permisos cacheados (logout)."""
+    st.session_state.pop(CLAVE_SESION, None)
+    st.session_state.pop(CLAVE_ALCANCE, None)
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from typing import Dict, List
-import src.persistencia.sql as sql
+from src.utils import identidad
 
 # Pestañas disponibles (normaliza nombres)
 TABS = [
@@ -49,7 +49,7 @@ class Contexto:
     """Contexto mínimo para evaluar permisos de acción.
     - rol_actual: rol del usuario (admin, entrenadora, atleta)
     - usuario_id: id del usuario actual
-    - atleta_id: id del atleta en contexto (seleccionado)
+    - atleta_id: id del atleta en contexto (seleccionado); es sobre el que se evalúan los permisos
     - propietario_id: id del propietario del recurso (opcional, p.ej. dueño del evento)
     """
     rol_actual: str
@@ -85,56 +85,40 @@ def puede_ver_auditoria(ctx: Contexto) -> bool:
     return ctx.rol_actual in ("admin",)
 
 
-def puede_crear_evento_calendario(ctx: Contexto) -> bool:
-    """Crear evento en calendario:
+def _actua_sobre_atleta(ctx: Contexto) -> bool:
+    """Motor común de permisos sobre un atleta (ctx.atleta_id):
     - admin: siempre
-    - entrenadora: sobre atletas que gestiona (asumimos validación previa)
-    - atleta: solo sobre sí mismo (ctx.atleta_id == ctx.usuario_id o propietario_id)
+    - entrenadora / atleta: el atleta debe estar en su conjunto precalculado
+      (identidad.atletas_permitidos), así que cada comprobación es un `in` sin SQL
     """
     if ctx.rol_actual == "admin":
         return True
-    if ctx.rol_actual == "entrenadora":
-        # Aquí podrías validar la asignación entrenadora-atleta en SQL.
-        return True
-    if ctx.rol_actual == "atleta":
-        atleta_vinculado = sql.obtener_id_atleta_por_usuario(ctx.usuario_id)
-        return atleta_vinculado == (ctx.propietario_id or ctx.atleta_id)
-    return False
+    if ctx.rol_actual not in ("entrenadora", "atleta") or ctx.atleta_id is None:
+        return False
+    return ctx.atleta_id in identidad.atletas_permitidos(ctx.usuario_id, ctx.rol_actual)
+
+
+def puede_crear_evento_calendario(ctx: Contexto) -> bool:
+    """Crear evento en calendario:
+    - admin: siempre
+    - entrenadora: sobre atletas asignados o creados por ella
+    - atleta: solo sobre su propio perfil vinculado
+    """
+    return _actua_sobre_atleta(ctx)
 
 def puede_editar_evento_calendario(ctx: Contexto) -> bool:
-    """Editar evento en calendario: misma política que crear, con control de propietario."""
-    if ctx.rol_actual == "admin":
-        return True
-    if ctx.rol_actual == "entrenadora":
-        return True
-    if ctx.rol_actual == "atleta":
-        atleta_vinculado = sql.obtener_id_atleta_por_usuario(ctx.usuario_id)
-        return atleta_vinculado == (ctx.propietario_id or ctx.atleta_id)
-    return False
+    """Editar evento en calendario: misma política que crear."""
+    return _actua_sobre_atleta(ctx)
 
 def puede_borrar_evento_calendario(ctx: Contexto) -> bool:
-    """Borrar evento en calendario: más restrictivo para atleta (solo lo propio)."""
-    if ctx.rol_actual == "admin":
-        return True
-    if ctx.rol_actual == "entrenadora":
-        return True
-    if ctx.rol_actual == "atleta":
-        atleta_vinculado = sql.obtener_id_atleta_por_usuario(ctx.usuario_id)
-        return atleta_vinculado == (ctx.propietario_id or ctx.atleta_id)
-    return False
+    """Borrar evento en calendario: misma política que crear (atleta, solo lo propio)."""
+    return _actua_sobre_atleta(ctx)
 
 
 def puede_editar_perfil_atleta(ctx: Contexto) -> bool:
     """Editar perfil:
     - admin: cualquiera
-    - entrenadora: atletas que gestiona (validar en SQL)
-    - atleta: solo su propio perfil (ctx.atleta_id == ctx.usuario_id)
+    - entrenadora: atletas asignados o creados por ella
+    - atleta: solo su propio perfil
     """
-    if ctx.rol_actual == "admin":
-        return True
-    if ctx.rol_actual == "entrenadora":
-        return True
-    if ctx.rol_actual == "atleta":
-        atleta_vinculado = sql.obtener_id_atleta_por_usuario(ctx.usuario_id)
-        return atleta_vinculado == (ctx.propietario_id or ctx.atleta_id)
-    return False
+    return _actua_sobre_atleta(ctx)
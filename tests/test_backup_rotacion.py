@@ -0,0 +1,105 @@
+"""Política de rotación de backups (`backup_storage._backups_a_rotar`)."""
+from datetime import datetime, timedelta, timezone
+
+from src.persistencia.backup_storage import _backups_a_rotar
+
+AHORA = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _backup(id_, horas, tipo=None, base_id=None):
+    """Backup creado hace `horas` horas; sin `tipo` es una subida completa (o antigua)."""
+    props = {}
+    if tipo:
+        props["tipo"] = tipo
+    if base_id:
+        props["base_id"] = base_id
+    fecha = (AHORA - timedelta(hours=horas)).isoformat().replace("+00:00", "Z")
+    return {"id": id_, "createdTime": fecha, "appProperties": props}
+
+
+def _rotar(backups, max_backups, diarios=0, semanales=0):
+    borrados = _backups_a_rotar(backups, max_backups, diarios, semanales, ahora=AHORA)
+    return {b["id"] for b in borrados}
+
+
+def test_completo_mas_reciente_no_protege_cadena_anterior():
+    backups = [
+        _backup("full2", 1),
+        _backup("full1", 2),
+        _backup("d1", 3, "delta", "base1"),
+        _backup("base1", 4, "base"),
+    ]
+    # Con 2 puntos se quedan los dos completos; la cadena vieja no ocupa hueco
+    assert _rotar(backups, 2) == {"d1", "base1"}
+
+
+def test_delta_mas_reciente_protege_su_cadena_como_un_punto():
+    backups = [
+        _backup("d2", 1, "delta", "base1"),
+        _backup("d1", 2, "delta", "base1"),
+        _backup("base1", 3, "base"),
+        _backup("full1", 4),
+        _backup("full0", 5),
+    ]
+    assert _rotar(backups, 2) == {"full0"}
+
+
+def test_base_mas_reciente_se_conserva_y_borra_parches_antiguos():
+    backups = [
+        _backup("base2", 1, "base"),
+        _backup("d1", 2, "delta", "base1"),
+        _backup("base1", 3, "base"),
+        _backup("full1", 4),
+    ]
+    assert _rotar(backups, 2) == {"d1", "full1"}
+
+
+def test_solo_completos_conserva_los_mas_recientes():
+    backups = [_backup(f"full{i}", i) for i in range(5)]
+    assert _rotar(backups, 3) == {"full3", "full4"}
+
+
+def test_diarios_conserva_el_mas_reciente_de_cada_dia():
+    # AHORA es 2025-06-01 12:00 UTC
+    backups = [
+        _backup("jun01", 1),         # 01/06 11:00
+        _backup("may31_tarde", 13),  # 31/05 23:00
+        _backup("may31_manana", 20), # 31/05 16:00
+        _backup("may30", 37),        # 30/05 23:00
+        _backup("may29", 61),        # 29/05 23:00: (ahora.date() - dia).days == 3
+    ]
+    assert _rotar(backups, 1, diarios=3) == {"may31_manana", "may29"}
+
+
+def test_diarios_limite_del_dia():
+    backups = [_backup("jun01", 1), _backup("may29", 61)]
+    # days == diarios queda fuera; con un día más de margen entra
+    assert _rotar(backups, 1, diarios=3) == {"may29"}
+    assert _rotar(backups, 1, diarios=4) == set()
+
+
+def test_semanales_conserva_el_mas_reciente_de_cada_semana_iso():
+    backups = [
+        _backup("s22_dom", 1),           # 01/06 (domingo, semana 22)
+        _backup("s22_jue", 24 * 3),      # 29/05 (semana 22)
+        _backup("s21_dom", 24 * 7),      # 25/05 (semana 21)
+        _backup("s21_vie", 24 * 9),      # 23/05 (semana 21)
+        _backup("s20_dom", 24 * 13 + 13), # 18/05 23:00 (semana 20, a menos de 2 semanas)
+        _backup("s20_sab", 24 * 15),     # 17/05: fuera de las 2 semanas
+    ]
+    assert _rotar(backups, 1, semanales=2) == {"s22_jue", "s21_vie", "s20_sab"}
+
+
+def test_base_de_cadena_antigua_como_punto_diario():
+    backups = [
+        _backup("full1", 1),                  # 01/06
+        _backup("d1", 13, "delta", "base1"),  # 31/05
+        _backup("base1", 20, "base"),         # 31/05: el punto más reciente de ese día
+        _backup("full0", 37),                 # 30/05: days == diarios, fuera
+    ]
+    # La base antigua se conserva por la política diaria, pero su parche no
+    assert _rotar(backups, 1, diarios=2) == {"d1", "full0"}
+
+
+def test_lista_vacia():
+    assert _backups_a_rotar([], 3, ahora=AHORA) == []